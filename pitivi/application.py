@@ -36,10 +36,14 @@ from pitivi.settings import GlobalSettings
 from pitivi.settings import xdg_cache_home
 from pitivi.shortcuts import ShortcutsManager
 from pitivi.shortcuts import show_shortcuts
+from pitivi.timeline.previewers import Previewer
+from pitivi.timeline.previewers import ThumbnailStore
 from pitivi.undo.project import ProjectObserver
 from pitivi.undo.undo import UndoableActionLog
 from pitivi.utils import loggable
+from pitivi.utils.caches import CacheManager
 from pitivi.utils.loggable import Loggable
+from pitivi.utils.misc import CacheKeys
 from pitivi.utils.misc import path_from_uri
 from pitivi.utils.misc import quote_uri
 from pitivi.utils.proxy import ProxyManager
@@ -144,6 +148,12 @@ class Pitivi(Gtk.Application, Loggable):
         self.threads = ThreadMaster()
         self.effects = EffectsManager()
         self.proxy_manager = ProxyManager(self)
+        CacheKeys.by_content = self.settings.cache_keys_by_content
+        self.cache_manager = CacheManager(self)
+        self.cache_manager.schedule_collection()
+        self.proxy_manager.restore_jobs()
+        Previewer.manager.set_max_workers(self.settings.previewers_max_workers)
+        Previewer.manager.offline_waveforms = self.settings.previewers_offline_waveforms
         self.system = get_system()
         self.plugin_manager = PluginManager(self)
 
@@ -175,6 +185,10 @@ class Pitivi(Gtk.Application, Loggable):
         self.add_action(self.quit_action)
         self.shortcuts.add("app.quit", ["<Primary>q"], self.quit_action, _("Quit"))
 
+        self.collect_caches_action = Gio.SimpleAction.new("collect-caches", None)
+        self.collect_caches_action.connect("activate", self._collect_caches_cb)
+        self.add_action(self.collect_caches_action)
+
         self.show_shortcuts_action = Gio.SimpleAction.new("shortcuts_window", None)
         self.show_shortcuts_action.connect("activate", self._show_shortcuts_cb)
         self.add_action(self.show_shortcuts_action)
@@ -234,6 +248,8 @@ class Pitivi(Gtk.Application, Loggable):
         if self.gui:
             self.gui.destroy()
         self.threads.wait_all_threads()
+        ThumbnailStore.commit_all()
+        self.proxy_manager.journal.flush()
         self.settings.store_settings()
         self.quit()
         return True
@@ -361,6 +377,9 @@ class Pitivi(Gtk.Application, Loggable):
     def _redo_cb(self, unused_action, unused_param):
         self.action_log.redo()
 
+    def _collect_caches_cb(self, unused_action, unused_param):
+        self.cache_manager.collect()
+
     def _show_shortcuts_cb(self, unused_action, unused_param):
         show_shortcuts(self)
 
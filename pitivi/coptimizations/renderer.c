@@ -6,17 +6,31 @@
 
 static GObjectClass * gobject_class;
 
+#if G_BYTE_ORDER == G_LITTLE_ENDIAN
+#define NATIVE_BYTE_ORDER_CHAR '<'
+#else
+#define NATIVE_BYTE_ORDER_CHAR '>'
+#endif
+
 /*
- * This function must be called with a range of samples, and a desired
- * width and height.
+ * This function must be called with a one-dimensional buffer of float or
+ * double samples, which is read in place, and a desired width and height.
+ * Optionally, the range of the samples to be drawn can be specified by an
+ * offset and a length, and the samples can be multiplied by a scale.
  * It will average samples if needed.
  */
 static PyObject *
 py_fill_surface (PyObject * self, PyObject * args)
 {
   PyObject *samples;
-  PyObject *sampleObj;
-  int length, i;
+  Py_buffer view;
+  const char *format;
+  const char *data;
+  gboolean is_double;
+  Py_ssize_t offset = 0;
+  Py_ssize_t length = -1;
+  Py_ssize_t n_samples, i;
+  double scale = 1.;
   double sample;
   cairo_surface_t *surface;
   cairo_t *ctx;
@@ -27,10 +41,39 @@ py_fill_surface (PyObject * self, PyObject * args)
   float x = 0.;
   double accum;
 
-  if (!PyArg_ParseTuple (args, "O!ii", &PyList_Type, &samples, &width, &height))
+  if (!PyArg_ParseTuple (args, "Oii|nnd", &samples, &width, &height,
+          &offset, &length, &scale))
+    return NULL;
+
+  if (PyObject_GetBuffer (samples, &view, PyBUF_STRIDES | PyBUF_FORMAT) < 0)
     return NULL;
 
-  length = PyList_Size (samples);
+  if (view.ndim != 1) {
+    PyErr_SetString (PyExc_ValueError, "The samples must be one-dimensional");
+    PyBuffer_Release (&view);
+    return NULL;
+  }
+
+  format = view.format;
+  if (*format == '@' || *format == '=' || *format == NATIVE_BYTE_ORDER_CHAR)
+    format++;
+  if (g_strcmp0 (format, "d") == 0) {
+    is_double = TRUE;
+  } else if (g_strcmp0 (format, "f") == 0) {
+    is_double = FALSE;
+  } else {
+    PyErr_Format (PyExc_TypeError, "Unsupported samples format: %s",
+        view.format);
+    PyBuffer_Release (&view);
+    return NULL;
+  }
+
+  /* Clamp the range, the same as when slicing. */
+  n_samples = view.shape[0];
+  offset = CLAMP (offset, 0, n_samples);
+  if (length < 0 || length > n_samples - offset)
+    length = n_samples - offset;
+  data = (const char *) view.buf + offset * view.strides[0];
 
   surface = cairo_image_surface_create (CAIRO_FORMAT_ARGB32, width, height);
 
@@ -45,24 +88,20 @@ py_fill_surface (PyObject * self, PyObject * args)
   samplesInAccum = 0;
   accum = 0.;
 
+  /* The buffer stays valid until released. */
+  Py_BEGIN_ALLOW_THREADS;
   for (i = 0; i < length; i++) {
-    /* Guaranteed to return something */
-    sampleObj = PyList_GetItem (samples, i);
-    sample = PyFloat_AsDouble (sampleObj);
-
-    /* If the object was not a float or convertible to float */
-    if (PyErr_Occurred ()) {
-      cairo_surface_finish (surface);
-      Py_DECREF (samples);
-      return NULL;
-    }
+    if (is_double)
+      sample = *(const double *) (data + i * view.strides[0]);
+    else
+      sample = *(const float *) (data + i * view.strides[0]);
 
     currentPixel += pixelsPerSample;
     samplesInAccum += 1;
     accum += sample;
     if (currentPixel > 1.0) {
       accum /= samplesInAccum;
-      cairo_line_to (ctx, x, height - accum);
+      cairo_line_to (ctx, x, height - accum * scale);
       accum = 0;
       currentPixel -= 1.0;
       samplesInAccum = 0;
@@ -70,10 +109,13 @@ py_fill_surface (PyObject * self, PyObject * args)
     x += pixelsPerSample;
   }
 
-  Py_DECREF (samples);
   cairo_line_to (ctx, width, height);
   cairo_close_path (ctx);
   cairo_fill_preserve (ctx);
+  cairo_destroy (ctx);
+  Py_END_ALLOW_THREADS;
+
+  PyBuffer_Release (&view);
 
   return PycairoSurface_FromSurface (surface, NULL);
 }
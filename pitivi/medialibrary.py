@@ -593,6 +593,8 @@ class MediaLibraryWidget(Gtk.Box, Loggable):
         project_manager.connect("new-project-failed", self._new_project_failed_cb)
         project_manager.connect("project-closed", self._project_closed_cb)
 
+        self.app.proxy_manager.connect("queue-changed", self.__proxy_queue_changed_cb)
+
         # Drag and Drop
         self.drag_dest_set(Gtk.DestDefaults.DROP | Gtk.DestDefaults.MOTION,
                            [URI_TARGET_ENTRY, FILE_TARGET_ENTRY],
@@ -925,6 +927,10 @@ class MediaLibraryWidget(Gtk.Box, Loggable):
         if progress == 100:
             self._done_importing()
 
+    def __proxy_queue_changed_cb(self, unused_proxy_manager):
+        for item in self.store:
+            item.infotext = beautify_asset(item.asset)
+
     def __asset_proxying_cb(self, proxy, unused_pspec):
         if not self.app.proxy_manager.is_proxy_asset(proxy):
             self.info("Proxy is not a proxy in our terms (handling deleted proxy"
@@ -1483,6 +1489,7 @@ class MediaLibraryWidget(Gtk.Box, Loggable):
 
     def _flowbox_selected_children_changed_cb(self, flowbox):
         self._update_actions()
+        self.app.proxy_manager.set_selected_assets(self.get_selected_assets())
 
     def _update_actions(self):
         selected_count = len(self.flowbox.get_selected_children())
@@ -390,6 +390,7 @@ class Layer(Gtk.Layout, Zoomable, Loggable):
     def _clip_added_cb(self, unused_ges_layer, ges_clip):
         self._add_clip(ges_clip)
         self.check_media_types()
+        self.app.proxy_manager.reprioritize()
 
     def _add_clip(self, ges_clip):
         ui_type = elements.GES_TYPE_UI_TYPE.get(ges_clip.__gtype__, None)
@@ -411,6 +412,7 @@ class Layer(Gtk.Layout, Zoomable, Loggable):
     def _clip_removed_cb(self, unused_ges_layer, ges_clip):
         self._remove_clip(ges_clip)
         self.check_media_types()
+        self.app.proxy_manager.reprioritize()
 
     def _remove_clip(self, ges_clip):
         if not ges_clip.ui:
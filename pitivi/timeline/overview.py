@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Overview of the entire timeline, drawn out of the previews caches."""
+import bisect
+import os
+
+import cairo
+from gi.repository import Gdk
+from gi.repository import GES
+from gi.repository import Gtk
+
+from pitivi.timeline.previewers import get_wavefile_location_for_uri
+from pitivi.timeline.previewers import PEAK_RMS
+from pitivi.timeline.previewers import PEAKS_DECIMATION
+from pitivi.timeline.previewers import Previewer
+from pitivi.timeline.previewers import SAMPLE_DURATION
+from pitivi.timeline.previewers import ThumbnailCache
+from pitivi.timeline.previewers import WaveformPeaks
+from pitivi.utils.loggable import Loggable
+from pitivi.utils.proxy import get_proxy_target
+from pitivi.utils.timeline import Zoomable
+from pitivi.utils.ui import PLAYHEAD_COLOR
+from pitivi.utils.ui import PLAYHEAD_WIDTH
+from pitivi.utils.ui import set_cairo_color
+
+OVERVIEW_HEIGHT_PX = 36
+# The colors of the clips without cached previews.
+OVERVIEW_VIDEO_COLOR = (0.25, 0.3, 0.4)
+OVERVIEW_AUDIO_COLOR = (0.2, 0.35, 0.25)
+OVERVIEW_WAVEFORM_COLOR = (0.6, 0.8, 0.6)
+OVERVIEW_VIEWPORT_COLOR = (1, 1, 1, 0.25)
+# The part of the timeline duration added at the end of the overview, so
+# the clips don't have to be rendered again every time the duration grows.
+OVERVIEW_DURATION_HEADROOM = 0.25
+
+
+class TimelineOverview(Gtk.DrawingArea, Zoomable, Loggable):
+    """Strip displaying the entire timeline, for navigating quickly.
+
+    The clips are rendered once into an image, out of the thumbnails and
+    the waveforms cached by the previewers, so no previewer is started.
+    When clips change, only the areas they cover are rendered again. The
+    overview spans more than the timeline duration, so the image is kept
+    while the duration grows within the headroom. Clicking seeks and scrolls the timeline to the clicked position.
+
+    Args:
+        timeline_container (TimelineContainer): The container of the
+            displayed timeline.
+    """
+
+    def __init__(self, timeline_container):
+        Gtk.DrawingArea.__init__(self)
+        Zoomable.__init__(self)
+        Loggable.__init__(self)
+
+        self.timeline_container = timeline_container
+        self.hadj = timeline_container.timeline.hadj
+        self.ges_timeline = None
+        self._pipeline = None
+        self._position = 0
+
+        # The rendered clips.
+        self._surface = None
+        # The duration spanned by the surface, including the headroom.
+        self._duration = 0
+        # The (start, end) timeline ranges which must be rendered again.
+        self._dirty_ranges = []
+        # The (start, end) timeline range covered by each clip.
+        self._clip_ranges = {}
+
+        self.props.height_request = OVERVIEW_HEIGHT_PX
+        self.props.hexpand = True
+        self.add_events(Gdk.EventMask.BUTTON_PRESS_MASK |
+                        Gdk.EventMask.BUTTON1_MOTION_MASK)
+        self.get_style_context().add_class("TimelineOverview")
+
+        self.hadj.connect("value-changed", self.__hadj_changed_cb)
+        self.hadj.connect("changed", self.__hadj_changed_cb)
+        # The previews become available as the previewers finish.
+        Previewer.manager.connect("previewer-done", self.__previewer_done_cb)
+
+    def set_project(self, project):
+        """Connects to the timeline and the pipeline of the project."""
+        if self.ges_timeline:
+            self.ges_timeline.disconnect_by_func(self.__duration_changed_cb)
+            self.ges_timeline.disconnect_by_func(self.__layer_added_cb)
+            self.ges_timeline.disconnect_by_func(self.__layer_removed_cb)
+            for ges_layer in self.ges_timeline.get_layers():
+                self.__layer_removed_cb(self.ges_timeline, ges_layer)
+        if self._pipeline:
+            self._pipeline.disconnect_by_func(self.__position_cb)
+
+        self.ges_timeline = project.ges_timeline if project else None
+        self._pipeline = project.pipeline if project else None
+        self._clip_ranges = {}
+        self._surface = None
+
+        if self.ges_timeline:
+            self.ges_timeline.connect("notify::duration", self.__duration_changed_cb)
+            self.ges_timeline.connect("layer-added", self.__layer_added_cb)
+            self.ges_timeline.connect("layer-removed", self.__layer_removed_cb)
+            for ges_layer in self.ges_timeline.get_layers():
+                self.__layer_added_cb(self.ges_timeline, ges_layer)
+        if self._pipeline:
+            self._pipeline.connect("position", self.__position_cb)
+
+        self.queue_draw()
+
+    def invalidate(self, start, end):
+        """Marks the specified timeline range to be rendered again."""
+        if end > start:
+            self._dirty_ranges.append((start, end))
+            self.queue_draw()
+
+    def zoom_changed(self):
+        self.queue_draw()
+
+    def __hadj_changed_cb(self, unused_hadj):
+        self.queue_draw()
+
+    def __previewer_done_cb(self, unused_manager, previewer):
+        ges_elem = getattr(previewer, "ges_elem", None)
+        if ges_elem is None:
+            return
+
+        clip_range = self._clip_ranges.get(ges_elem.get_parent())
+        if clip_range:
+            self.invalidate(*clip_range)
+
+    def __position_cb(self, unused_pipeline, position):
+        self._position = position
+        self.queue_draw()
+
+    def __duration_changed_cb(self, ges_timeline, unused_pspec):
+        duration = ges_timeline.props.duration
+        if duration > self._duration or \
+                duration * (1 + OVERVIEW_DURATION_HEADROOM) ** 2 < self._duration:
+            # The scale must change.
+            self._surface = None
+        self.queue_draw()
+
+    def __layer_added_cb(self, unused_ges_timeline, ges_layer):
+        ges_layer.connect("clip-added", self.__clip_added_cb)
+        ges_layer.connect("clip-removed", self.__clip_removed_cb)
+        ges_layer.connect("notify::priority", self.__layer_priority_changed_cb)
+        for ges_clip in ges_layer.get_clips():
+            self.__clip_added_cb(ges_layer, ges_clip)
+        # The lanes changed.
+        self._surface = None
+
+    def __layer_removed_cb(self, unused_ges_timeline, ges_layer):
+        ges_layer.disconnect_by_func(self.__clip_added_cb)
+        ges_layer.disconnect_by_func(self.__clip_removed_cb)
+        ges_layer.disconnect_by_func(self.__layer_priority_changed_cb)
+        for ges_clip in ges_layer.get_clips():
+            self.__clip_removed_cb(ges_layer, ges_clip)
+        self._surface = None
+        self.queue_draw()
+
+    def __layer_priority_changed_cb(self, unused_ges_layer, unused_pspec):
+        self._surface = None
+        self.queue_draw()
+
+    def __clip_added_cb(self, unused_ges_layer, ges_clip):
+        ges_clip.connect("notify::start", self.__clip_changed_cb)
+        ges_clip.connect("notify::duration", self.__clip_changed_cb)
+        ges_clip.connect("notify::in-point", self.__clip_changed_cb)
+        self.__clip_changed_cb(ges_clip, None)
+
+    def __clip_removed_cb(self, unused_ges_layer, ges_clip):
+        ges_clip.disconnect_by_func(self.__clip_changed_cb)
+        start, end = self._clip_ranges.pop(ges_clip, (0, 0))
+        self.invalidate(start, end)
+
+    def __clip_changed_cb(self, ges_clip, unused_pspec):
+        # Render both where the clip was and where it is now.
+        start, end = self._clip_ranges.get(ges_clip, (0, 0))
+        self.invalidate(start, end)
+        clip_range = (ges_clip.props.start, ges_clip.props.start + ges_clip.props.duration)
+        self._clip_ranges[ges_clip] = clip_range
+        self.invalidate(*clip_range)
+
+    def _ns_to_x(self, position):
+        return position * self.get_allocated_width() / max(1, self._duration)
+
+    def _x_to_ns(self, x):
+        return int(max(0, x) * self._duration / max(1, self.get_allocated_width()))
+
+    def do_size_allocate(self, allocation):
+        Gtk.DrawingArea.do_size_allocate(self, allocation)
+        self._surface = None
+
+    def do_draw(self, context):
+        if not self.ges_timeline:
+            return
+
+        width = self.get_allocated_width()
+        height = self.get_allocated_height()
+        if self._surface is None:
+            self._surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+            self._duration = int(self.ges_timeline.props.duration *
+                                 (1 + OVERVIEW_DURATION_HEADROOM))
+            self._dirty_ranges = [(0, self._duration)]
+        if self._dirty_ranges:
+            self._render(self._dirty_ranges)
+            self._dirty_ranges = []
+
+        context.set_source_surface(self._surface, 0, 0)
+        context.paint()
+
+        # The part of the timeline visible in the timeline.
+        x = self._ns_to_x(self.pixel_to_ns(self.hadj.get_value()))
+        visible_width = self._ns_to_x(self.pixel_to_ns(self.hadj.get_page_size()))
+        context.set_source_rgba(*OVERVIEW_VIEWPORT_COLOR)
+        context.rectangle(x, 0, max(1, visible_width), height)
+        context.fill()
+
+        set_cairo_color(context, PLAYHEAD_COLOR)
+        context.set_line_width(PLAYHEAD_WIDTH)
+        x = int(self._ns_to_x(self._position)) + 0.5
+        context.move_to(x, 0)
+        context.line_to(x, height)
+        context.stroke()
+
+    def _render(self, ranges):
+        """Renders the clips in the specified timeline ranges."""
+        height = self._surface.get_height()
+        layers = self.ges_timeline.get_layers()
+        if not layers:
+            return
+        lane_height = height / len(layers)
+
+        context = cairo.Context(self._surface)
+        for start, end in ranges:
+            x1 = int(self._ns_to_x(start))
+            x2 = int(self._ns_to_x(end)) + 1
+            context.save()
+            context.rectangle(x1, 0, x2 - x1, height)
+            context.clip()
+            context.set_operator(cairo.OPERATOR_CLEAR)
+            context.paint()
+            context.set_operator(cairo.OPERATOR_OVER)
+
+            for ges_layer in layers:
+                y = ges_layer.props.priority * lane_height
+                for ges_clip in ges_layer.get_clips_in_interval(start, end):
+                    if isinstance(ges_clip, GES.UriClip):
+                        self._render_clip(context, ges_clip, y, lane_height)
+            context.restore()
+
+    def _render_clip(self, context, ges_clip, y, lane_height):
+        x = self._ns_to_x(ges_clip.props.start)
+        width = max(1, self._ns_to_x(ges_clip.props.duration))
+        video = ges_clip.find_track_elements(None, GES.TrackType.VIDEO, GES.UriSource)
+        audio = ges_clip.find_track_elements(None, GES.TrackType.AUDIO, GES.UriSource)
+
+        context.save()
+        context.rectangle(x, y, width, lane_height)
+        context.clip()
+        video_height = lane_height
+        if video and audio:
+            video_height = lane_height * 2 / 3
+        if video:
+            set_cairo_color(context, OVERVIEW_VIDEO_COLOR)
+            context.rectangle(x, y, width, video_height)
+            context.fill()
+            self._render_thumbnails(context, ges_clip, video[0], y, video_height)
+        if audio:
+            audio_y = y + lane_height - video_height if video else y
+            audio_height = lane_height - video_height if video else lane_height
+            set_cairo_color(context, OVERVIEW_AUDIO_COLOR)
+            context.rectangle(x, audio_y, width, audio_height)
+            context.fill()
+            self._render_waveform(context, ges_clip, audio[0], audio_y, audio_height)
+        context.restore()
+
+    def _render_thumbnails(self, context, ges_clip, source, y, height):
+        """Draws the cached thumbnails of the source, side by side."""
+        asset = get_proxy_target(source)
+        if asset.is_image():
+            return
+
+        thumb_cache = ThumbnailCache.get(asset.props.id)
+        thumb_width, thumb_height = thumb_cache.image_size
+        if not thumb_height or not thumb_cache.positions:
+            return
+
+        positions = sorted(thumb_cache.positions)
+        scale = height / thumb_height
+        x = self._ns_to_x(ges_clip.props.start)
+        end_x = x + self._ns_to_x(ges_clip.props.duration)
+        while x < end_x:
+            timeline_position = self._x_to_ns(x)
+            position = ges_clip.get_internal_time_from_timeline_time(source, timeline_position)
+            # Use the closest cached thumbnail.
+            index = min(bisect.bisect_left(positions, position), len(positions) - 1)
+            if index > 0 and position - positions[index - 1] < positions[index] - position:
+                index -= 1
+            try:
+                pixbuf = thumb_cache[positions[index]]
+            except KeyError:
+                pixbuf = None
+            if pixbuf:
+                context.save()
+                context.translate(x, y)
+                context.scale(scale, scale)
+                Gdk.cairo_set_source_pixbuf(context, pixbuf, 0, 0)
+                context.paint()
+                context.restore()
+            x += thumb_width * scale
+
+    def _render_waveform(self, context, ges_clip, source, y, height):
+        """Draws the cached envelope of the source mix."""
+        try:
+            wavefile = get_wavefile_location_for_uri(get_proxy_target(source).props.id)
+        except OSError:
+            return
+        if not os.path.exists(wavefile):
+            return
+
+        peaks = WaveformPeaks.get(wavefile)
+        if not peaks.levels or peaks.max_rms <= 0:
+            return
+
+        start = ges_clip.props.start
+        last = start + ges_clip.props.duration - 1
+        x = int(self._ns_to_x(start))
+        end_x = int(self._ns_to_x(last)) + 1
+        # Use the coarsest level still having a sample for each pixel.
+        level, samples = peaks.level_for(self._x_to_ns(1))
+        sample_duration = SAMPLE_DURATION * PEAKS_DECIMATION ** level
+
+        set_cairo_color(context, OVERVIEW_WAVEFORM_COLOR)
+        context.move_to(x, y + height)
+        for pixel in range(x, end_x + 1):
+            timeline_position = min(max(start, self._x_to_ns(pixel)), last)
+            position = ges_clip.get_internal_time_from_timeline_time(source, timeline_position)
+            index = min(int(position / sample_duration), len(samples) - 1)
+            value = samples[index, 0, PEAK_RMS] / peaks.max_rms
+            context.line_to(pixel, y + height * (1 - value))
+        context.line_to(end_x, y + height)
+        context.close_path()
+        context.fill()
+
+    def do_button_press_event(self, event):
+        if event.button == 1:
+            self.__seek(event.x)
+        return False
+
+    def do_motion_notify_event(self, event):
+        if event.state & Gdk.ModifierType.BUTTON1_MASK:
+            self.__seek(event.x)
+        return False
+
+    def __seek(self, x):
+        if not self._pipeline:
+            return
+
+        position = min(self._x_to_ns(x), self.ges_timeline.props.duration)
+        self._pipeline.simple_seek(position)
+        self.timeline_container.timeline.scroll_to_playhead(align=Gtk.Align.CENTER)
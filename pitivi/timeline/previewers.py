@@ -15,11 +15,18 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with this program; if not, see <http://www.gnu.org/licenses/>.
 """Previewers for the timeline."""
+import collections
 import contextlib
 import hashlib
+import heapq
+import multiprocessing
 import os
-import random
+import queue
+import shutil
 import sqlite3
+import threading
+import time
+import weakref
 from gettext import gettext as _
 
 import cairo
@@ -36,7 +43,19 @@ from gi.repository import PangoCairo
 
 from pitivi.settings import GlobalSettings
 from pitivi.settings import xdg_cache_home
+from pitivi.utils import loggable
 from pitivi.utils.loggable import Loggable
+from pitivi.utils.loudness import K_WEIGHTING_A
+from pitivi.utils.loudness import K_WEIGHTING_B
+from pitivi.utils.loudness import K_WEIGHTING_RATE
+from pitivi.utils.loudness import load_loudness
+from pitivi.utils.loudness import LOUDNESS_STEP
+from pitivi.utils.loudness import LoudnessMeter
+from pitivi.utils.loudness import save_loudness
+from pitivi.utils.loudness import set_loudness_metas
+from pitivi.utils.loudness import TRUE_PEAK_RATE
+from pitivi.utils.misc import CacheKeys
+from pitivi.utils.misc import fingerprint_file
 from pitivi.utils.misc import path_from_uri
 from pitivi.utils.misc import quantize
 from pitivi.utils.misc import quote_uri
@@ -57,15 +76,66 @@ except ImportError:
 
 
 SAMPLE_DURATION = Gst.SECOND / 100
+# The ratio between the sample durations of consecutive levels of the
+# waveform peaks pyramid.
+PEAKS_DECIMATION = 4
+# The columns of the waveform peaks.
+PEAK_MIN, PEAK_MAX, PEAK_RMS = range(3)
+# The number of recently used waveform peaks kept loaded when unused.
+WAVEFORM_PEAKS_RECENT = 16
+# The waveform channels displayed besides the individual channels.
+WAVEFORM_MIX = -1
+WAVEFORM_ALL_CHANNELS = -2
+# The peak level under which the audio is considered silent, in dBFS.
+SILENCE_THRESHOLD_DB = -40
+# The min duration of the detected silences, in nanoseconds.
+SILENCE_MIN_DURATION = Gst.SECOND // 2
 
 # Horizontal space between thumbs.
 THUMB_MARGIN_PX = 3
 THUMB_HEIGHT = EXPANDED_SIZE - 2 * CLIP_BORDER_WIDTH
 THUMB_PERIOD = int(Gst.SECOND / 2)
 assert Gst.SECOND % THUMB_PERIOD == 0
-# For the waveforms, ensures we always have a little extra surface when
-# scrolling while playing, in pixels.
-WAVEFORM_SURFACE_EXTRA_PX = 500
+# The minimum number of queued thumbs for decoding the range they span
+# in a single pass, instead of seeking for each thumb.
+LINEAR_SWEEP_MIN_QUEUED_THUMBS = 20
+# The minimum ratio of queued thumbs among the thumbs of the range they
+# span, for decoding the range in a single pass.
+LINEAR_SWEEP_MIN_DENSITY = 0.5
+# The number of thumbnails composed in a filmstrip tile.
+THUMBS_PER_TILE = 16
+# The min interval between the displayed thumbnails, for which filmstrip
+# tiles are used instead of separate thumbnails.
+TILES_MIN_INTERVAL = 4 * THUMB_PERIOD
+# The number of viewport widths on each side of the viewport, for which
+# the thumbnails of a video clip are created in advance.
+THUMBS_VIEWPORT_MARGIN = 1
+# The max size of the decoded thumbnails kept in memory, in bytes.
+THUMBS_MEMORY_CACHE_SIZE = 128 * 1024 * 1024
+# The max number of thumbnails waiting to be encoded and saved.
+THUMBS_WRITER_QUEUE_SIZE = 64
+# The max number of thumbnails saved in a single transaction.
+THUMBS_WRITER_BATCH_SIZE = 32
+# The time after which the batch is saved if no thumbnail is added, in seconds.
+THUMBS_WRITER_IDLE_TIMEOUT = 1
+# The max time to wait for the queued thumbnails to be saved, in seconds.
+THUMBS_WRITER_FLUSH_TIMEOUT = 10
+# The width of the rendered waveform tiles, in pixels.
+WAVEFORM_TILE_WIDTH_PX = 256
+# The max size of the rendered waveform tiles kept in memory, in bytes.
+WAVEFORM_TILES_MEMORY_SIZE = 64 * 1024 * 1024
+# The coarsest level of the waveform peaks for which the peak envelope is
+# drawn around the RMS waveform. At coarser zoom levels the peaks of long
+# ranges make the envelope meaningless.
+WAVEFORM_ENVELOPE_MAX_LEVEL = 1
+# The opacity of the peak envelope drawn around the RMS waveform.
+WAVEFORM_ENVELOPE_ALPHA = 0.4
+# The interval at which the CPU usage is checked when extracting
+# the waveforms offline, in milliseconds.
+WAVEFORM_OFFLINE_THROTTLE_INTERVAL_MS = 100
+# The delay after which starting more previewers is tried again when the
+# CPU usage was too high, in milliseconds.
+PREVIEWERS_START_RETRY_MS = 500
 
 PREVIEW_GENERATOR_SIGNALS = {
     "done": (GObject.SignalFlags.RUN_LAST, None, ()),
@@ -79,6 +149,19 @@ GlobalSettings.add_config_option("previewers_max_cpu",
                                  key="max-cpu-usage",
                                  default=90)
 
+# The max number of previewers running at the same time for each track type.
+# 0 means the number of CPU cores.
+GlobalSettings.add_config_option("previewers_max_workers",
+                                 section="previewers",
+                                 key="max-workers",
+                                 default=0)
+# Whether the waveforms are extracted as fast as the max CPU usage allows,
+# instead of at playback speed, when nothing is playing.
+GlobalSettings.add_config_option("previewers_offline_waveforms",
+                                 section="previewers",
+                                 key="offline-waveforms",
+                                 default=True)
+
 
 class PreviewerBin(Gst.Bin, Loggable):
     """Baseclass for elements gathering data to create previews."""
@@ -158,8 +241,273 @@ class TeedThumbnailBin(PreviewerBin):
             raise AttributeError('unknown property %s' % prop.name)
 
 
+class WaveformPeaks:
+    """Multi-resolution min/max/RMS peaks of an audio stream.
+
+    The finest level has a sample every SAMPLE_DURATION, and each of the
+    next levels has PEAKS_DECIMATION times fewer samples, down to a single
+    sample for the entire stream. The levels are saved one after the other
+    in a .npy file, after a header row containing the number of samples in
+    the finest level, the max RMS value and the number of channels. The file
+    is memory-mapped when loaded, so only the used parts of the used levels
+    are read.
+
+    Each sample has a column for the mix of the channels, followed by
+    a column for each channel, unless the stream is mono.
+
+    The loaded peaks are shared by all the clips of an asset, see `get`.
+
+    Attributes:
+        levels (List[numpy.ndarray]): The (n, columns, 3) arrays of min, max
+            and RMS samples, from the finest level to the coarsest.
+        max_rms (float): The max RMS value in the finest level.
+        channels (int): The number of channels of the stream.
+    """
+
+    # The loaded peaks by file, as long as they are referenced.
+    _loaded = weakref.WeakValueDictionary()
+    # The recently used peaks, kept even if not referenced anymore.
+    _recent = collections.OrderedDict()
+
+    def __init__(self, data):
+        header = data[0, 0]
+        n_samples, self.max_rms, self.channels = int(header[0]), float(header[1]), int(header[2])
+        # The SilenceIndex objects by (threshold, min duration).
+        self._silence_indexes = {}
+        self.levels = []
+        offset = 1
+        for size in self.level_sizes(n_samples):
+            self.levels.append(data[offset:offset + size])
+            offset += size
+
+    @staticmethod
+    def level_sizes(n_samples):
+        """Gets the number of samples in each level."""
+        sizes = []
+        while n_samples:
+            sizes.append(n_samples)
+            if n_samples == 1:
+                break
+            n_samples = -(-n_samples // PEAKS_DECIMATION)
+        return sizes
+
+    @classmethod
+    def build(cls, mins, maxs, rms):
+        """Creates the peaks out of the finest level samples.
+
+        The values are either 1-D arrays for a mono stream, or (n, columns)
+        arrays with the mix in the first column and a column for each
+        channel.
+
+        Args:
+            mins (numpy.ndarray): The min values.
+            maxs (numpy.ndarray): The max values.
+            rms (numpy.ndarray): The RMS values.
+
+        Returns:
+            numpy.ndarray: The float32 data to be saved.
+        """
+        level = numpy.stack([mins, maxs, rms], axis=-1).astype(numpy.float32)
+        if level.ndim == 2:
+            level = level[:, None]
+        columns = level.shape[1]
+        header = numpy.zeros((1, columns, 3), dtype=numpy.float32)
+        header[0, 0, 0] = len(level)
+        header[0, 0, 1] = rms.max() if len(rms) else 0
+        header[0, 0, 2] = columns - 1 if columns > 1 else 1
+        parts = [header]
+        for unused_size in cls.level_sizes(len(level)):
+            parts.append(level)
+            if len(level) == 1:
+                break
+            starts = numpy.arange(0, len(level), PEAKS_DECIMATION)
+            counts = numpy.diff(numpy.append(starts, len(level)))
+            squares = numpy.add.reduceat(level[:, :, PEAK_RMS] ** 2, starts)
+            level = numpy.stack([numpy.minimum.reduceat(level[:, :, PEAK_MIN], starts),
+                                 numpy.maximum.reduceat(level[:, :, PEAK_MAX], starts),
+                                 numpy.sqrt(squares / counts[:, None])],
+                                axis=-1).astype(numpy.float32)
+        return numpy.concatenate(parts)
+
+    @classmethod
+    def load(cls, filename):
+        """Loads the peaks from the specified file, without reading them."""
+        return cls(numpy.load(filename, mmap_mode="r"))
+
+    @classmethod
+    def get(cls, filename):
+        """Gets the shared, read-only peaks saved in the specified file.
+
+        The peaks are loaded once and stay loaded while they are referenced
+        or while they are among the WAVEFORM_PEAKS_RECENT most recently used.
+        """
+        peaks = cls._loaded.get(filename)
+        if peaks is None:
+            peaks = cls.load(filename)
+            cls._loaded[filename] = peaks
+        cls._recent[filename] = peaks
+        cls._recent.move_to_end(filename)
+        while len(cls._recent) > WAVEFORM_PEAKS_RECENT:
+            cls._recent.popitem(last=False)
+        return peaks
+
+    @classmethod
+    def forget(cls, filename):
+        """Makes sure the peaks are loaded again next time, from disk."""
+        cls._loaded.pop(filename, None)
+        cls._recent.pop(filename, None)
+
+    def columns(self, channel):
+        """Gets the columns of the samples to be displayed.
+
+        Args:
+            channel (int): The index of the channel, or WAVEFORM_MIX or
+                WAVEFORM_ALL_CHANNELS.
+
+        Returns:
+            List[int]: The columns, the mix column if the channel is missing.
+        """
+        if self.channels == 1:
+            return [0]
+
+        if channel == WAVEFORM_ALL_CHANNELS:
+            return list(range(1, self.channels + 1))
+
+        if 0 <= channel < self.channels:
+            return [channel + 1]
+
+        return [0]
+
+    def silence_index(self, threshold_db=SILENCE_THRESHOLD_DB, min_duration=SILENCE_MIN_DURATION):
+        """Gets the silences of the mix, detected in the finest level.
+
+        The index is built once for each set of arguments.
+
+        Args:
+            threshold_db (float): The peak level under which the audio is
+                considered silent, in dBFS.
+            min_duration (int): The min duration of the silences, in
+                nanoseconds.
+
+        Returns:
+            SilenceIndex: The silences.
+        """
+        key = (threshold_db, min_duration)
+        index = self._silence_indexes.get(key)
+        if index is None:
+            # The samples are amplitudes multiplied by 100.
+            threshold = 10 ** (threshold_db / 20) * 100
+            samples = self.levels[0][:, 0, PEAK_MAX] if self.levels else numpy.zeros(0)
+            index = SilenceIndex.detect(samples < threshold, SAMPLE_DURATION, min_duration)
+            self._silence_indexes[key] = index
+        return index
+
+    def level_for(self, sample_duration):
+        """Gets the coarsest level with samples not longer than specified.
+
+        Args:
+            sample_duration (float): The max duration of a sample.
+
+        Returns:
+            (int, numpy.ndarray): The level index and samples.
+        """
+        index = 0
+        while index + 1 < len(self.levels) and \
+                SAMPLE_DURATION * PEAKS_DECIMATION ** (index + 1) <= sample_duration:
+            index += 1
+        return index, self.levels[index]
+
+
+class SilenceIndex:
+    """Sorted, disjoint intervals of silence of an audio stream.
+
+    Attributes:
+        starts (numpy.ndarray): The starts of the silences, in nanoseconds.
+        ends (numpy.ndarray): The ends of the silences, in nanoseconds.
+        duration (int): The duration of the stream, in nanoseconds.
+    """
+
+    def __init__(self, starts, ends, duration):
+        self.starts = starts
+        self.ends = ends
+        self.duration = duration
+
+    @classmethod
+    def detect(cls, silent, sample_duration, min_duration):
+        """Creates the index out of the runs of silent samples.
+
+        Args:
+            silent (numpy.ndarray): Whether each sample is silent.
+            sample_duration (float): The duration of a sample, in nanoseconds.
+            min_duration (int): The min duration of the silences, in
+                nanoseconds. The shorter ones are ignored.
+        """
+        edges = numpy.diff(numpy.concatenate(([0], silent.astype(numpy.int8), [0])))
+        starts = numpy.flatnonzero(edges == 1)
+        ends = numpy.flatnonzero(edges == -1)
+        keep = (ends - starts) * sample_duration >= min_duration
+        return cls((starts[keep] * sample_duration).astype(numpy.int64),
+                   (ends[keep] * sample_duration).astype(numpy.int64),
+                   int(len(silent) * sample_duration))
+
+    def silences(self, start, end):
+        """Gets the silences overlapping the specified interval.
+
+        Returns:
+            List[Tuple[int, int]]: The silences, clipped to the interval.
+        """
+        first = numpy.searchsorted(self.ends, start, side="right")
+        last = numpy.searchsorted(self.starts, end, side="left")
+        return [(max(int(silence_start), start), min(int(silence_end), end))
+                for silence_start, silence_end in zip(self.starts[first:last],
+                                                      self.ends[first:last])]
+
+    def is_silent(self, position):
+        """Returns whether the specified position is in a silence."""
+        index = numpy.searchsorted(self.starts, position, side="right") - 1
+        return index >= 0 and position < self.ends[index]
+
+    def next_activity(self, position):
+        """Gets the start of the first activity after the specified position.
+
+        Returns:
+            int: The position, or None if there is no more activity.
+        """
+        index = numpy.searchsorted(self.starts, position, side="right")
+        if self.is_silent(position):
+            # The current silence ends with the next activity.
+            index -= 1
+        if index >= len(self.ends) or self.ends[index] >= self.duration:
+            return None
+
+        return int(self.ends[index])
+
+
+def get_silence_index(uri):
+    """Gets the silences of the asset, out of its cached waveforms.
+
+    Returns:
+        SilenceIndex: The silences or None if the waveforms of the asset
+            have not been extracted yet.
+    """
+    try:
+        wavefile = get_wavefile_location_for_uri(uri)
+    except OSError:
+        # The file is missing.
+        return None
+    if not os.path.exists(wavefile):
+        return None
+
+    return WaveformPeaks.get(wavefile).silence_index()
+
+
 class WaveformPreviewer(PreviewerBin):
-    """Bin to generate and save waveforms as a .npy file."""
+    """Bin to generate and save waveforms as a .npy file.
+
+    The waveforms of the mix and of the individual channels are extracted
+    in the same pass. The loudness of the asset is measured at the same
+    time and saved next to the .npy file.
+    """
 
     __gproperties__ = {
         "uri": (str,
@@ -177,18 +525,36 @@ class WaveformPreviewer(PreviewerBin):
         PreviewerBin.__init__(self,
                               "tee name=at ! queue ! audioconvert ! audioresample ! "
                               "audio/x-raw,channels=1 ! level name=level"
-                              " ! fakesink at. ! queue")
+                              " ! fakesink "
+                              "at. ! queue ! audioconvert ! level name=channelslevel ! fakesink "
+                              "at. ! queue ! audioconvert ! audioresample ! "
+                              "audio/x-raw,format=F64LE,rate=%d ! audioiirfilter name=kweighting"
+                              " ! level name=loudnesslevel ! fakesink "
+                              "at. ! queue ! audioconvert ! audioresample ! "
+                              "audio/x-raw,rate=%d ! level name=truepeaklevel"
+                              " ! fakesink "
+                              "at. ! queue" % (K_WEIGHTING_RATE, TRUE_PEAK_RATE))
         self.level = self.internal_bin.get_by_name("level")
+        self.channels_level = self.internal_bin.get_by_name("channelslevel")
+        kweighting = self.internal_bin.get_by_name("kweighting")
+        kweighting.props.b = K_WEIGHTING_B
+        kweighting.props.a = K_WEIGHTING_A
+        self.loudness_level = self.internal_bin.get_by_name("loudnesslevel")
+        self.loudness_level.props.interval = LOUDNESS_STEP
+        self.true_peak_level = self.internal_bin.get_by_name("truepeaklevel")
+        self.true_peak_level.props.interval = Gst.SECOND
         self.debug("Creating waveforms!!")
-        self.peaks = None
+        # The RMS and the peak values of each channel, as rows,
+        # by level element.
+        self.peaks = {}
+        self.prev_pos = {}
+        self.loudness = LoudnessMeter()
 
         self.uri = None
         self.wavefile = None
         self.passthrough = False
-        self.samples = None
         self.n_samples = 0
         self.duration = 0
-        self.prev_pos = 0
 
     def do_get_property(self, prop):
         if prop.name == 'uri':
@@ -203,7 +569,8 @@ class WaveformPreviewer(PreviewerBin):
         if prop.name == 'uri':
             self.uri = value
             self.wavefile = get_wavefile_location_for_uri(self.uri)
-            self.passthrough = os.path.exists(self.wavefile)
+            self.passthrough = os.path.exists(self.wavefile) and \
+                os.path.exists(get_loudness_location(self.wavefile))
         elif prop.name == 'duration':
             self.duration = value
             self.n_samples = self.duration / SAMPLE_DURATION
@@ -212,58 +579,86 @@ class WaveformPreviewer(PreviewerBin):
 
     def do_post_message(self, message):
         if message.type == Gst.MessageType.ELEMENT and \
-                message.src == self.level and \
+                message.src == self.loudness_level and \
                 not self.passthrough:
-            struct = message.get_structure()
-            peaks = None
-            if struct:
-                peaks = struct.get_value("rms")
+            self.loudness.add_rms(message.get_structure().get_value("rms"))
+        elif message.type == Gst.MessageType.ELEMENT and \
+                message.src == self.true_peak_level and \
+                not self.passthrough:
+            self.loudness.add_peaks(message.get_structure().get_value("peak"))
+        elif message.type == Gst.MessageType.ELEMENT and \
+                message.src in (self.level, self.channels_level) and \
+                not self.passthrough:
+            if not self.__add_peaks(message.src, message.get_structure()):
+                return False
 
-            if peaks:
-                stream_time = struct.get_value("stream-time")
+        return Gst.Bin.do_post_message(self, message)
 
-                if self.peaks is None:
-                    self.peaks = []
-                    for unused_channel in peaks:
-                        self.peaks.append([0] * int(self.n_samples))
+    def __add_peaks(self, level, struct):
+        """Stores the values posted by the specified level element.
 
-                pos = int(stream_time / SAMPLE_DURATION)
-                if pos >= len(self.peaks[0]):
-                    return False
+        Returns:
+            bool: False if the values are past the expected duration.
+        """
+        peaks = None
+        if struct:
+            # The RMS and the peak values of each channel, as rows.
+            peaks = struct.get_value("rms") + struct.get_value("peak")
 
-                for i, val in enumerate(peaks):
-                    if val < 0:
-                        val = 10 ** (val / 20) * 100
-                    else:
-                        val = self.peaks[i][pos - 1]
+        if not peaks:
+            return True
 
-                    # Linearly joins values between to known samples values.
-                    unknowns = range(self.prev_pos + 1, pos)
-                    if unknowns:
-                        prev_val = self.peaks[i][self.prev_pos]
-                        linear_const = (val - prev_val) / len(unknowns)
-                        for temppos in unknowns:
-                            self.peaks[i][temppos] = self.peaks[i][temppos - 1] + linear_const
+        stream_time = struct.get_value("stream-time")
 
-                    self.peaks[i][pos] = val
+        samples = self.peaks.get(level)
+        if samples is None:
+            # Allocate once, the samples of each channel on a row.
+            samples = numpy.zeros((len(peaks), int(self.n_samples)),
+                                  dtype=numpy.float32)
+            self.peaks[level] = samples
+            self.prev_pos[level] = 0
 
-                self.prev_pos = pos
+        pos = int(stream_time / SAMPLE_DURATION)
+        if pos >= samples.shape[1]:
+            return False
 
-        return Gst.Bin.do_post_message(self, message)
+        values = numpy.array(peaks, dtype=numpy.float32)
+        # Convert the dB values to amplitudes. The invalid values
+        # are replaced by the previous samples.
+        with numpy.errstate(over="ignore"):
+            values = numpy.where(values < 0, 10 ** (values / 20) * 100,
+                                 samples[:, pos - 1])
+
+        # Linearly joins values between to known samples values.
+        prev_pos = self.prev_pos[level]
+        gap = pos - prev_pos - 1
+        if gap > 0:
+            prev_values = samples[:, prev_pos]
+            steps = numpy.arange(1, gap + 1, dtype=numpy.float32)
+            samples[:, prev_pos + 1:pos] = \
+                prev_values[:, None] + numpy.outer((values - prev_values) / gap, steps)
+
+        samples[:, pos] = values
+        self.prev_pos[level] = pos
+        return True
 
     def finalize(self):
         """Finalizes the previewer, saving data to file if needed."""
-        if not self.passthrough and self.peaks:
-            # Let's go mono.
-            if len(self.peaks) > 1:
-                samples = (numpy.array(self.peaks[0]) + numpy.array(self.peaks[1])) / 2
-            else:
-                samples = numpy.array(self.peaks[0])
-
+        if not self.passthrough and self.level in self.peaks:
+            # The mix is computed by audioconvert on the mono branch.
+            mix = self.peaks[self.level]
+            rms = mix[0]
+            peak = mix[1]
+            samples = self.peaks.get(self.channels_level)
+            if samples is not None and len(samples) > 2:
+                channels = len(samples) // 2
+                rms = numpy.column_stack([rms] + list(samples[:channels]))
+                peak = numpy.column_stack([peak] + list(samples[channels:]))
+
+            # The level element reports the peak magnitude.
             with open(self.wavefile, 'wb') as wavefile:
-                numpy.save(wavefile, samples)
-
-            self.samples = samples
+                numpy.save(wavefile, WaveformPeaks.build(-peak, peak, rms))
+            save_loudness(get_loudness_location(self.wavefile), self.loudness.results())
 
 
 Gst.Element.register(None, "waveformbin", Gst.Rank.NONE,
@@ -272,20 +667,161 @@ Gst.Element.register(None, "teedthumbnailbin", Gst.Rank.NONE,
                      TeedThumbnailBin)
 
 
-class PreviewGeneratorManager(Loggable):
-    """Manager for running the previewers."""
+class PreviewGeneratorManager(GObject.Object, Loggable):
+    """Manager for running the previewers.
+
+    Signals:
+        previewer-done (Previewer): A previewer finished its work.
+
+    Attributes:
+        max_workers (int): The max number of previewers running at the same
+            time for each GES.TrackType.
+        idle (bool): Whether the project is not being played back.
+        offline_waveforms (bool): Whether the waveforms can be extracted
+            offline while idle.
+    """
+
+    __gsignals__ = {
+        "previewer-done": (GObject.SignalFlags.RUN_LAST, None, (object,)),
+    }
 
     def __init__(self):
+        GObject.Object.__init__(self)
         Loggable.__init__(self)
 
-        # The current Previewer per GES.TrackType.
-        self._current_previewers = {}
+        # The running Previewers per GES.TrackType.
+        self._current_previewers = {
+            GES.TrackType.AUDIO: [],
+            GES.TrackType.VIDEO: []
+        }
         # The queue of Previewers.
         self._previewers = {
             GES.TrackType.AUDIO: [],
             GES.TrackType.VIDEO: []
         }
         self._running = True
+        self.max_workers = multiprocessing.cpu_count()
+        self._cpu_usage_tracker = CPUUsageTracker()
+        # The sources retrying to start previewers per GES.TrackType.
+        self._retry_sources = {}
+        # The timeline range visible in the UI, in nanoseconds.
+        self.viewport = (0, Gst.CLOCK_TIME_NONE)
+        # The timeline position of the playhead, in nanoseconds.
+        self.playhead_position = 0
+        self.idle = True
+        self.offline_waveforms = True
+        # The AudioPreviewers extracting the waveforms offline.
+        self._offline_previewers = []
+        self._offline_cpu_usage_tracker = CPUUsageTracker()
+        self._throttle_source = 0
+
+    def set_max_workers(self, max_workers):
+        """Sets the max number of previewers running for each track type.
+
+        Args:
+            max_workers (int): The number of previewers, or 0 to use the
+                number of CPU cores.
+        """
+        if max_workers <= 0:
+            max_workers = multiprocessing.cpu_count()
+        self.max_workers = max_workers
+        self.debug("Running up to %d previewers per track type", max_workers)
+
+        for track_type in self._previewers:
+            self.__start_next_previewers(track_type)
+
+    def set_viewport(self, start, end):
+        """Sets the visible timeline range, to prioritize the previews in it.
+
+        Args:
+            start (int): The start of the visible range, in nanoseconds.
+            end (int): The end of the visible range, in nanoseconds.
+        """
+        if self.viewport == (start, end):
+            return
+
+        self.viewport = (start, end)
+        self.__reprioritize()
+
+    def set_playhead_position(self, position):
+        """Sets the playhead position, to prioritize the previews around it.
+
+        Args:
+            position (int): The playhead position, in nanoseconds.
+        """
+        if self.playhead_position == position:
+            return
+
+        self.playhead_position = position
+        self.__reprioritize()
+
+    def set_idle(self, idle):
+        """Sets whether the project is not being played back.
+
+        The waveforms extractions started while idle run offline, as fast
+        as the max CPU usage allows. They are paused during the playback.
+
+        Args:
+            idle (bool): Whether the playback is stopped.
+        """
+        if self.idle == idle:
+            return
+
+        self.idle = idle
+        for previewer in list(self._offline_previewers):
+            previewer.set_throttled(not idle)
+
+    def add_offline_previewer(self, previewer):
+        """Starts pausing the previewer whenever the CPU usage is too high.
+
+        Args:
+            previewer (AudioPreviewer): The previewer extracting the
+                waveforms offline.
+        """
+        if previewer in self._offline_previewers:
+            return
+
+        self._offline_previewers.append(previewer)
+        previewer.set_throttled(not self.idle)
+        if not self._throttle_source:
+            self._offline_cpu_usage_tracker.reset()
+            self._throttle_source = GLib.timeout_add(WAVEFORM_OFFLINE_THROTTLE_INTERVAL_MS,
+                                                     self.__throttle_cb)
+
+    def remove_offline_previewer(self, previewer):
+        """Stops controlling the specified offline previewer.
+
+        Args:
+            previewer (AudioPreviewer): The previewer extracting the
+                waveforms offline.
+        """
+        if previewer not in self._offline_previewers:
+            return
+
+        self._offline_previewers.remove(previewer)
+        if not self._offline_previewers and self._throttle_source:
+            GLib.source_remove(self._throttle_source)
+            self._throttle_source = 0
+
+    def __throttle_cb(self):
+        try:
+            usage = self._offline_cpu_usage_tracker.usage()
+        except ZeroDivisionError:
+            # No time passed since the last check.
+            return True
+        self._offline_cpu_usage_tracker.reset()
+
+        # The usage of the entire process is measured, so the extractions
+        # make room for the UI and for the other previewers.
+        for previewer in list(self._offline_previewers):
+            # pylint: disable=protected-access
+            previewer.set_throttled(not self.idle or usage > previewer._max_cpu_usage)
+        return True
+
+    def __reprioritize(self):
+        for previewers in self._current_previewers.values():
+            for previewer in list(previewers):
+                previewer.reprioritize()
 
     def add_previewer(self, previewer):
         """Adds the specified previewer to the queue.
@@ -295,63 +831,103 @@ class PreviewGeneratorManager(Loggable):
         """
         track_type = previewer.track_type
 
-        current = self._current_previewers.get(track_type)
-        if previewer in self._previewers[track_type] or previewer is current:
+        if previewer in self._previewers[track_type] or \
+                previewer in self._current_previewers[track_type]:
             # Already in the queue or already processing.
             return
 
-        if not self._previewers[track_type] and current is None:
-            self._start_previewer(previewer)
-        else:
-            self._previewers[track_type].insert(0, previewer)
+        self._previewers[track_type].insert(0, previewer)
+        self.__start_next_previewers(track_type)
 
     def _start_previewer(self, previewer):
-        self._current_previewers[previewer.track_type] = previewer
+        self._current_previewers[previewer.track_type].append(previewer)
         previewer.connect("done", self.__previewer_done_cb)
         previewer.start_generation()
 
     @contextlib.contextmanager
     def paused(self, interrupt=False):
         """Pauses (and flushes if interrupt=True) managed previewers."""
+        self._running = False
         if interrupt:
-            for previewer in list(self._current_previewers.values()):
-                previewer.stop_generation()
+            for previewers in self._current_previewers.values():
+                for previewer in list(previewers):
+                    previewer.stop_generation()
 
             for previewers in self._previewers.values():
                 for previewer in previewers:
                     previewer.stop_generation()
         else:
-            for previewer in list(self._current_previewers.values()):
-                previewer.pause_generation()
+            for previewers in self._current_previewers.values():
+                for previewer in previewers:
+                    previewer.pause_generation()
 
             for previewers in self._previewers.values():
                 for previewer in previewers:
                     previewer.pause_generation()
 
         try:
-            self._running = False
             yield
         except:
             self.warning("An exception occurred while the previewer was paused")
             raise
         finally:
             self._running = True
-            for track_type in self._previewers:
-                self.__start_next_previewer(track_type)
+            for track_type, previewers in self._current_previewers.items():
+                # Resume the paused previewers.
+                for previewer in list(previewers):
+                    previewer.start_generation()
+                self.__start_next_previewers(track_type)
 
     def __previewer_done_cb(self, previewer):
-        self.__start_next_previewer(previewer.track_type)
+        previewer.disconnect_by_func(self.__previewer_done_cb)
+        previewers = self._current_previewers[previewer.track_type]
+        if previewer in previewers:
+            previewers.remove(previewer)
 
-    def __start_next_previewer(self, track_type):
-        next_previewer = self._current_previewers.pop(track_type, None)
-        if next_previewer:
-            next_previewer.disconnect_by_func(self.__previewer_done_cb)
+        self.__start_next_previewers(previewer.track_type)
+        self.emit("previewer-done", previewer)
 
+    def __start_next_previewers(self, track_type):
+        """Starts queued previewers while workers are available."""
         if not self._running:
             return
 
-        if self._previewers[track_type]:
-            self._start_previewer(self._previewers[track_type].pop())
+        queue = self._previewers[track_type]
+        current = self._current_previewers[track_type]
+        while queue and len(current) < self.max_workers:
+            # Always keep one previewer running, but start more
+            # only if the CPU usage allows it.
+            if current and not self.__cpu_available(queue[-1]):
+                self.log("Not starting more previewers, CPU usage too high")
+                if track_type not in self._retry_sources:
+                    self._retry_sources[track_type] = GLib.timeout_add(
+                        PREVIEWERS_START_RETRY_MS, self.__retry_start_cb, track_type)
+                return
+
+            self._start_previewer(queue.pop())
+
+        retry_source = self._retry_sources.pop(track_type, 0)
+        if retry_source:
+            GLib.source_remove(retry_source)
+
+    def __retry_start_cb(self, track_type):
+        del self._retry_sources[track_type]
+        self.__start_next_previewers(track_type)
+        return False
+
+    def __cpu_available(self, previewer):
+        # pylint: disable=protected-access
+        max_cpu_usage = previewer._max_cpu_usage
+        if max_cpu_usage is None:
+            return True
+
+        try:
+            usage = self._cpu_usage_tracker.usage()
+        except ZeroDivisionError:
+            # No time passed since the last check.
+            return False
+        self._cpu_usage_tracker.reset()
+        return usage < max_cpu_usage
 
 
 class Previewer(GObject.Object):
@@ -385,6 +961,9 @@ class Previewer(GObject.Object):
     def pause_generation(self):
         """Pauses preview generation."""
 
+    def reprioritize(self):
+        """Reorders the pending work after the viewport or playhead changed."""
+
     @staticmethod
     def thumb_interval(thumb_width):
         """Gets the interval for which a thumbnail is displayed.
@@ -528,6 +1107,10 @@ class ImagePreviewer(Gtk.Layout, Previewer, Zoomable, Loggable):
             thumb.props.opacity = opacity
 
     def start_generation(self):
+        if self.__start_id:
+            # Already waiting for the UI to become idle.
+            return
+
         self.debug("Waiting for UI to become idle for: %s", self.uri)
         self.__start_id = GLib.idle_add(self._start_thumbnailing_cb,
                                         priority=GLib.PRIORITY_LOW)
@@ -567,8 +1150,27 @@ class AssetPreviewer(Previewer, Loggable):
         self.__start_id = 0
         self.__preroll_timeout_id = 0
         self.__thumb_cb_id = 0
-
-        # The thumbs to be generated.
+        # Whether the pipeline is playing a range of the asset to create all
+        # its thumbs in a single pass.
+        self.__sweeping = False
+        # The range being swept and the position up to which it has been
+        # swept.
+        self.__sweep_start = 0
+        self.__sweep_position = 0
+        self.__sweep_stop = 0
+        # The sorted queued positions not filled yet by the sweep.
+        self.__sweep_positions = []
+        # The last frame of the sweep.
+        self.__sweep_pixbuf = None
+        # Whether the pipeline has been paused because of the CPU usage.
+        self.__sweep_throttled = False
+        # Whether the pipeline must seek back to __sweep_position, after
+        # being brought back from READY.
+        self.__sweep_seek_pending = False
+        # The (start, stop) ranges swept completely.
+        self.__swept_ranges = []
+
+        # The heap of (priority, position) for the thumbs to be generated.
         self.queue = []
         # The position for which a thumbnail is currently being generated.
         self.position = -1
@@ -602,9 +1204,28 @@ class AssetPreviewer(Previewer, Loggable):
         if position in self.thumb_cache:
             return
         if position not in self.failures and position != self.position:
-            self.queue = [position]
+            self._set_queue([position])
             self.become_controlled()
 
+    def _thumb_priority(self, position):
+        """Gets the priority of the thumb at the specified position.
+
+        Thumbs with lower priority values are generated first.
+
+        Args:
+            position (int): The position of the thumb in the asset, in nanoseconds.
+        """
+        return position
+
+    def _set_queue(self, positions):
+        """Sets the positions of the thumbs to be generated."""
+        self.queue = [(self._thumb_priority(position), position)
+                      for position in positions]
+        heapq.heapify(self.queue)
+
+    def reprioritize(self):
+        self._set_queue([position for unused_priority, position in self.queue])
+
     def _setup_pipeline(self):
         """Creates the pipeline.
 
@@ -673,6 +1294,126 @@ class AssetPreviewer(Previewer, Loggable):
                                               self._create_next_thumb_cb,
                                               priority=GLib.PRIORITY_LOW)
 
+    def _sweep_range(self):
+        """Gets the range spanned by the queued thumbs.
+
+        Returns:
+            (int, int): The start and the stop of the range, in nanoseconds.
+        """
+        positions = [position for unused_priority, position in self.queue]
+        return min(positions), max(positions) + THUMB_PERIOD
+
+    def _should_sweep(self):
+        """Returns whether to create the queued thumbs in a single pass.
+
+        When most of the thumbs in the range spanned by the queue are
+        needed, decoding the range once is much faster than seeking for
+        each thumb, because with long GOPs each accurate seek decodes the
+        same frames again and again.
+        """
+        if len(self.queue) < LINEAR_SWEEP_MIN_QUEUED_THUMBS:
+            return False
+
+        start, stop = self._sweep_range()
+        if any(swept_start <= start and stop <= swept_stop
+               for swept_start, swept_stop in self.__swept_ranges):
+            return False
+
+        n_thumbs = (stop - start) // THUMB_PERIOD
+        return len(self.queue) >= n_thumbs * LINEAR_SWEEP_MIN_DENSITY
+
+    def _start_sweep(self):
+        """Plays the range spanned by the queue as fast as possible."""
+        self.__sweeping = True
+        self.__sweep_throttled = False
+        self.__sweep_seek_pending = False
+        self.__sweep_start, self.__sweep_stop = self._sweep_range()
+        self.__sweep_position = self.__sweep_start
+        self.__sweep_positions = sorted(position for unused_priority, position in self.queue)
+        self.__sweep_pixbuf = None
+        self.debug("Creating the thumbnails from %s to %s in a single pass for: %s",
+                   Gst.TIME_ARGS(self.__sweep_position), Gst.TIME_ARGS(self.__sweep_stop),
+                   path_from_uri(self.uri))
+        # Don't wait for the clock, the thumbnails are created as fast as
+        # they are decoded.
+        self.gdkpixbufsink.props.sync = False
+        self.cpu_usage_tracker.reset()
+        self._seek_sweep()
+
+    def _seek_sweep(self):
+        """Seeks to the part of the range not swept yet.
+
+        The pipeline is played when the seek completes.
+        """
+        self.pipeline.seek(1.0,
+                           Gst.Format.TIME,
+                           Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE,
+                           Gst.SeekType.SET, self.__sweep_position,
+                           Gst.SeekType.SET, self.__sweep_stop)
+
+    def _sweep_frame(self, pixbuf, timestamp):
+        """Fills the queued positions showing the specified swept frame.
+
+        The queued positions are not aligned to THUMB_PERIOD when the clip
+        is trimmed, so each one gets the frame an accurate seek to it
+        would produce, that is the last frame starting at or before it.
+
+        Args:
+            pixbuf (GdkPixbuf.Pixbuf): The frame.
+            timestamp (int): The stream time of the frame, in nanoseconds.
+        """
+        positions = self.__sweep_positions
+        while positions and positions[0] <= timestamp:
+            position = positions.pop(0)
+            if position == timestamp or not self.__sweep_pixbuf:
+                self._fill_swept_position(position, pixbuf)
+            else:
+                self._fill_swept_position(position, self.__sweep_pixbuf)
+        self.__sweep_pixbuf = pixbuf
+        if positions:
+            self.__sweep_position = positions[0]
+
+    def _fill_swept_position(self, position, pixbuf):
+        if position not in self.thumb_cache:
+            self.thumb_cache[position] = pixbuf
+        self._set_pixbuf(pixbuf, position)
+
+    def __throttle_sweep(self):
+        """Pauses the sweep for a while if the CPU usage is too high."""
+        if self.cpu_usage_tracker.usage() < self._max_cpu_usage:
+            return
+
+        self.log("Thumbnailing paused for %.1f ms for `%s`",
+                 self.interval, path_from_uri(self.uri))
+        self.__sweep_throttled = True
+        self.pipeline.set_state(Gst.State.PAUSED)
+        self.__thumb_cb_id = GLib.timeout_add(self.interval,
+                                              self.__resume_sweep_cb,
+                                              priority=GLib.PRIORITY_LOW)
+
+    def __resume_sweep_cb(self):
+        self.__thumb_cb_id = 0
+        self.__sweep_throttled = False
+        self.cpu_usage_tracker.reset()
+        self.pipeline.set_state(Gst.State.PLAYING)
+        return False
+
+    def _sweep_done(self):
+        """Goes back to seeking for the thumbs still missing, if any."""
+        self.debug("Single pass complete for: %s", path_from_uri(self.uri))
+        self.__sweeping = False
+        # The positions after the last frame show the last frame.
+        if self.__sweep_pixbuf:
+            for position in self.__sweep_positions:
+                self._fill_swept_position(position, self.__sweep_pixbuf)
+        self.__sweep_positions = []
+        self.__sweep_pixbuf = None
+        self.__swept_ranges.append((self.__sweep_start, self.__sweep_stop))
+        self._set_queue([position for unused_priority, position in self.queue
+                         if position not in self.thumb_cache])
+        self.pipeline.set_state(Gst.State.PAUSED)
+        self._schedule_next_thumb_generation()
+
     def _start_thumbnailing_cb(self):
         if not self.__start_id:
             # Can happen if stopGeneration is called because the clip has been
@@ -705,7 +1446,7 @@ class AssetPreviewer(Previewer, Loggable):
         self.__thumb_cb_id = 0
 
         try:
-            self.position = self.queue.pop(0)
+            unused_priority, self.position = heapq.heappop(self.queue)
         except IndexError:
             # The queue is empty. Can happen if _update_thumbnails
             # has been called in the meanwhile.
@@ -752,18 +1493,37 @@ class AssetPreviewer(Previewer, Loggable):
             # We got a thumbnail pixbuf.
             struct = message.get_structure()
             struct_name = struct.get_name()
-            if struct_name == "preroll-pixbuf":
+            if struct_name == "preroll-pixbuf" and not self.__sweeping:
                 pixbuf = struct.get_value("pixbuf")
                 self.thumb_cache[self.position] = pixbuf
                 self._set_pixbuf(pixbuf, self.position)
                 self.position = -1
+            elif struct_name == "pixbuf" and self.__sweeping:
+                self._sweep_frame(struct.get_value("pixbuf"),
+                                  struct.get_value("stream-time"))
+                self.__throttle_sweep()
         elif message.src == self.pipeline and \
                 message.type == Gst.MessageType.ASYNC_DONE:
             if self.position >= 0:
                 self.warning("Thumbnail generation failed at %s", self.position)
                 self.failures.add(self.position)
                 self.position = -1
-            self._schedule_next_thumb_generation()
+
+            if self.__sweeping:
+                if self.__sweep_seek_pending:
+                    # The pipeline has been brought back from READY,
+                    # continue where the sweep has been interrupted.
+                    self.__sweep_seek_pending = False
+                    self._seek_sweep()
+                elif not self.__sweep_throttled:
+                    self.pipeline.set_state(Gst.State.PLAYING)
+            elif self._should_sweep():
+                self._start_sweep()
+            else:
+                self._schedule_next_thumb_generation()
+        elif message.src == self.pipeline and \
+                message.type == Gst.MessageType.EOS and self.__sweeping:
+            self._sweep_done()
         elif message.type == Gst.MessageType.STREAM_COLLECTION and isinstance(message.src, GES.Timeline):
             # Make sure we only work with the video track when thumbnailing
             # nested timelines.
@@ -787,6 +1547,10 @@ class AssetPreviewer(Previewer, Loggable):
         return False
 
     def start_generation(self):
+        if self.__start_id:
+            # Already waiting for the UI to become idle.
+            return
+
         self.debug("Waiting for UI to become idle for: %s",
                    path_from_uri(self.uri))
         self.__start_id = GLib.idle_add(self._start_thumbnailing_cb,
@@ -813,20 +1577,43 @@ class AssetPreviewer(Previewer, Loggable):
             self.pipeline.set_state(Gst.State.NULL)
             self.pipeline.get_state(Gst.CLOCK_TIME_NONE)
             self.pipeline = None
+        self.__sweeping = False
+        self.__sweep_throttled = False
+        self.__sweep_seek_pending = False
+        self.__sweep_positions = []
+        self.__sweep_pixbuf = None
 
         self.emit("done")
 
     def pause_generation(self):
+        if self.__start_id:
+            # Don't start while paused, resuming schedules it again.
+            GLib.source_remove(self.__start_id)
+            self.__start_id = None
+
+        if self.__sweeping:
+            if self.__thumb_cb_id:
+                # Don't resume the sweep while paused.
+                GLib.source_remove(self.__thumb_cb_id)
+                self.__thumb_cb_id = 0
+            self.__sweep_throttled = False
+            # Going to READY loses the position.
+            self.__sweep_seek_pending = True
+
         if self.pipeline:
             self.pipeline.set_state(Gst.State.READY)
 
 
 class VideoPreviewer(Gtk.Layout, AssetPreviewer, Zoomable):
-    """A video previewer widget, drawing thumbnails.
+    """A video previewer widget, drawing a filmstrip of thumbnails.
+
+    Only the thumbnails in the clipped region are drawn, straight out of
+    the cache, so no widget is created for each thumbnail. Only the
+    thumbnails around the viewport are queued, the others are queued when
+    their area is drawn.
 
     Attributes:
         ges_elem (GES.VideoSource): The previewed element.
-        thumbs (dict): Maps (quantized) times to the managed Thumbnail widgets.
     """
 
     # We could define them in Previewer, but for some reason they are ignored.
@@ -840,7 +1627,15 @@ class VideoPreviewer(Gtk.Layout, AssetPreviewer, Zoomable):
         self.get_style_context().add_class("VideoPreviewer")
 
         self.ges_elem = ges_elem
-        self.thumbs = {}
+        self._selected = False
+        # Maps the positions in the asset to positions in the timeline.
+        self._timeline_positions = {}
+        self._interval = THUMB_PERIOD
+        # The timeline range for which the thumbnails have been listed.
+        self._thumbs_range = (0, 0)
+        # The timeline range drawn last time, if not listed.
+        self._drawn_range = None
+        self.__update_id = 0
 
         # Connect signals and fire things up
         self.ges_elem.connect("notify::in-point", self._inpoint_changed_cb)
@@ -849,13 +1644,8 @@ class VideoPreviewer(Gtk.Layout, AssetPreviewer, Zoomable):
         self.connect("notify::height-request", self._height_changed_cb)
 
     def set_selected(self, selected):
-        if selected:
-            opacity = 0.5
-        else:
-            opacity = 1.0
-
-        for thumb in self.get_children():
-            thumb.props.opacity = opacity
+        self._selected = selected
+        self.queue_draw()
 
     def refresh(self):
         """Recreates the thumbnails cache."""
@@ -864,56 +1654,136 @@ class VideoPreviewer(Gtk.Layout, AssetPreviewer, Zoomable):
         self._update_thumbnails()
 
     def _update_thumbnails(self):
-        """Updates the thumbnail widgets for the clip at the current zoom."""
+        """Updates the thumbnails to be drawn for the clip at the current zoom."""
         if not self.thumb_width or not self.ges_elem.get_track() or not self.ges_elem.props.active:
             # The thumb_width will be available when pipeline has been started
             return
 
-        thumbs = {}
         queue = []
         interval = self.thumb_interval(self.thumb_width)
+        self._interval = interval
+        self._timeline_positions = {}
 
-        y = (self.props.height_request - self.thumb_height) / 2
         clip = self.ges_elem.get_parent()
-        for position in range(clip.props.start, clip.props.start + clip.props.duration, interval):
-            x = Zoomable.ns_to_pixel(position)
-
+        start, end = self._visible_thumbs_range(clip, interval)
+        self._thumbs_range = (start, end)
+        for timeline_position in range(start, end, interval):
             # Convert position in the timeline to the internal position in the source element
-            position = clip.get_internal_time_from_timeline_time(self.ges_elem, position)
-            try:
-                thumb = self.thumbs.pop(position)
-                self.move(thumb, x, y)
-            except KeyError:
-                thumb = Thumbnail(self.thumb_width, self.thumb_height)
-                self.put(thumb, x, y)
-
-            thumbs[position] = thumb
-            if position in self.thumb_cache:
-                pixbuf = self.thumb_cache[position]
-                thumb.set_from_pixbuf(pixbuf)
-                thumb.set_visible(True)
-            else:
-                if position not in self.failures and position != self.position:
-                    queue.append(position)
-        for thumb in self.thumbs.values():
-            self.remove(thumb)
-        self.thumbs = thumbs
-        self.queue = queue
+            position = clip.get_internal_time_from_timeline_time(self.ges_elem, timeline_position)
+            self._timeline_positions[position] = timeline_position
+            if position not in self.thumb_cache and \
+                    position not in self.failures and position != self.position:
+                queue.append(position)
+        self._set_queue(queue)
+        self.queue_draw()
         if queue:
             self.become_controlled()
 
+    def _visible_thumbs_range(self, clip, interval):
+        """Gets the timeline range of the thumbs to be listed.
+
+        Returns:
+            (int, int): The start, aligned to the thumbs of the clip, and
+                the end of the range.
+        """
+        clip_start = clip.props.start
+        clip_end = clip_start + clip.props.duration
+        start, end = Previewer.manager.viewport
+        if end == Gst.CLOCK_TIME_NONE:
+            # The viewport is not known.
+            return clip_start, clip_end
+
+        margin = (end - start) * THUMBS_VIEWPORT_MARGIN
+        start -= margin
+        end += margin
+        if self._drawn_range:
+            start = min(start, self._drawn_range[0])
+            end = max(end, self._drawn_range[1])
+            self._drawn_range = None
+        start = max(clip_start, start)
+        end = min(clip_end, end)
+        return clip_start + quantize(start - clip_start, interval), end
+
+    def __update_thumbnails_cb(self):
+        self.__update_id = 0
+        self._update_thumbnails()
+        return False
+
+    def do_draw(self, context):
+        if not self.thumb_width or not self.ges_elem.get_track() or not self.ges_elem.props.active:
+            # Nothing to draw.
+            return
+
+        rect = Gdk.cairo_get_clip_rectangle(context)[1]
+        clip = self.ges_elem.get_parent()
+        clip_start = clip.props.start
+        clip_end = clip_start + clip.props.duration
+        clip_x = self.ns_to_pixel(clip_start)
+        interval = self._interval
+
+        # The range of the thumbnails overlapping the clipped rect.
+        first = clip_start + quantize(self.pixel_to_ns(max(0, rect.x - self.thumb_width)), interval)
+        last = min(clip_end, clip_start + self.pixel_to_ns(rect.x + rect.width) + 1)
+        if first < self._thumbs_range[0] or last > self._thumbs_range[1]:
+            # The thumbs of the drawn area have not been listed yet.
+            self._drawn_range = (first, last)
+            if not self.__update_id:
+                self.__update_id = GLib.idle_add(self.__update_thumbnails_cb,
+                                                 priority=GLib.PRIORITY_LOW)
+
+        y = (self.props.height_request - self.thumb_height) / 2
+        context.set_operator(cairo.OPERATOR_OVER)
+        for timeline_position in range(first, last, interval):
+            position = clip.get_internal_time_from_timeline_time(self.ges_elem, timeline_position)
+            if position not in self.thumb_cache:
+                continue
+
+            x = self.ns_to_pixel(timeline_position) - clip_x
+            Gdk.cairo_set_source_pixbuf(context, self._get_thumb(position, interval), x, y)
+            if self._selected:
+                context.paint_with_alpha(0.5)
+            else:
+                context.paint()
+
+    def _get_thumb(self, position, interval):
+        """Gets the cached thumbnail, out of a filmstrip tile if zoomed out."""
+        if interval >= TILES_MIN_INTERVAL:
+            pixbuf = self.thumb_cache.get_tile_thumb(position, interval,
+                                                     self.asset.get_duration())
+            if pixbuf:
+                return pixbuf
+
+        return self.thumb_cache[position]
+
+    def _thumb_priority(self, position):
+        """Gets the priority of the thumb at the specified position.
+
+        The visible thumbs come first, then the thumbs out of view. In both
+        groups, the thumbs closer to the playhead come first.
+        """
+        timeline_position = self._timeline_positions.get(position, position)
+        start, end = Previewer.manager.viewport
+        visible = timeline_position + self._interval > start and timeline_position < end
+        distance = abs(timeline_position - Previewer.manager.playhead_position)
+        return (0 if visible else 1, distance)
+
     def _set_pixbuf(self, pixbuf, position):
-        """Sets the pixbuf for the thumbnail at the expected position."""
+        """Redraws the area of the thumbnail at the specified position."""
         try:
-            thumb = self.thumbs[position]
+            timeline_position = self._timeline_positions[position]
         except KeyError:
             # Can happen because we don't stop the pipeline before
             # updating the thumbnails in _update_thumbnails.
             return
-        thumb.set_from_pixbuf(pixbuf)
+        clip = self.ges_elem.get_parent()
+        x = self.ns_to_pixel(timeline_position) - self.ns_to_pixel(clip.props.start)
+        self.queue_draw_area(x, 0, pixbuf.props.width, self.get_allocated_height())
 
     def release(self):
         """Stops preview generation and cleans the object."""
+        if self.__update_id:
+            GLib.source_remove(self.__update_id)
+            self.__update_id = 0
         self.stop_generation()
         Zoomable.__del__(self)
 
@@ -944,48 +1814,432 @@ class Thumbnail(Gtk.Image):
         self.props.height_request = height
 
 
+class MemoryLRUCache(Loggable):
+    """LRU cache of the previews of assets, limited by their size in memory.
+
+    The items are keyed by the URI of the asset and by a key identifying
+    the item in the asset. Subclasses define how the size of an item is
+    computed.
+
+    Attributes:
+        name (str): The name of the cache, for the logs.
+        max_size (int): The max size of the kept items, in bytes.
+        size (int): The size of the kept items, in bytes.
+        hits (int): The number of lookups which found an item.
+        misses (int): The number of lookups which did not find an item.
+    """
+
+    name = None
+
+    def __init__(self, max_size):
+        Loggable.__init__(self)
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        # Maps (uri, key) to items, the most recently used last.
+        self._items = collections.OrderedDict()
+
+    @staticmethod
+    def item_size(item):
+        """Returns the size of the specified item, in bytes."""
+        raise NotImplementedError()
+
+    def get(self, uri, key):
+        """Gets the item for the specified asset and key, if any.
+
+        Returns:
+            object: The item or None if it's not in the cache.
+        """
+        item_key = (uri, key)
+        item = self._items.get(item_key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._items.move_to_end(item_key)
+        return item
+
+    def add(self, uri, key, item):
+        """Adds an item, evicting the least recently used ones if needed."""
+        item_key = (uri, key)
+        old_item = self._items.pop(item_key, None)
+        if old_item is not None:
+            self.size -= self.item_size(old_item)
+
+        self._items[item_key] = item
+        self.size += self.item_size(item)
+        while self.size > self.max_size and len(self._items) > 1:
+            unused_key, evicted = self._items.popitem(last=False)
+            self.size -= self.item_size(evicted)
+
+    def remove_uri(self, uri):
+        """Removes the items of the specified asset."""
+        for item_key in [item_key for item_key in self._items if item_key[0] == uri]:
+            self.size -= self.item_size(self._items.pop(item_key))
+
+    def log_stats(self):
+        """Logs the efficiency of the cache."""
+        lookups = self.hits + self.misses
+        self.debug("%s: %d hits, %d misses (%.1f%%), %d items, %d bytes",
+                   self.name, self.hits, self.misses,
+                   100 * self.hits / lookups if lookups else 0,
+                   len(self._items), self.size)
+
+
+class DecodedThumbnailsCache(MemoryLRUCache):
+    """LRU cache of decoded thumbnails, keyed by the asset and position."""
+
+    name = "Decoded thumbnails"
+
+    @staticmethod
+    def item_size(item):
+        return item.get_byte_length()
+
+
+class WaveformTilesCache(MemoryLRUCache):
+    """LRU cache of rendered waveform tiles.
+
+    The tiles are cairo.ImageSurface objects, keyed by the wave file and
+    by the (zoom level, tile index, rate, height) they have been rendered for.
+    """
+
+    name = "Waveform tiles"
+
+    @staticmethod
+    def item_size(item):
+        return item.get_stride() * item.get_height()
+
+
+class ThumbnailWriter(threading.Thread, Loggable):
+    """Thread encoding the thumbnails of a store and saving them in batches.
+
+    The thumbnails are queued in a bounded queue, so adding thumbnails
+    faster than they can be saved blocks until there is room.
+
+    Attributes:
+        store (ThumbnailStore): The store whose thumbnails are saved.
+    """
+
+    def __init__(self, store):
+        threading.Thread.__init__(self, name="ThumbnailWriter", daemon=True)
+        Loggable.__init__(self)
+        self.store = store
+        self._queue = queue.Queue(maxsize=THUMBS_WRITER_QUEUE_SIZE)
+
+    def put(self, table, row_key, pixbuf):
+        """Queues a pixbuf to be saved in the specified table.
+
+        Args:
+            table (str): The table where to insert the JPEG data.
+            row_key (tuple): The primary key of the row.
+            pixbuf (GdkPixbuf.Pixbuf): The image to be saved.
+        """
+        self._queue.put((table, row_key, pixbuf))
+
+    def flush(self):
+        """Waits until all the queued pixbufs are saved.
+
+        Returns:
+            bool: Whether the pixbufs have been saved before the timeout.
+        """
+        barrier = threading.Event()
+        try:
+            self._queue.put(barrier, timeout=THUMBS_WRITER_FLUSH_TIMEOUT)
+        except queue.Full:
+            self.error("Timed out waiting for the thumbnails writer")
+            return False
+
+        if not barrier.wait(THUMBS_WRITER_FLUSH_TIMEOUT):
+            self.error("Timed out waiting for the thumbnails to be saved")
+            return False
+
+        return True
+
+    def run(self):
+        # The connection can be used only in the thread which created it.
+        db = sqlite3.connect(self.store.dbfile)
+        db.execute("PRAGMA synchronous=NORMAL")
+        batch = []
+        while True:
+            barrier = None
+            try:
+                item = self._queue.get(timeout=THUMBS_WRITER_IDLE_TIMEOUT if batch else None)
+            except queue.Empty:
+                pass
+            else:
+                if isinstance(item, threading.Event):
+                    barrier = item
+                else:
+                    batch.append(item)
+                    if len(batch) < THUMBS_WRITER_BATCH_SIZE:
+                        continue
+
+            # pylint: disable=broad-except
+            try:
+                self.__save(db, batch)
+            except Exception as e:
+                # Keep running, otherwise adding thumbnails blocks forever.
+                self.error("Failed saving %d thumbnails: %s", len(batch), e)
+            finally:
+                batch = []
+                if barrier:
+                    barrier.set()
+
+    def __save(self, db, batch):
+        """Encodes the pixbufs in the batch and inserts them in a transaction."""
+        if not batch:
+            return
+
+        try:
+            rows = collections.defaultdict(list)
+            for table, row_key, pixbuf in batch:
+                try:
+                    success, jpeg = pixbuf.save_to_bufferv("jpeg", ["quality", None], ["90"])
+                except GLib.Error as e:
+                    self.warning("JPEG compression failed: %s", e)
+                    continue
+                if not success:
+                    self.warning("JPEG compression failed")
+                    continue
+                rows[table].append((*row_key, sqlite3.Binary(jpeg)))
+
+            try:
+                for table, table_rows in rows.items():
+                    placeholders = ", ".join("?" * len(table_rows[0]))
+                    db.executemany("INSERT OR REPLACE INTO %s VALUES (%s)" % (table, placeholders),
+                                   table_rows)
+                db.commit()
+                self.log("Saved %d thumbnails", len(batch))
+            except sqlite3.Error as e:
+                self.warning("Failed saving %d thumbnails: %s", len(batch), e)
+                db.rollback()
+        finally:
+            # Don't keep the pixbufs in memory forever if they failed.
+            self.store.saved(batch)
+
+
+class ThumbnailStore(Loggable):
+    """Database storing the thumbnails of all the assets.
+
+    Uses a single sqlite3 database in WAL mode, so the number of open
+    files does not grow with the number of assets. The added thumbnails
+    are encoded and inserted in batches by a ThumbnailWriter thread, and
+    until then they are kept decoded in memory.
+
+    Besides the thumbnails, it stores filmstrip tiles, each composed of
+    the thumbnails displayed next to each other at a specific zoom level.
+
+    Attributes:
+        dbfile (str): The path of the database file.
+    """
+
+    # The stores by database file path.
+    stores_by_path = {}
+
+    def __init__(self, dbfile):
+        Loggable.__init__(self)
+        self.dbfile = dbfile
+        self.log("Storing thumbs in %s", dbfile)
+        self._db = sqlite3.connect(dbfile)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode this is still safe against corruption.
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS Thumbs "
+                         "(Asset TEXT NOT NULL, "
+                         " Time INTEGER NOT NULL, "
+                         " Jpeg BLOB NOT NULL, "
+                         " PRIMARY KEY (Asset, Time))")
+        self._db.execute("CREATE TABLE IF NOT EXISTS Tiles "
+                         "(Asset TEXT NOT NULL, "
+                         " Interval INTEGER NOT NULL, "
+                         " Phase INTEGER NOT NULL, "
+                         " Idx INTEGER NOT NULL, "
+                         " Jpeg BLOB NOT NULL, "
+                         " PRIMARY KEY (Asset, Interval, Phase, Idx))")
+        # When the thumbnails of the assets have been used last.
+        self._db.execute("CREATE TABLE IF NOT EXISTS Accessed "
+                         "(Asset TEXT NOT NULL PRIMARY KEY, "
+                         " Time REAL NOT NULL)")
+        self._db.commit()
+        # Maps (table, row key) to the pixbufs waiting to be saved.
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._writer = ThumbnailWriter(self)
+        self._writer.start()
+
+    @classmethod
+    def get(cls):
+        """Gets the store in the current cache directory."""
+        thumbs_dir = xdg_cache_home("thumbs")
+        thumbs_cache_dir = os.path.join(thumbs_dir, "v2")
+
+        if not os.path.exists(thumbs_cache_dir):
+            os.makedirs(thumbs_cache_dir)
+            GLib.idle_add(delete_all_files_in_dir, thumbs_dir)
+
+        dbfile = os.path.join(thumbs_cache_dir, "thumbs.db")
+        if dbfile not in cls.stores_by_path:
+            cls.stores_by_path[dbfile] = ThumbnailStore(dbfile)
+        return cls.stores_by_path[dbfile]
+
+    @classmethod
+    def commit_all(cls):
+        """Waits until the thumbnails added to all the stores are saved."""
+        for store in cls.stores_by_path.values():
+            store.commit()
+
+    def positions(self, key):
+        """Gets the positions for which thumbnails exist for an asset.
+
+        Args:
+            key (str): The key identifying the asset.
+        """
+        rows = self._db.execute("SELECT Time FROM Thumbs WHERE Asset = ?", (key,))
+        positions = {row[0] for row in rows}
+        with self._pending_lock:
+            positions.update(row_key[1] for table, row_key in self._pending
+                             if table == "Thumbs" and row_key[0] == key)
+        return positions
+
+    def touch(self, key):
+        """Marks the thumbnails of an asset as recently used."""
+        self._db.execute("INSERT OR REPLACE INTO Accessed VALUES (?, ?)",
+                         (key, time.time()))
+        self._db.commit()
+
+    def get_pending_pixbuf(self, key, position):
+        """Gets a thumbnail which has not been saved yet, or None."""
+        with self._pending_lock:
+            return self._pending.get(("Thumbs", (key, position)))
+
+    def get_jpeg(self, key, position):
+        """Gets the JPEG data of a saved thumbnail, or None if missing."""
+        row = self._db.execute("SELECT Jpeg FROM Thumbs WHERE Asset = ? AND Time = ?",
+                               (key, position)).fetchone()
+        return row[0] if row else None
+
+    def get_any_jpeg(self, key):
+        """Gets the JPEG data of one of the saved thumbnails of an asset, if any."""
+        row = self._db.execute("SELECT Jpeg FROM Thumbs WHERE Asset = ? LIMIT 1",
+                               (key,)).fetchone()
+        return row[0] if row else None
+
+    def add(self, key, position, pixbuf):
+        """Adds or replaces a thumbnail, to be saved in the background."""
+        self.__add("Thumbs", (key, position), pixbuf)
+
+    def get_pending_tile(self, key, interval, phase, index):
+        """Gets a filmstrip tile which has not been saved yet, or None."""
+        with self._pending_lock:
+            return self._pending.get(("Tiles", (key, interval, phase, index)))
+
+    def get_tile_jpeg(self, key, interval, phase, index):
+        """Gets the JPEG data of a saved filmstrip tile, or None if missing."""
+        row = self._db.execute("SELECT Jpeg FROM Tiles WHERE Asset = ? AND Interval = ?"
+                               " AND Phase = ? AND Idx = ?",
+                               (key, interval, phase, index)).fetchone()
+        return row[0] if row else None
+
+    def add_tile(self, key, interval, phase, index, pixbuf):
+        """Adds or replaces a filmstrip tile, to be saved in the background."""
+        self.__add("Tiles", (key, interval, phase, index), pixbuf)
+
+    def __add(self, table, row_key, pixbuf):
+        with self._pending_lock:
+            self._pending[(table, row_key)] = pixbuf
+        self._writer.put(table, row_key, pixbuf)
+
+    def saved(self, batch):
+        """Forgets the pending pixbufs which have been saved by the writer.
+
+        Args:
+            batch (List[tuple]): The saved (table, row key, pixbuf) items.
+        """
+        with self._pending_lock:
+            for table, row_key, pixbuf in batch:
+                # The pixbuf might have been replaced in the meantime.
+                if self._pending.get((table, row_key)) is pixbuf:
+                    del self._pending[(table, row_key)]
+
+    def remove(self, key):
+        """Removes the thumbnails and the filmstrip tiles of an asset."""
+        self.commit()
+        self._db.execute("DELETE FROM Thumbs WHERE Asset = ?", (key,))
+        self._db.execute("DELETE FROM Tiles WHERE Asset = ?", (key,))
+        self._db.commit()
+
+    def commit(self):
+        """Waits until the added thumbnails and tiles are saved."""
+        self._writer.flush()
+
+    def import_legacy_db(self, key, dbfile):
+        """Moves the thumbnails from a legacy per-asset database file.
+
+        Args:
+            key (str): The key identifying the asset.
+            dbfile (str): The path to the legacy database file.
+        """
+        self.debug("Migrating thumbs from %s", dbfile)
+        self.commit()
+        self._db.execute("ATTACH DATABASE ? AS legacy", (dbfile,))
+        try:
+            self._db.execute("INSERT OR IGNORE INTO Thumbs "
+                             "SELECT ?, Time, Jpeg FROM legacy.Thumbs", (key,))
+            self._db.commit()
+        except sqlite3.DatabaseError as e:
+            self.warning("Failed migrating thumbs from %s: %s", dbfile, e)
+            self._db.rollback()
+        finally:
+            self._db.execute("DETACH DATABASE legacy")
+
+        os.remove(dbfile)
+
+
 class ThumbnailCache(Loggable):
     """Cache for the thumbnails of an asset.
 
-    Uses a separate sqlite3 database for each asset.
+    The thumbnails of all the assets are stored in the same ThumbnailStore.
+    The recently used thumbnails are kept decoded in memory, in a cache
+    shared by all assets.
+
+    Attributes:
+        key (str): The key identifying the asset in the store.
     """
 
     # The cache of caches.
     caches_by_uri = {}
+    # The recently used decoded thumbnails of all the assets.
+    decoded_thumbs = DecodedThumbnailsCache(THUMBS_MEMORY_CACHE_SIZE)
 
     def __init__(self, uri):
         Loggable.__init__(self)
         self.uri = uri
-        self.dbfile = self.dbfile_name(uri)
-        self.log("Caching thumbs for %s in %s", uri, self.dbfile)
-        self._db = sqlite3.connect(self.dbfile)
-        self._cur = self._db.cursor()
-        self._cur.execute("CREATE TABLE IF NOT EXISTS Thumbs "
-                          "(Time INTEGER NOT NULL PRIMARY KEY, "
-                          " Jpeg BLOB NOT NULL)")
+        self.key = self.cache_key(uri)
+        self._store = ThumbnailStore.get()
+        self.log("Caching thumbs for %s as %s", uri, self.key)
+
+        legacy_dbfile = self.legacy_dbfile_name(uri)
+        if os.path.exists(legacy_dbfile):
+            self._store.import_legacy_db(self.key, legacy_dbfile)
+
         # The cached (width, height) of the images.
         self._image_size = (0, 0)
         # The cached positions available in the database.
-        self.positions = self.__existing_positions()
-        # The ID of the autosave event.
-        self.__autosave_id = None
+        self.positions = self._store.positions(self.key)
+        self._store.touch(self.key)
 
-    def __existing_positions(self):
-        self._cur.execute("SELECT Time FROM Thumbs")
-        return {row[0] for row in self._cur.fetchall()}
+    @staticmethod
+    def cache_key(uri):
+        """Returns the key identifying the specified URI in the store."""
+        return cache_filename(Gst.uri_get_location(uri), "thumbs")
 
     @staticmethod
-    def dbfile_name(uri):
-        """Returns the cache file path for the specified URI."""
+    def legacy_dbfile_name(uri):
+        """Returns the path of the obsolete per-asset cache file."""
         filename = gen_filename(Gst.uri_get_location(uri), "db")
-        thumbs_dir = xdg_cache_home("thumbs")
-        thumbs_cache_dir = os.path.join(thumbs_dir, "v1")
-
-        if not os.path.exists(thumbs_cache_dir):
-            os.makedirs(thumbs_cache_dir)
-            GLib.idle_add(delete_all_files_in_dir, thumbs_dir)
-
-        return os.path.join(thumbs_cache_dir, filename)
+        return os.path.join(xdg_cache_home("thumbs"), "v1", filename)
 
     @classmethod
     def update_caches(cls):
@@ -996,11 +2250,12 @@ class ThumbnailCache(Loggable):
         """
         changed_files_uris = []
         for uri, cache in cls.caches_by_uri.items():
-            dbfile = cls.dbfile_name(uri)
-            if cache.dbfile != dbfile:
+            if cache.key != cls.cache_key(uri):
                 changed_files_uris.append(uri)
         for uri in changed_files_uris:
-            del cls.caches_by_uri[uri]
+            cache = cls.caches_by_uri.pop(uri)
+            cache.remove()
+            cls.decoded_thumbs.remove_uri(uri)
         return changed_files_uris
 
     @classmethod
@@ -1036,10 +2291,9 @@ class ThumbnailCache(Loggable):
             List[int]: The width and height of the images in the cache.
         """
         if self._image_size[0] == 0:
-            self._cur.execute("SELECT * FROM Thumbs LIMIT 1")
-            row = self._cur.fetchone()
-            if row:
-                pixbuf = self.__pixbuf_from_row(row)
+            jpeg = self._store.get_any_jpeg(self.key)
+            if jpeg:
+                pixbuf = self.__pixbuf_from_jpeg(jpeg)
                 self._image_size = (pixbuf.get_width(), pixbuf.get_height())
         return self._image_size
 
@@ -1053,64 +2307,107 @@ class ThumbnailCache(Loggable):
         return self[position]
 
     @staticmethod
-    def __pixbuf_from_row(row):
-        """Returns the GdkPixbuf.Pixbuf from the specified row."""
-        jpeg = row[1]
+    def __pixbuf_from_jpeg(jpeg):
+        """Returns the GdkPixbuf.Pixbuf from the specified JPEG data."""
         loader = GdkPixbuf.PixbufLoader.new()
         loader.write(jpeg)
         loader.close()
         pixbuf = loader.get_pixbuf()
         return pixbuf
 
+    def get_tile_thumb(self, position, interval, duration):
+        """Gets the thumbnail out of the filmstrip tile containing it.
+
+        The tiles are composed of THUMBS_PER_TILE thumbnails spaced at the
+        specified interval, so a single JPEG is decoded for all of them.
+        A tile is created when all its thumbnails are available.
+
+        Args:
+            position (int): The position of the thumbnail, in nanoseconds.
+            interval (int): The interval between the displayed thumbnails.
+            duration (int): The duration of the asset, in nanoseconds.
+
+        Returns:
+            GdkPixbuf.Pixbuf: The thumbnail or None if the tile is missing.
+        """
+        phase = position % interval
+        span = THUMBS_PER_TILE * interval
+        index = (position - phase) // span
+        tile_start = phase + index * span
+        tile_id = (interval, phase, index)
+
+        tile = self.decoded_thumbs.get(self.uri, tile_id)
+        if tile is None:
+            tile = self._store.get_pending_tile(self.key, *tile_id)
+        if tile is None:
+            jpeg = self._store.get_tile_jpeg(self.key, *tile_id)
+            if jpeg:
+                tile = self.__pixbuf_from_jpeg(jpeg)
+            else:
+                positions = range(tile_start, min(tile_start + span, duration), interval)
+                if not all(tile_position in self.positions for tile_position in positions):
+                    return None
+
+                tile = self.__compose_tile(positions)
+                self._store.add_tile(self.key, *tile_id, tile)
+            self.decoded_thumbs.add(self.uri, tile_id, tile)
+
+        width, height = self.image_size
+        column = (position - tile_start) // interval
+        return tile.new_subpixbuf(column * width, 0, width, height)
+
+    def __compose_tile(self, positions):
+        """Creates a filmstrip tile out of the thumbnails at the positions."""
+        width, height = self.image_size
+        tile = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8,
+                                    width * len(positions), height)
+        for column, position in enumerate(positions):
+            self[position].copy_area(0, 0, width, height, tile, column * width, 0)
+        return tile
+
     def __contains__(self, position):
         """Returns whether a row for the specified position exists in the DB."""
         return position in self.positions
 
     def __getitem__(self, position):
         """Gets the GdkPixbuf.Pixbuf for the specified position."""
-        self._cur.execute("SELECT * FROM Thumbs WHERE Time = ?", (position,))
-        row = self._cur.fetchone()
-        if not row:
+        if position not in self.positions:
             raise KeyError(position)
-        return self.__pixbuf_from_row(row)
 
-    def __setitem__(self, position, pixbuf):
-        """Sets a GdkPixbuf.Pixbuf for the specified position."""
-        success, jpeg = pixbuf.save_to_bufferv(
-            "jpeg", ["quality", None], ["90"])
-        if not success:
-            self.warning("JPEG compression failed")
-            return
-        blob = sqlite3.Binary(jpeg)
-        # Replace if a row with the same time already exists.
-        self._cur.execute("DELETE FROM Thumbs WHERE  time=?", (position,))
-        self._cur.execute("INSERT INTO Thumbs VALUES (?,?)", (position, blob,))
-        self.positions.add(position)
-        self._schedule_commit()
+        pixbuf = self.decoded_thumbs.get(self.uri, position)
+        if pixbuf:
+            return pixbuf
 
-    def _schedule_commit(self):
-        """Schedules an autosave at a random later time."""
-        if self.__autosave_id is not None:
-            # A commit is already scheduled.
-            return
-        # Save after some time, to avoid saving too often.
-        # Randomize to avoid concurrent disk writes.
-        random_time = random.randrange(10, 20)
-        self.__autosave_id = GLib.timeout_add_seconds(random_time, self._autosave_cb)
+        pixbuf = self._store.get_pending_pixbuf(self.key, position)
+        if pixbuf is None:
+            jpeg = self._store.get_jpeg(self.key, position)
+            if not jpeg:
+                raise KeyError(position)
+            pixbuf = self.__pixbuf_from_jpeg(jpeg)
+        self.decoded_thumbs.add(self.uri, position, pixbuf)
+        return pixbuf
 
-    def _autosave_cb(self):
-        """Handles the autosave event."""
-        try:
-            self.commit()
-        finally:
-            self.__autosave_id = None
-        # Stop calling me.
-        return False
+    def __setitem__(self, position, pixbuf):
+        """Sets a GdkPixbuf.Pixbuf for the specified position.
+
+        The pixbuf is encoded and saved in the background.
+        """
+        self._store.add(self.key, position, pixbuf)
+        self.positions.add(position)
+        self.decoded_thumbs.add(self.uri, position, pixbuf)
+        if self._image_size[0] == 0:
+            self._image_size = (pixbuf.get_width(), pixbuf.get_height())
 
     def commit(self):
-        """Saves the cache on disk (in the database)."""
-        self._db.commit()
+        """Waits until the added thumbnails are saved on disk."""
+        self._store.commit()
         self.log("Saved thumbnail cache file")
+        self.decoded_thumbs.log_stats()
+
+    def remove(self):
+        """Removes the thumbnails of the asset from the store."""
+        self._store.remove(self.key)
+        self.positions = set()
 
 
 def delete_all_files_in_dir(path):
@@ -1126,26 +2423,61 @@ def gen_filename(uri, extension):
     return "{}_{}_{}.{}".format(os.path.basename(uri), uri_hash, os.path.getmtime(uri), extension)
 
 
+def cache_filename(path, extension):
+    """Generates the cache filename for the specified file.
+
+    Depending on CacheKeys.by_content, the name depends only on the
+    contents of the file or on its location and modification time.
+    """
+    if CacheKeys.by_content:
+        try:
+            return "{}.{}".format(fingerprint_file(path), extension)
+        except OSError as e:
+            loggable.warning("previewers", "Failed fingerprinting %s: %s", path, e)
+    return gen_filename(path, extension)
+
+
 def get_wavefile_location_for_uri(uri):
     """Computes the URI where the wave.npy file should be stored."""
     if ProxyManager.is_proxy_asset(uri):
         uri = ProxyManager.get_target_uri(uri)
-    filename = gen_filename(Gst.uri_get_location(uri), "wave.npy")
+    filename = cache_filename(Gst.uri_get_location(uri), "wave.npy")
+    return os.path.join(get_waves_cache_dir(), filename)
+
+
+def get_loudness_location(wavefile):
+    """Computes the location of the loudness file next to the wave.npy file."""
+    return wavefile[:-len("wave.npy")] + "loudness.json"
+
+
+def get_waves_cache_dir():
+    """Gets the directory where the wave.npy files are stored."""
     waves_dir = xdg_cache_home("waves")
-    cache_dir = os.path.join(waves_dir, "v1")
+    cache_dir = os.path.join(waves_dir, "v3")
 
     if not os.path.exists(cache_dir):
         os.makedirs(cache_dir)
         GLib.idle_add(delete_all_files_in_dir, waves_dir)
+        for version in ("v1", "v2"):
+            GLib.idle_add(shutil.rmtree, os.path.join(waves_dir, version), True)
 
-    return os.path.join(cache_dir, filename)
+    return cache_dir
 
 
 class AudioPreviewer(Gtk.Layout, Previewer, Zoomable, Loggable):
-    """Audio previewer using the results from the "level" GStreamer element."""
+    """Audio previewer using the results from the "level" GStreamer element.
+
+    The waveform is drawn out of fixed-width tiles, shared by all the clips
+    of an asset, so scrolling renders only the newly exposed tiles.
+    """
 
     __gsignals__ = PREVIEW_GENERATOR_SIGNALS
 
+    # The recently rendered waveform tiles of all the assets.
+    waveform_tiles = WaveformTilesCache(WAVEFORM_TILES_MEMORY_SIZE)
+    # The displayed channel, or WAVEFORM_MIX or WAVEFORM_ALL_CHANNELS.
+    channel = WAVEFORM_MIX
+
     def __init__(self, ges_elem, max_cpu_usage):
         Gtk.Layout.__init__(self)
         Previewer.__init__(self, GES.TrackType.AUDIO, max_cpu_usage)
@@ -1156,19 +2488,17 @@ class AudioPreviewer(Gtk.Layout, Previewer, Zoomable, Loggable):
 
         self.pipeline = None
         self._wavebin = None
+        # Whether the pipeline is not synchronized to the clock, in which
+        # case it is paused whenever the CPU usage is too high.
+        self._offline = False
+        self._throttled = False
 
         self.ges_elem = ges_elem
 
-        self.samples = None
+        # The WaveformPeaks of the asset.
         self.peaks = None
-        self.surface = None
-        # The zoom level when self.surface has been created.
-        self._surface_zoom_level = 0
-        # The samples range used when self.surface has been created.
-        self._surface_start_ns = 0
-        self._surface_end_ns = 0
-        # The playback rate from last time the surface was updated.
-        self._rate = 1.0
+        # The file containing self.peaks.
+        self._peaks_file = None
 
         # Guard against malformed URIs
         self.wavefile = None
@@ -1181,36 +2511,33 @@ class AudioPreviewer(Gtk.Layout, Previewer, Zoomable, Loggable):
         """Discards the audio samples so they are recreated."""
         self.stop_generation()
 
-        self.samples = None
-        self.surface = None
+        self.peaks = None
         self.queue_draw()
 
         self.become_controlled()
 
     def _start_levels_discovery(self):
         filename = get_wavefile_location_for_uri(self._uri)
-        if os.path.exists(filename):
-            with open(filename, "rb") as samples:
-                self.samples = self._scale_samples(numpy.load(samples))
+        self._peaks_file = filename
+        loudness_file = get_loudness_location(filename)
+        if os.path.exists(filename) and os.path.exists(loudness_file):
+            self.peaks = WaveformPeaks.get(filename)
+            # Mark them as recently used, for the CacheManager.
+            os.utime(filename)
+            os.utime(loudness_file)
+            self._set_loudness_metas()
             self.queue_draw()
         else:
             self.wavefile = filename
             self._launch_pipeline()
 
-    @staticmethod
-    def _scale_samples(samples):
-        max_value = max(samples)
-        has_sound = max_value > 0.0001
-        if has_sound:
-            # TODO: The 65 value comes from the height of the widget.
-            #   It should not be hardcoded though. We can fix this
-            #   when we implement a waveform samples cache, because it's
-            #   wasteful if multiple clips backed by the same asset
-            #   keep their own samples copy.
-            factor = 65 / max_value
-            samples = samples * factor
-
-        return list(samples)
+    def _samples_scale(self, height):
+        """Gets the factor by which the shared samples are multiplied when drawn."""
+        has_sound = self.peaks.max_rms > 0.0001
+        if not has_sound:
+            return 1.0
+
+        return height / self.peaks.max_rms
 
     def _launch_pipeline(self):
         self.debug(
@@ -1218,14 +2545,21 @@ class AudioPreviewer(Gtk.Layout, Previewer, Zoomable, Loggable):
         self.pipeline = Gst.parse_launch("uridecodebin name=decode uri=" +
                                          self._uri + " ! waveformbin name=wave"
                                          " ! fakesink qos=false name=faked")
-        # This line is necessary so we can instantiate GstTranscoder's
-        # GstCpuThrottlingClock below.
-        Gst.ElementFactory.make("uritranscodebin", None)
-        clock = GObject.new(GObject.type_from_name("GstCpuThrottlingClock"))
-        clock.props.cpu_usage = self._max_cpu_usage
-        self.pipeline.use_clock(clock)
+        self._offline = Previewer.manager.offline_waveforms and Previewer.manager.idle
         faked = self.pipeline.get_by_name("faked")
-        faked.props.sync = True
+        if self._offline:
+            # Decode as fast as possible, the pipeline is paused by the
+            # PreviewGeneratorManager when the CPU usage is too high.
+            self.debug("Extracting the waveforms offline")
+            faked.props.sync = False
+        else:
+            # This line is necessary so we can instantiate GstTranscoder's
+            # GstCpuThrottlingClock below.
+            Gst.ElementFactory.make("uritranscodebin", None)
+            clock = GObject.new(GObject.type_from_name("GstCpuThrottlingClock"))
+            clock.props.cpu_usage = self._max_cpu_usage
+            self.pipeline.use_clock(clock)
+            faked.props.sync = True
         self._wavebin = self.pipeline.get_by_name("wave")
         asset = self.ges_elem.get_asset().get_filesource_asset()
         self._wavebin.props.uri = asset.get_id()
@@ -1238,7 +2572,16 @@ class AudioPreviewer(Gtk.Layout, Previewer, Zoomable, Loggable):
 
     def _prepare_samples(self):
         self._wavebin.finalize()
-        self.samples = self._scale_samples(self._wavebin.samples)
+        WaveformPeaks.forget(self.wavefile)
+        self.waveform_tiles.remove_uri(self.wavefile)
+        self.peaks = WaveformPeaks.get(self.wavefile)
+        self._set_loudness_metas()
+
+    def _set_loudness_metas(self):
+        results = load_loudness(get_loudness_location(self._peaks_file))
+        if results:
+            asset = self.ges_elem.get_asset().get_filesource_asset()
+            set_loudness_metas(asset, results)
 
     def _bus_message_cb(self, bus, message):
         if message.type == Gst.MessageType.EOS:
@@ -1274,7 +2617,8 @@ class AudioPreviewer(Gtk.Layout, Previewer, Zoomable, Loggable):
         return False
 
     def do_draw(self, context):
-        if not self.samples or not self.ges_elem.get_track() or not self.ges_elem.props.active:
+        if self.peaks is None or not self.peaks.levels or \
+                not self.ges_elem.get_track() or not self.ges_elem.props.active:
             # Nothing to draw.
             return
 
@@ -1293,45 +2637,128 @@ class AudioPreviewer(Gtk.Layout, Previewer, Zoomable, Loggable):
 
         zoom = self.get_current_zoom_level()
         height = self.get_allocation().height - 2 * CLIP_BORDER_WIDTH
+        if height <= 0:
+            return
 
-        if not self.surface or \
-                height != self.surface.get_height() or \
-                zoom != self._surface_zoom_level or \
-                start_ns < self._surface_start_ns or \
-                rate != self._rate or \
-                end_ns > self._surface_end_ns:
-            if self.surface:
-                self.surface.finish()
-                self.surface = None
-            self._surface_zoom_level = zoom
-            # The generated waveform is for an extended range if possible,
-            # so if the user scrolls we don't rebuild the waveform every time.
-            extra = self.pixel_to_ns(WAVEFORM_SURFACE_EXTRA_PX)
-            self._surface_start_ns = max(0, start_ns - extra)
-            self._surface_end_ns = min(end_ns + extra, max_duration)
-            self._rate = rate
-
-            sample_duration = SAMPLE_DURATION / rate
-            range_start = min(max(0, int(self._surface_start_ns / sample_duration)), len(self.samples))
-            range_end = min(max(0, int(self._surface_end_ns / sample_duration)), len(self.samples))
-            samples = self.samples[range_start:range_end]
-            surface_width = self.ns_to_pixel(self._surface_end_ns - self._surface_start_ns)
-            self.surface = renderer.fill_surface(samples, surface_width, height)
-
-        # Paint the surface, ignoring the clipped rect.
-        # We only have to make sure the offset is correct:
-        # 1. + self._start_surface_ns, because that's the position of
-        # the surface in context, if the entire asset would be drawn.
-        # 2. - inpoint, because we're drawing a clip, not the entire asset.
+        # Paint the tiles intersecting the clipped rect, at their position
+        # in the clip. The tiles are positioned as if the entire asset
+        # would be drawn, so - inpoint, because we're drawing a clip.
         context.set_operator(cairo.OPERATOR_OVER)
-        offset = self.ns_to_pixel(self._surface_start_ns - inpoint)
-        context.set_source_surface(self.surface, offset, CLIP_BORDER_WIDTH)
+        inpoint_px = self.ns_to_pixel(inpoint)
+        first_tile = self.ns_to_pixel(start_ns) // WAVEFORM_TILE_WIDTH_PX
+        last_tile = self.ns_to_pixel(end_ns) // WAVEFORM_TILE_WIDTH_PX
+        for index in range(first_tile, last_tile + 1):
+            key = (zoom, index, rate, height, self.channel)
+            tile = self.waveform_tiles.get(self._peaks_file, key)
+            if tile is None:
+                tile = self._render_tile(index, rate, height, max_duration)
+                if tile is None:
+                    continue
+                self.waveform_tiles.add(self._peaks_file, key, tile)
+
+            context.set_source_surface(tile, index * WAVEFORM_TILE_WIDTH_PX - inpoint_px,
+                                       CLIP_BORDER_WIDTH)
+            context.paint()
+
+    def _render_tile(self, index, rate, height, max_duration):
+        """Renders the waveform tile at the specified index.
+
+        Returns:
+            cairo.ImageSurface: The tile or None if it's past the end.
+        """
+        tile_start_ns = self.pixel_to_ns(index * WAVEFORM_TILE_WIDTH_PX)
+        tile_end_ns = min(self.pixel_to_ns((index + 1) * WAVEFORM_TILE_WIDTH_PX), max_duration)
+        width = self.ns_to_pixel(tile_end_ns) - index * WAVEFORM_TILE_WIDTH_PX
+        if width <= 0:
+            return None
+
+        # Use the coarsest level still having a sample for each pixel.
+        level, level_samples = self.peaks.level_for(self.pixel_to_ns(1) * rate)
+        sample_duration = SAMPLE_DURATION * PEAKS_DECIMATION ** level / rate
+        range_start = min(max(0, int(tile_start_ns / sample_duration)), len(level_samples))
+        range_end = min(max(0, int(tile_end_ns / sample_duration)), len(level_samples))
+
+        # The channels are drawn one under the other.
+        columns = self.peaks.columns(self.channel)
+        lane_height = height // len(columns)
+        if lane_height <= 0:
+            return None
+
+        scale = self._samples_scale(lane_height)
+        lanes = []
+        for column in columns:
+            # The samples are read in place by the renderer.
+            lane = renderer.fill_surface(level_samples[:, column, PEAK_RMS],
+                                         width, lane_height,
+                                         range_start, range_end - range_start, scale)
+            if level <= WAVEFORM_ENVELOPE_MAX_LEVEL:
+                lane = self._add_peak_envelope(lane, level_samples[range_start:range_end, column],
+                                               width, lane_height, scale)
+            lanes.append(lane)
+        if len(lanes) == 1:
+            return lanes[0]
+
+        tile = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+        context = cairo.Context(tile)
+        for i, lane in enumerate(lanes):
+            context.set_source_surface(lane, 0, i * lane_height)
+            context.paint()
+        return tile
+
+    @staticmethod
+    def _add_peak_envelope(rms_lane, samples, width, height, scale):
+        """Draws the peak envelope of the samples behind the RMS waveform.
+
+        Args:
+            rms_lane (cairo.ImageSurface): The rendered RMS waveform.
+            samples (numpy.ndarray): The (n, 3) min, max and RMS samples.
+            width (int): The width of the lane.
+            height (int): The height of the lane.
+            scale (float): The factor by which the samples are multiplied.
+
+        Returns:
+            cairo.ImageSurface: The lane with the envelope and the RMS waveform.
+        """
+        # The waveform is drawn from the bottom, so it shows the magnitude.
+        peaks = numpy.maximum(samples[:, PEAK_MAX], -samples[:, PEAK_MIN])
+        envelope = renderer.fill_surface(peaks, width, height, 0, -1, scale)
+
+        lane = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+        context = cairo.Context(lane)
+        context.set_source_surface(envelope, 0, 0)
+        context.paint_with_alpha(WAVEFORM_ENVELOPE_ALPHA)
+        context.set_source_surface(rms_lane, 0, 0)
         context.paint()
+        return lane
 
     def _emit_done_on_idle(self):
         self.emit("done")
 
+    def _start_throttling(self):
+        if not self._offline:
+            return
+
+        self._throttled = False
+        Previewer.manager.add_offline_previewer(self)
+
+    def _stop_throttling(self):
+        Previewer.manager.remove_offline_previewer(self)
+
+    def set_throttled(self, throttled):
+        """Pauses or resumes the offline extraction.
+
+        Args:
+            throttled (bool): Whether the extraction must be paused.
+        """
+        if throttled == self._throttled or not self.pipeline:
+            return
+
+        self.log("%s the extraction", "Pausing" if throttled else "Resuming")
+        self._throttled = throttled
+        self.pipeline.set_state(Gst.State.PAUSED if throttled else Gst.State.PLAYING)
+
     def pause_generation(self):
+        self._stop_throttling()
         if self.pipeline:
             self.pipeline.set_state(Gst.State.PAUSED)
 
@@ -1347,8 +2774,10 @@ class AudioPreviewer(Gtk.Layout, Previewer, Zoomable, Loggable):
             return
 
         self.pipeline.set_state(Gst.State.PLAYING)
+        self._start_throttling()
 
     def stop_generation(self):
+        self._stop_throttling()
         if self.pipeline:
             self.pipeline.set_state(Gst.State.NULL)
             self.pipeline.get_bus().disconnect_by_func(self._bus_message_cb)
@@ -1359,6 +2788,8 @@ class AudioPreviewer(Gtk.Layout, Previewer, Zoomable, Loggable):
     def release(self):
         """Stops preview generation and cleans the object."""
         self.stop_generation()
+        # Release the shared peaks.
+        self.peaks = None
         Zoomable.__del__(self)
 
 
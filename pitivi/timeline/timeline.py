@@ -39,11 +39,17 @@ from pitivi.timeline.layer import Layer
 from pitivi.timeline.layer import LayerControls
 from pitivi.timeline.layer import SpacedSeparator
 from pitivi.timeline.markers import MarkersBox
+from pitivi.timeline.overview import TimelineOverview
+from pitivi.timeline.previewers import AudioPreviewer
+from pitivi.timeline.previewers import get_silence_index
 from pitivi.timeline.previewers import Previewer
+from pitivi.timeline.previewers import WAVEFORM_ALL_CHANNELS
+from pitivi.timeline.previewers import WAVEFORM_MIX
 from pitivi.timeline.ruler import TimelineScaleRuler
 from pitivi.undo.timeline import CommitTimelineFinalizingAction
 from pitivi.utils.loggable import Loggable
 from pitivi.utils.misc import asset_get_duration
+from pitivi.utils.proxy import get_proxy_target
 from pitivi.utils.timeline import EditingContext
 from pitivi.utils.timeline import SELECT
 from pitivi.utils.timeline import Selection
@@ -108,6 +114,21 @@ PreferencesDialog.add_toggle_preference('leftClickAlsoSeeks',
                                         description=_(
                                             "Whether left-clicking also seeks besides selecting and editing clips."))
 
+GlobalSettings.add_config_option("waveformChannel",
+                                 section="user-interface",
+                                 key="waveform-channel",
+                                 default=WAVEFORM_MIX,
+                                 notify=True)
+
+PreferencesDialog.add_choice_preference("waveformChannel",
+                                        section="timeline",
+                                        label=_("Audio waveforms"),
+                                        description=_("The audio channels displayed on the audio clips."),
+                                        choices=[(_("Mix of the channels"), WAVEFORM_MIX),
+                                                 (_("All the channels"), WAVEFORM_ALL_CHANNELS)] +
+                                        [(_("Channel %d") % (channel + 1), channel)
+                                         for channel in range(8)])
+
 GlobalSettings.add_config_option("timelineAutoRipple",
                                  section="user-interface",
                                  key="timeline-autoripple",
@@ -427,10 +448,14 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
 
         self.app.settings.connect("edgeSnapDeadbandChanged",
                                   self.__snap_distance_changed_cb)
+        AudioPreviewer.channel = self.app.settings.waveformChannel
+        self.app.settings.connect("waveformChannelChanged",
+                                  self.__waveform_channel_changed_cb)
 
         self.layout.layers_vbox.connect_after("size-allocate", self.__size_allocate_cb)
 
         self.hadj.connect("value-changed", self.__hadj_value_changed_cb)
+        self.hadj.connect("changed", self.__hadj_changed_cb)
 
     def __size_allocate_cb(self, unused_widget, unused_allocation):
         """Handles the layers vbox size allocations."""
@@ -475,10 +500,13 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
 
         if self._project and self._project.pipeline:
             self._project.pipeline.disconnect_by_func(self._position_cb)
+            self._project.pipeline.disconnect_by_func(self.__pipeline_state_change_cb)
+            Previewer.manager.set_idle(True)
 
         self._project = project
         if self._project:
             self._project.pipeline.connect('position', self._position_cb)
+            self._project.pipeline.connect("state-change", self.__pipeline_state_change_cb)
             self.ges_timeline = self._project.ges_timeline
 
         if self.ges_timeline is None:
@@ -554,6 +582,11 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
         if not pipeline.playing():
             self.update_visible_overlays()
             self.editor_state.set_value("playhead-position", position)
+            Previewer.manager.set_playhead_position(position)
+            self.app.proxy_manager.set_playhead_position(position)
+
+    def __pipeline_state_change_cb(self, unused_pipeline, state, unused_old_state):
+        Previewer.manager.set_idle(state != Gst.State.PLAYING)
 
     def __snapping_started_cb(self, unused_timeline, unused_obj1, unused_obj2, position):
         """Handles a clip snap update operation."""
@@ -577,6 +610,11 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
         """Handles the change of the snapping distance by the user."""
         self.update_snapping_distance()
 
+    def __waveform_channel_changed_cb(self, unused_settings):
+        """Handles the change of the displayed waveform channel by the user."""
+        AudioPreviewer.channel = self.app.settings.waveformChannel
+        self.layout.queue_draw()
+
     # Gtk.Widget virtual methods implementation
 
     def do_get_preferred_height(self):
@@ -918,6 +956,16 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
 
     def __hadj_value_changed_cb(self, hadj):
         self.editor_state.set_value("scroll", hadj.get_value())
+        self.__update_previewers_viewport()
+
+    def __hadj_changed_cb(self, unused_hadj):
+        self.__update_previewers_viewport()
+
+    def __update_previewers_viewport(self):
+        """Lets the previewers know which part of the timeline is visible."""
+        start = self.pixel_to_ns(self.hadj.get_value())
+        end = self.pixel_to_ns(self.hadj.get_value() + self.hadj.get_page_size())
+        Previewer.manager.set_viewport(start, end)
 
     def update_position(self):
         for ges_layer in self.ges_timeline.get_layers():
@@ -1575,6 +1623,7 @@ class TimelineContainer(Gtk.Grid, Zoomable, Loggable):
             self.ges_timeline = None
 
         self.timeline.set_project(project)
+        self.overview.set_project(project)
 
         if project:
             self.ruler.set_pipeline(project.pipeline)
@@ -1617,6 +1666,8 @@ class TimelineContainer(Gtk.Grid, Zoomable, Loggable):
         selection_non_empty = bool(selection)
         self.delete_action.set_enabled(selection_non_empty)
         self.delete_and_shift_action.set_enabled(selection_non_empty)
+        self.select_silences_action.set_enabled(selection_non_empty)
+        self.delete_silences_and_shift_action.set_enabled(selection_non_empty)
         self.group_action.set_enabled(selection.can_group)
         self.ungroup_action.set_enabled(selection.can_ungroup)
         self.copy_action.set_enabled(selection_non_empty)
@@ -1662,13 +1713,16 @@ class TimelineContainer(Gtk.Grid, Zoomable, Loggable):
 
         self.markers = MarkersBox(self.app, hadj=self.timeline.hadj)
 
-        self.attach(self.markers, 1, 0, 1, 1)
-        self.attach(self.zoom_box, 0, 1, 1, 1)
-        self.attach(self.ruler, 1, 1, 1, 1)
-        self.attach(self.timeline, 0, 2, 2, 1)
-        self.attach(self.vscrollbar, 2, 2, 1, 1)
-        self.attach(hscrollbar, 1, 3, 1, 1)
-        self.attach(self.toolbar, 3, 2, 1, 1)
+        self.overview = TimelineOverview(self)
+
+        self.attach(self.overview, 1, 0, 1, 1)
+        self.attach(self.markers, 1, 1, 1, 1)
+        self.attach(self.zoom_box, 0, 2, 1, 1)
+        self.attach(self.ruler, 1, 2, 1, 1)
+        self.attach(self.timeline, 0, 3, 2, 1)
+        self.attach(self.vscrollbar, 2, 3, 1, 1)
+        self.attach(hscrollbar, 1, 4, 1, 1)
+        self.attach(self.toolbar, 3, 3, 1, 1)
 
         self.set_margin_top(SPACING)
 
@@ -1728,6 +1782,20 @@ class TimelineContainer(Gtk.Grid, Zoomable, Loggable):
                                self.delete_and_shift_action,
                                _("Delete selected clips and shift following ones"))
 
+        self.select_silences_action = Gio.SimpleAction.new("select-silences", None)
+        self.select_silences_action.connect("activate", self._select_silences_cb)
+        group.add_action(self.select_silences_action)
+        self.app.shortcuts.add("timeline.select-silences", [],
+                               self.select_silences_action,
+                               _("Split the selected clips at their silences and select the silences"))
+
+        self.delete_silences_and_shift_action = Gio.SimpleAction.new("delete-silences-and-shift", None)
+        self.delete_silences_and_shift_action.connect("activate", self._delete_silences_and_shift_cb)
+        group.add_action(self.delete_silences_and_shift_action)
+        self.app.shortcuts.add("timeline.delete-silences-and-shift", ["<Primary><Shift>Delete"],
+                               self.delete_silences_and_shift_action,
+                               _("Delete the silences of the selected clips and shift following ones"))
+
         self.group_action = Gio.SimpleAction.new("group-selected-clips", None)
         self.group_action.connect("activate", self._group_selected_cb)
         group.add_action(self.group_action)
@@ -1777,6 +1845,13 @@ class TimelineContainer(Gtk.Grid, Zoomable, Loggable):
                                self.seek_backward_clip_action,
                                _("Seek to the first clip edge before the playhead"))
 
+        self.seek_forward_activity_action = Gio.SimpleAction.new("seek-forward-activity", None)
+        self.seek_forward_activity_action.connect("activate", self._seek_forward_activity_cb)
+        group.add_action(self.seek_forward_activity_action)
+        self.app.shortcuts.add("timeline.seek-forward-activity", ["<Primary><Shift>Right"],
+                               self.seek_forward_activity_action,
+                               _("Seek to the first audio activity after the playhead"))
+
         self.add_effect_action = Gio.SimpleAction.new("add-effect", None)
         self.add_effect_action.connect("activate", self.__add_effect_cb)
         group.add_action(self.add_effect_action)
@@ -1913,42 +1988,125 @@ class TimelineContainer(Gtk.Grid, Zoomable, Loggable):
             with self.app.action_log.started("delete clip and shift",
                                              finalizing_action=CommitTimelineFinalizingAction(self._project.pipeline),
                                              toplevel=True):
-                start = []
-                end = []
+                self.__remove_clips_and_shift(self.timeline.selection)
 
-                # remove the clips and store their start/end positions
-                for clip in self.timeline.selection:
-                    if isinstance(clip, GES.TransitionClip):
-                        continue
-                    layer = clip.get_layer()
-                    start.append(clip.start)
-                    end.append(clip.start + clip.duration)
-                    layer.remove_clip(clip)
+            self.timeline.selection.set_selection([], SELECT)
 
-                if start:
-                    start = min(start)
-                    end = max(end)
-                    found_overlapping = False
-
-                    # check if any other clips occur during that period
-                    for layer in self.ges_timeline.layers:
-                        for clip in layer.get_clips():
-                            clip_end = clip.start + clip.duration
-                            if clip_end > start and clip.start < end:
-                                found_overlapping = True
-                                break
-                        if found_overlapping:
-                            break
-
-                    if not found_overlapping:
-                        # now shift everything following cut time
-                        shift_by = end - start
-                        for layer in self.ges_timeline.layers:
-                            for clip in layer.get_clips():
-                                if clip.start >= end:
-                                    clip.set_start(clip.start - shift_by)
+    def __remove_clips_and_shift(self, clips):
+        """Removes the clips and shifts the following ones over the gap.
 
-            self.timeline.selection.set_selection([], SELECT)
+        The following clips are not shifted if other clips overlap the gap.
+        """
+        start = []
+        end = []
+
+        # remove the clips and store their start/end positions
+        for clip in list(clips):
+            if isinstance(clip, GES.TransitionClip):
+                continue
+            layer = clip.get_layer()
+            start.append(clip.start)
+            end.append(clip.start + clip.duration)
+            layer.remove_clip(clip)
+
+        if start:
+            start = min(start)
+            end = max(end)
+            found_overlapping = False
+
+            # check if any other clips occur during that period
+            for layer in self.ges_timeline.layers:
+                for clip in layer.get_clips():
+                    clip_end = clip.start + clip.duration
+                    if clip_end > start and clip.start < end:
+                        found_overlapping = True
+                        break
+                if found_overlapping:
+                    break
+
+            if not found_overlapping:
+                # now shift everything following cut time
+                shift_by = end - start
+                for layer in self.ges_timeline.layers:
+                    for clip in layer.get_clips():
+                        if clip.start >= end:
+                            clip.set_start(clip.start - shift_by)
+
+    def clip_silences(self, clip):
+        """Gets the silences of the audio of the specified clip.
+
+        The silences are detected out of the cached waveforms, so none are
+        found if the waveforms of the clip have not been extracted yet.
+
+        Returns:
+            List[Tuple[int, int]]: The timeline intervals of the silences.
+        """
+        for source in clip.find_track_elements(None, GES.TrackType.AUDIO, GES.AudioUriSource):
+            if not source.props.active:
+                continue
+
+            index = get_silence_index(get_proxy_target(source).props.id)
+            if index is None:
+                continue
+
+            start = clip.get_internal_time_from_timeline_time(source, clip.start)
+            end = clip.get_internal_time_from_timeline_time(source, clip.start + clip.duration)
+            return [(clip.get_timeline_time_from_internal_time(source, silence_start),
+                     clip.get_timeline_time_from_internal_time(source, silence_end))
+                    for silence_start, silence_end in index.silences(start, end)]
+
+        return []
+
+    def _split_silences(self, clips):
+        """Splits the clips at the edges of their silences.
+
+        Returns:
+            List[GES.Clip]: The clips covering the silences.
+        """
+        silent_clips = []
+        for clip in list(clips):
+            if isinstance(clip, GES.TransitionClip):
+                continue
+
+            silences = self.clip_silences(clip)
+            layer = clip.get_layer()
+            layer.splitting_object = True
+            try:
+                # Split starting with the last silence, so the clip keeps
+                # covering the silences not split yet.
+                for start, end in reversed(silences):
+                    if end < clip.start + clip.duration:
+                        clip.split(end)
+                    silent_clip = clip.split(start) if start > clip.start else clip
+                    if silent_clip:
+                        silent_clips.append(silent_clip)
+            finally:
+                layer.splitting_object = False
+
+        return silent_clips
+
+    def _select_silences_cb(self, unused_action, unused_parameter):
+        """Splits the selected clips at their silences and selects the silences."""
+        with self.app.action_log.started("select silences",
+                                         finalizing_action=CommitTimelineFinalizingAction(self._project.pipeline),
+                                         toplevel=True):
+            silent_clips = self._split_silences(self.timeline.selection)
+
+        self.timeline.selection.set_selection(silent_clips, SELECT)
+
+    def _delete_silences_and_shift_cb(self, unused_action, unused_parameter):
+        """Deletes the silences of the selected clips and shifts the following clips."""
+        with Previewer.manager.paused():
+            with self.app.action_log.started("delete silences and shift",
+                                             finalizing_action=CommitTimelineFinalizingAction(self._project.pipeline),
+                                             toplevel=True):
+                silent_clips = self._split_silences(self.timeline.selection)
+                # Start with the last silence, so the gaps left by the
+                # others don't move.
+                for clip in sorted(silent_clips, key=lambda clip: clip.start, reverse=True):
+                    self.__remove_clips_and_shift([clip])
+
+        self.timeline.selection.set_selection([], SELECT)
 
     def _ungroup_selected_cb(self, unused_action, unused_parameter):
         if not self.ges_timeline:
@@ -2046,6 +2204,53 @@ class TimelineContainer(Gtk.Grid, Zoomable, Loggable):
         else:
             return max(edges)
 
+    def first_audio_activity(self, after):
+        """Gets the first audio activity after the specified position.
+
+        The silences are detected out of the cached waveforms, so the audio
+        clips whose waveforms have not been extracted yet are ignored.
+
+        Returns:
+            int: The timeline position or None if there is none.
+        """
+        positions = []
+        for layer in self.ges_timeline.layers:
+            for clip in layer.get_clips_in_interval(after, self.ges_timeline.props.duration):
+                for source in clip.find_track_elements(None, GES.TrackType.AUDIO, GES.AudioUriSource):
+                    if not source.props.active:
+                        continue
+
+                    index = get_silence_index(get_proxy_target(source).props.id)
+                    if index is None:
+                        continue
+
+                    clip_end = clip.start + clip.duration
+                    if after < clip.start:
+                        position = clip.get_internal_time_from_timeline_time(source, clip.start)
+                        if not index.is_silent(position):
+                            positions.append(clip.start)
+                            continue
+                    else:
+                        position = clip.get_internal_time_from_timeline_time(source, after)
+
+                    activity = index.next_activity(position)
+                    if activity is None:
+                        continue
+                    timeline_position = clip.get_timeline_time_from_internal_time(source, activity)
+                    if after < timeline_position < clip_end:
+                        positions.append(timeline_position)
+
+        return min(positions) if positions else None
+
+    def _seek_forward_activity_cb(self, unused_action, unused_parameter):
+        """Seeks to the first audio activity at the right of the playhead."""
+        position = self.first_audio_activity(after=self._project.pipeline.get_position())
+        if position is None:
+            return
+
+        self._project.pipeline.simple_seek(position)
+        self.timeline.scroll_to_playhead(align=Gtk.Align.CENTER, when_not_in_view=True)
+
     def _seek_forward_clip_cb(self, unused_action, unused_parameter):
         """Seeks to the first clip edge at the right of the playhead."""
         position = self.first_clip_edge(after=self._project.pipeline.get_position())
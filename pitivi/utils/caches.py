@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Garbage collection of the thumbnails, waveforms and proxies caches."""
+import os
+import sqlite3
+import time
+
+from gi.repository import GES
+from gi.repository import GLib
+from gi.repository import GObject
+from gi.repository import Gst
+
+from pitivi.settings import GlobalSettings
+from pitivi.settings import xdg_cache_home
+from pitivi.timeline.previewers import get_loudness_location
+from pitivi.timeline.previewers import get_wavefile_location_for_uri
+from pitivi.timeline.previewers import get_waves_cache_dir
+from pitivi.timeline.previewers import ThumbnailCache
+from pitivi.timeline.previewers import ThumbnailStore
+from pitivi.utils.loggable import Loggable
+from pitivi.utils.proxy import ProxyManager
+from pitivi.utils.threads import Thread
+
+GlobalSettings.add_config_section("cache")
+
+# The max size of the caches, in MiB. 0 means unlimited.
+GlobalSettings.add_config_option("cache_thumbs_quota",
+                                 section="cache",
+                                 key="thumbs-quota",
+                                 default=1024)
+GlobalSettings.add_config_option("cache_waves_quota",
+                                 section="cache",
+                                 key="waves-quota",
+                                 default=512)
+# The proxies are not collected by default, because transcoding them
+# again is expensive.
+GlobalSettings.add_config_option("cache_proxies_quota",
+                                 section="cache",
+                                 key="proxies-quota",
+                                 default=0)
+# Whether the cached thumbnails and waveforms of the assets are identified
+# by a fingerprint of the contents of the files instead of their location.
+# The proxies are always created next to the assets.
+GlobalSettings.add_config_option("cache_keys_by_content",
+                                 section="cache",
+                                 key="keys-by-content",
+                                 default=False)
+
+# The delay after startup before collecting the caches, in seconds.
+COLLECTION_STARTUP_DELAY = 30
+
+MIB = 1024 * 1024
+
+
+class Cache(Loggable):
+    """Base class for the caches collected by the CacheManager.
+
+    The entries of a cache are evicted in least recently used order, until
+    the size of the cache fits in the quota.
+
+    Attributes:
+        name (str): The name of the cache.
+    """
+
+    name = None
+
+    def __init__(self):
+        Loggable.__init__(self)
+
+    def entries(self):
+        """Gets the entries of the cache.
+
+        Returns:
+            List[tuple]: The (key, size in bytes, last access time) entries.
+        """
+        raise NotImplementedError()
+
+    def evict(self, key):
+        """Removes the entry identified by the specified key."""
+        raise NotImplementedError()
+
+    def is_protected(self, key, protected):
+        """Returns whether the specified entry must not be evicted."""
+        return key in protected
+
+    def close(self):
+        """Releases the resources used while collecting."""
+
+    def collect(self, quota, protected, since):
+        """Evicts the least recently used entries until the quota is met.
+
+        Args:
+            quota (int): The max size of the cache, in bytes.
+            protected (set): The keys of the entries which must be kept.
+            since (float): The entries accessed since this time are kept.
+
+        Returns:
+            int: The number of reclaimed bytes.
+        """
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for unused_key, size, unused_accessed in entries)
+        reclaimed = 0
+        for key, size, accessed in entries:
+            if total <= quota:
+                break
+            if accessed >= since or self.is_protected(key, protected):
+                continue
+
+            try:
+                self.evict(key)
+            except (OSError, sqlite3.Error) as e:
+                self.warning("Failed evicting %s from the %s cache: %s", key, self.name, e)
+                continue
+            self.debug("Evicted %s, %d bytes", key, size)
+            total -= size
+            reclaimed += size
+        return reclaimed
+
+
+class ThumbsCache(Cache):
+    """The thumbnails of the assets, in the ThumbnailStore database."""
+
+    name = "thumbs"
+
+    def __init__(self, dbfile):
+        Cache.__init__(self)
+        self.dbfile = dbfile
+        self._db = None
+
+    def entries(self):
+        # The connection can be used only in the collecting thread.
+        self._db = sqlite3.connect(self.dbfile)
+        sizes = {}
+        for table in ("Thumbs", "Tiles"):
+            for key, size in self._db.execute("SELECT Asset, SUM(LENGTH(Jpeg)) "
+                                              "FROM %s GROUP BY Asset" % table):
+                sizes[key] = sizes.get(key, 0) + size
+        accessed = dict(self._db.execute("SELECT Asset, Time FROM Accessed"))
+        return [(key, size, accessed.get(key, 0)) for key, size in sizes.items()]
+
+    def evict(self, key):
+        self._db.execute("DELETE FROM Thumbs WHERE Asset = ?", (key,))
+        self._db.execute("DELETE FROM Tiles WHERE Asset = ?", (key,))
+        self._db.execute("DELETE FROM Accessed WHERE Asset = ?", (key,))
+        self._db.commit()
+
+    def close(self):
+        if not self._db:
+            return
+
+        try:
+            # Give the space back to the filesystem.
+            self._db.execute("VACUUM")
+        except sqlite3.OperationalError as e:
+            self.info("Could not vacuum %s: %s", self.dbfile, e)
+        self._db.close()
+        self._db = None
+
+
+class WavesCache(Cache):
+    """The wave.npy and loudness.json files, whose modification time is their access time."""
+
+    name = "waves"
+
+    def __init__(self, waves_dir):
+        Cache.__init__(self)
+        self.waves_dir = waves_dir
+
+    def entries(self):
+        entries = []
+        for dir_entry in os.scandir(self.waves_dir):
+            if dir_entry.is_file():
+                stat = dir_entry.stat()
+                entries.append((dir_entry.name, stat.st_size, stat.st_mtime))
+        return entries
+
+    def evict(self, key):
+        os.remove(os.path.join(self.waves_dir, key))
+
+
+class ProxiesCache(Cache):
+    """The proxy files created next to the media files.
+
+    The proxies are not in a cache directory so they are tracked in
+    the database of the CacheManager.
+    """
+
+    name = "proxies"
+
+    def __init__(self, dbfile):
+        Cache.__init__(self)
+        self.dbfile = dbfile
+        self._db = None
+
+    def entries(self):
+        self._db = sqlite3.connect(self.dbfile)
+        entries = []
+        for uri, accessed in self._db.execute("SELECT Uri, Time FROM Proxies").fetchall():
+            try:
+                size = os.path.getsize(Gst.uri_get_location(uri))
+            except OSError:
+                # The proxy has been removed by someone else.
+                self._db.execute("DELETE FROM Proxies WHERE Uri = ?", (uri,))
+                continue
+            entries.append((uri, size, accessed))
+        self._db.commit()
+        return entries
+
+    def evict(self, key):
+        os.remove(Gst.uri_get_location(key))
+        self._db.execute("DELETE FROM Proxies WHERE Uri = ?", (key,))
+        self._db.commit()
+
+    def is_protected(self, key, protected):
+        return key in protected or ProxyManager.get_target_uri(key) in protected
+
+    def close(self):
+        if self._db:
+            self._db.close()
+            self._db = None
+
+
+class CacheCollector(Thread):
+    """Thread evicting the least recently used entries of the caches."""
+
+    def __init__(self, caches, since, callback):
+        Thread.__init__(self)
+        self.caches = caches
+        self.since = since
+        self.callback = callback
+
+    def process(self):
+        reclaimed = {}
+        try:
+            for cache, quota, protected in self.caches:
+                try:
+                    reclaimed[cache.name] = cache.collect(quota, protected, self.since)
+                except (OSError, sqlite3.Error) as e:
+                    self.warning("Failed collecting the %s cache: %s", cache.name, e)
+                finally:
+                    cache.close()
+        finally:
+            # Always report, so the CacheManager can collect again.
+            GLib.idle_add(self.callback, reclaimed)
+
+
+class CacheManager(GObject.Object, Loggable):
+    """Keeps the size of the caches within the configured quotas.
+
+    The entries used since the app started, and the ones belonging to the
+    currently open project are never evicted.
+
+    Signals:
+        collected (dict): The caches have been collected. The argument
+            maps the cache names to the number of reclaimed bytes.
+    """
+
+    __gsignals__ = {
+        "collected": (GObject.SignalFlags.RUN_LAST, None, (object,)),
+    }
+
+    def __init__(self, app):
+        GObject.Object.__init__(self)
+        Loggable.__init__(self)
+        self.app = app
+        self.session_start = time.time()
+        self.collecting = False
+
+        self.dbfile = os.path.join(xdg_cache_home(), "caches.db")
+        self._db = sqlite3.connect(self.dbfile)
+        self._db.execute("CREATE TABLE IF NOT EXISTS Proxies "
+                         "(Uri TEXT NOT NULL PRIMARY KEY, "
+                         " Time REAL NOT NULL)")
+        self._db.commit()
+
+        self.app.proxy_manager.connect("proxy-ready", self.__proxy_ready_cb)
+
+    def schedule_collection(self):
+        """Collects the caches a while after the app started."""
+        GLib.timeout_add_seconds(COLLECTION_STARTUP_DELAY, self.__collect_timeout_cb)
+
+    def __collect_timeout_cb(self):
+        self.collect()
+        return False
+
+    def track_proxy(self, proxy_uri):
+        """Marks a proxy as recently used, adding it to the collected cache."""
+        self._db.execute("INSERT OR REPLACE INTO Proxies VALUES (?, ?)",
+                         (proxy_uri, time.time()))
+        self._db.commit()
+
+    def __proxy_ready_cb(self, unused_proxy_manager, unused_asset, proxy):
+        if proxy:
+            self.track_proxy(proxy.props.id)
+
+    def __project_uris(self):
+        """Gets the URIs of the assets of the open project and their proxies."""
+        uris = set()
+        project = self.app.project_manager.current_project
+        if not project:
+            return uris
+
+        for asset in project.list_assets(GES.UriClip):
+            uris.add(ProxyManager.get_target_uri(asset))
+            for proxy in asset.list_proxies():
+                uris.add(proxy.props.id)
+        return uris
+
+    def collect(self):
+        """Collects the caches in a background thread.
+
+        Returns:
+            bool: Whether the collection started.
+        """
+        if self.collecting:
+            self.debug("Already collecting")
+            return False
+
+        uris = self.__project_uris()
+        thumbs_keys = set()
+        waves_files = set()
+        for uri in uris:
+            if ProxyManager.is_proxy_asset(uri):
+                continue
+            try:
+                thumbs_keys.add(ThumbnailCache.cache_key(uri))
+                wavefile = get_wavefile_location_for_uri(uri)
+                waves_files.add(os.path.basename(wavefile))
+                waves_files.add(os.path.basename(get_loudness_location(wavefile)))
+            except OSError as e:
+                self.debug("Not protecting the caches of %s: %s", uri, e)
+
+        settings = self.app.settings
+        caches = []
+        for cache, quota, protected in (
+                (ThumbsCache(ThumbnailStore.get().dbfile), settings.cache_thumbs_quota, thumbs_keys),
+                (WavesCache(get_waves_cache_dir()), settings.cache_waves_quota, waves_files),
+                (ProxiesCache(self.dbfile), settings.cache_proxies_quota, uris)):
+            if quota > 0:
+                caches.append((cache, quota * MIB, protected))
+
+        self.collecting = True
+        self.app.threads.add_thread(CacheCollector, caches, self.session_start,
+                                    self.__collected_cb)
+        return True
+
+    def __collected_cb(self, reclaimed):
+        self.collecting = False
+        for name, size in reclaimed.items():
+            self.info("Reclaimed %.1f MiB from the %s cache", size / MIB, name)
+        self.emit("collected", reclaimed)
+        return False
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""EBU R128 loudness measurement, as specified in ITU-R BS.1770-4."""
+import json
+import os
+
+import numpy
+from gi.repository import Gst
+
+# The rate of the K-weighted audio, for which the filter is designed.
+K_WEIGHTING_RATE = 48000
+# The coefficients of the K-weighting filter, the head effects shelving
+# filter followed by the RLB high-pass filter.
+K_WEIGHTING_B = numpy.convolve([1.53512485958697, -2.69169618940638, 1.19839281085285],
+                               [1.0, -2.0, 1.0]).tolist()
+K_WEIGHTING_A = numpy.convolve([1.0, -1.69065929318241, 0.73248077421585],
+                               [1.0, -1.99004745483398, 0.99007225036621]).tolist()
+# The rate at which the audio is oversampled for measuring the true-peak.
+TRUE_PEAK_RATE = 4 * K_WEIGHTING_RATE
+
+# The duration over which the mean square of the K-weighted audio is
+# measured. The gating blocks are made of consecutive measurements.
+LOUDNESS_STEP = 100 * Gst.MSECOND
+# The number of steps in a momentary loudness gating block, 400 ms.
+MOMENTARY_BLOCK_STEPS = 4
+# The number of steps in a short-term loudness block, 3 s.
+SHORT_TERM_BLOCK_STEPS = 30
+
+ABSOLUTE_GATE_LUFS = -70.0
+INTEGRATED_RELATIVE_GATE_LU = -10.0
+RANGE_RELATIVE_GATE_LU = -20.0
+RANGE_LOW_PERCENTILE = 10
+RANGE_HIGH_PERCENTILE = 95
+
+# The weights of the surround channels of 5.1 audio. The LFE is ignored.
+SURROUND_CHANNELS_WEIGHTS = [1.0, 1.0, 1.0, 0.0, 1.41, 1.41]
+
+# The asset metas holding the measurements, in LUFS, LU and dBTP.
+LOUDNESS_METAS = {
+    "integrated": "pitivi::loudness-integrated",
+    "range": "pitivi::loudness-range",
+    "true-peak": "pitivi::loudness-true-peak",
+}
+
+
+def loudness(mean_squares):
+    """Converts weighted mean squares to loudness values, in LUFS."""
+    with numpy.errstate(divide="ignore"):
+        return -0.691 + 10 * numpy.log10(mean_squares)
+
+
+class LoudnessMeter:
+    """Accumulates the measurements of the `level` elements of an asset.
+
+    The K-weighted audio is measured by a `level` element posting the
+    mean square of each channel every LOUDNESS_STEP. The oversampled
+    audio is measured by a `level` element for the true-peak.
+    """
+
+    def __init__(self):
+        # The weighted sums of the mean squares of the channels.
+        self._powers = []
+        # The max linear amplitude of the oversampled audio.
+        self._true_peak = 0.0
+
+    def add_rms(self, rms):
+        """Adds the RMS of the channels for the next LOUDNESS_STEP.
+
+        Args:
+            rms (List[float]): The RMS of the K-weighted channels, in dB.
+        """
+        weights = numpy.ones(len(rms))
+        if len(rms) == len(SURROUND_CHANNELS_WEIGHTS):
+            weights = numpy.array(SURROUND_CHANNELS_WEIGHTS)
+        mean_squares = 10 ** (numpy.array(rms) / 10)
+        self._powers.append(float(numpy.dot(weights, mean_squares)))
+
+    def add_peaks(self, peaks):
+        """Adds the peaks of the channels of the oversampled audio.
+
+        Args:
+            peaks (List[float]): The peaks of the channels, in dB.
+        """
+        if peaks:
+            self._true_peak = max(self._true_peak, 10 ** (max(peaks) / 20))
+
+    def _blocks(self, steps):
+        """Gets the mean squares of the overlapping blocks of the specified length."""
+        powers = numpy.array(self._powers)
+        if len(powers) < steps:
+            return numpy.array([])
+
+        cumsum = numpy.concatenate(([0.0], numpy.cumsum(powers)))
+        return (cumsum[steps:] - cumsum[:-steps]) / steps
+
+    def integrated(self):
+        """Computes the gated integrated loudness.
+
+        Returns:
+            float: The loudness in LUFS, or None if the audio is silent.
+        """
+        blocks = self._blocks(MOMENTARY_BLOCK_STEPS)
+        blocks = blocks[loudness(blocks) > ABSOLUTE_GATE_LUFS]
+        if not blocks.size:
+            return None
+
+        relative_gate = loudness(blocks.mean()) + INTEGRATED_RELATIVE_GATE_LU
+        blocks = blocks[loudness(blocks) > relative_gate]
+        return float(loudness(blocks.mean()))
+
+    def loudness_range(self):
+        """Computes the loudness range, as specified in EBU Tech 3342.
+
+        Returns:
+            float: The range in LU, or None if the audio is silent.
+        """
+        blocks = self._blocks(SHORT_TERM_BLOCK_STEPS)
+        blocks = blocks[loudness(blocks) > ABSOLUTE_GATE_LUFS]
+        if not blocks.size:
+            return None
+
+        relative_gate = loudness(blocks.mean()) + RANGE_RELATIVE_GATE_LU
+        values = loudness(blocks)
+        values = values[values > relative_gate]
+        low, high = numpy.percentile(values, [RANGE_LOW_PERCENTILE, RANGE_HIGH_PERCENTILE])
+        return float(high - low)
+
+    def true_peak(self):
+        """Gets the true-peak.
+
+        Returns:
+            float: The true-peak in dBTP, or None if the audio is silent.
+        """
+        if self._true_peak <= 0:
+            return None
+
+        return float(20 * numpy.log10(self._true_peak))
+
+    def results(self):
+        """Gets the measurements, keyed as in LOUDNESS_METAS."""
+        return {"integrated": self.integrated(),
+                "range": self.loudness_range(),
+                "true-peak": self.true_peak()}
+
+
+def save_loudness(filename, results):
+    """Saves the LoudnessMeter results."""
+    with open(filename, "w") as loudness_file:
+        json.dump(results, loudness_file)
+
+
+def load_loudness(filename):
+    """Loads the results saved by `save_loudness`.
+
+    Returns:
+        dict: The results or None if they are not available.
+    """
+    if not os.path.exists(filename):
+        return None
+
+    try:
+        with open(filename) as loudness_file:
+            return json.load(loudness_file)
+    except (OSError, ValueError):
+        return None
+
+
+def set_loudness_metas(asset, results):
+    """Exposes the loudness of the asset through its metas."""
+    for name, meta in LOUDNESS_METAS.items():
+        value = results.get(name)
+        if value is not None:
+            asset.set_double(meta, value)
@@ -16,6 +16,7 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with this program; if not, see <http://www.gnu.org/licenses/>.
 import errno
+import hashlib
 import os
 import subprocess
 import sys
@@ -40,6 +41,13 @@ from pitivi.utils.threads import Thread
 
 ASSET_DURATION_META = "pitivi:asset-duration"
 
+# The size of the chunks at the start and at the end of a file which are
+# hashed when computing its fingerprint.
+FINGERPRINT_CHUNK_SIZE = 4 * 1024 * 1024
+
+# The memoized fingerprints by (path, size, mtime, chunk size).
+_fingerprints = {}
+
 
 def scale_pixbuf(pixbuf, width, height):
     """Scales the given pixbuf preserving the original aspect ratio."""
@@ -228,6 +236,54 @@ class PathWalker(Thread):
         self.stopme.set()
 
 
+def fingerprint_file(path, chunk_size=FINGERPRINT_CHUNK_SIZE):
+    """Computes a fingerprint identifying the contents of a file.
+
+    Only the size and the first and last chunks of the file are hashed,
+    so it's cheap even for huge media files. The fingerprint is memoized
+    until the size or the modification time of the file changes.
+
+    Args:
+        path (str): The path of the file.
+        chunk_size (int): The number of bytes hashed at each end.
+
+    Returns:
+        str: The hex digest of the fingerprint.
+
+    Raises:
+        OSError: If the file cannot be read.
+    """
+    stat = os.stat(path)
+    memo_key = (path, stat.st_size, stat.st_mtime_ns, chunk_size)
+    try:
+        return _fingerprints[memo_key]
+    except KeyError:
+        pass
+
+    file_hash = hashlib.sha256(str(stat.st_size).encode("UTF-8"))
+    with open(path, "rb") as file:
+        file_hash.update(file.read(chunk_size))
+        if stat.st_size > chunk_size:
+            file.seek(max(chunk_size, stat.st_size - chunk_size))
+            file_hash.update(file.read(chunk_size))
+    fingerprint = file_hash.hexdigest()
+    _fingerprints[memo_key] = fingerprint
+    return fingerprint
+
+
+class CacheKeys:
+    """Policy for identifying the files about which data is cached.
+
+    By default the files are identified by their location and their
+    modification time. When `by_content` is set, they are identified by
+    a fingerprint of their contents, so the cached thumbnails and waveforms
+    are reused after the files are moved, renamed or touched. The proxies
+    are not concerned, they are found next to the assets.
+    """
+
+    by_content = False
+
+
 def quantize(value, interval):
     return (value // interval) * interval
 
@@ -14,6 +14,7 @@
 #
 # You should have received a copy of the GNU Lesser General Public
 # License along with this program; if not, see <http://www.gnu.org/licenses/>.
+import json
 import os
 import time
 from fractions import Fraction
@@ -31,9 +32,13 @@ from pitivi.check import GstDependency
 from pitivi.configure import get_gstpresets_dir
 from pitivi.dialogs.prefs import PreferencesDialog
 from pitivi.settings import GlobalSettings
+from pitivi.settings import xdg_cache_home
 from pitivi.utils.loggable import Loggable
 from pitivi.utils.misc import ASSET_DURATION_META
 from pitivi.utils.misc import asset_get_duration
+from pitivi.utils.segments import SegmentedTranscoder
+from pitivi.utils.system import SystemLoadTracker
+
 # Remove check when we depend on Gst >= 1.20
 HAS_GST_1_19 = GstDependency("Gst", apiversion="1.0", version_required="1.19").check()
 
@@ -47,6 +52,16 @@ class ProxyingStrategy:
     NOTHING = "nothing"
 
 
+class JobPriority:
+    """The priorities of the transcoding jobs, the lowest being started first."""
+
+    # The asset is used by clips in the timeline.
+    TIMELINE = 0
+    # The asset is selected in the media library.
+    SELECTED = 1
+    OTHER = 2
+
+
 GlobalSettings.add_config_section("proxy")
 GlobalSettings.add_config_option('proxying_strategy',
                                  section='proxy',
@@ -64,6 +79,29 @@ PreferencesDialog.add_numeric_preference('num_transcoding_jobs',
                                          label=_("Max number of parallel transcoding jobs"),
                                          lower=1)
 
+GlobalSettings.add_config_option("autoscale_transcoding_jobs",
+                                 section="proxy",
+                                 key="autoscale-proxying-jobs",
+                                 default=False,
+                                 notify=True)
+PreferencesDialog.add_toggle_preference("autoscale_transcoding_jobs",
+                                        description=_("Adapt the number of parallel transcoding "
+                                                      "jobs to the measured throughput and "
+                                                      "system load"),
+                                        section="_proxies",
+                                        label=_("Scale the number of transcoding jobs automatically"))
+
+GlobalSettings.add_config_option("min_transcoding_jobs",
+                                 section="proxy",
+                                 key="min-proxying-jobs",
+                                 default=1,
+                                 notify=True)
+PreferencesDialog.add_numeric_preference("min_transcoding_jobs",
+                                         description="",
+                                         section="_proxies",
+                                         label=_("Min number of parallel transcoding jobs"),
+                                         lower=1)
+
 GlobalSettings.add_config_option("max_cpu_usage",
                                  section="proxy",
                                  key="max-cpu-usage",
@@ -93,10 +131,211 @@ GlobalSettings.add_config_option("default_scaled_proxy_height",
                                  default=1080,
                                  notify=True)
 
+GlobalSettings.add_config_option("proxy_segment_duration",
+                                 section="proxy",
+                                 key="segment-duration",
+                                 default=300,
+                                 notify=True)
+PreferencesDialog.add_numeric_preference("proxy_segment_duration",
+                                         description=_("Long assets are transcoded in segments "
+                                                       "of this duration, in seconds, so the "
+                                                       "transcoding can be resumed. 0 disables it."),
+                                         section="_proxies",
+                                         label=_("Duration of the transcoding segments"),
+                                         lower=0)
+
+GlobalSettings.add_config_option("num_segment_jobs",
+                                 section="proxy",
+                                 key="num-segment-jobs",
+                                 default=0,
+                                 notify=True)
+PreferencesDialog.add_numeric_preference("num_segment_jobs",
+                                         description=_("The number of segments of a long asset "
+                                                       "transcoded in parallel. 0 means the "
+                                                       "processors are shared between the jobs."),
+                                         section="_proxies",
+                                         label=_("Parallel segments per transcoding job"),
+                                         lower=0)
+
+# The interval for measuring the transcoding throughput, in seconds.
+AUTOSCALE_INTERVAL = 10
+# The CPU usage of the other processes, per CPU, above which the
+# transcoding jobs are reduced.
+AUTOSCALE_MAX_LOAD = 0.5
+# The min relative increase of the throughput for an additional job to be kept.
+AUTOSCALE_MIN_GAIN = 0.05
+# The number of intervals during which no job is added after one has been
+# taken back for not increasing the throughput.
+AUTOSCALE_HOLD_INTERVALS = 6
+
+# The delay for saving the changes of the proxy jobs journal, in milliseconds.
+JOURNAL_SAVE_DELAY_MS = 1000
+# The max number of failed jobs kept in the proxy jobs journal.
+JOURNAL_MAX_FAILED_JOBS = 50
+# The time after which the failed jobs are forgotten, in seconds.
+JOURNAL_FAILED_JOBS_MAX_AGE = 30 * 24 * 3600
+
 ENCODING_FORMAT_PRORES = "prores-raw-in-qt.gep"
 ENCODING_FORMAT_JPEG = "jpeg-raw-in-qt.gep"
 
 
+class JobState:
+    """The states of the transcoding jobs recorded in the ProxyJobsJournal."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    FAILED = "failed"
+
+
+class ProxyJobsJournal(Loggable):
+    """The transcoding jobs of all the projects, saved to resume them.
+
+    The jobs are keyed by the URI of the proxy they create. The changes
+    are saved shortly after they are done, so a burst of changes results
+    in a single write.
+
+    Attributes:
+        path (str): The path of the journal file.
+        jobs (dict): The jobs, as dicts with the URI of the "asset", the
+            "scaled", "shadow" and "force" flags, the "max-size" of the
+            scaled proxy, the "state", the "error" if it failed and the
+            "time" of the last state change.
+    """
+
+    def __init__(self, path):
+        Loggable.__init__(self)
+        self.path = path
+        self.jobs = {}
+        self.__save_source = 0
+
+    def load(self):
+        """Loads the jobs saved by a previous session.
+
+        The malformed jobs are ignored.
+        """
+        self.jobs = {}
+        try:
+            with open(self.path) as journal_file:
+                jobs = json.load(journal_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            self.warning("Ignoring the proxy jobs journal %s: %s", self.path, e)
+            return
+
+        if not isinstance(jobs, dict):
+            self.warning("Ignoring the malformed proxy jobs journal %s", self.path)
+            return
+
+        for proxy_uri, job in jobs.items():
+            if self._is_valid_job(job):
+                self.jobs[proxy_uri] = job
+            else:
+                self.warning("Ignoring the malformed proxy job %s: %s", proxy_uri, job)
+        self._forget_failed_jobs()
+
+    @staticmethod
+    def _is_valid_job(job):
+        """Checks whether a job loaded from the journal file can be used."""
+        if not isinstance(job, dict):
+            return False
+
+        max_size = job.get("max-size")
+        return isinstance(job.get("asset"), str) and \
+            isinstance(job.get("scaled"), bool) and \
+            isinstance(job.get("shadow"), bool) and \
+            isinstance(job.get("force", False), bool) and \
+            job.get("state") in (JobState.QUEUED, JobState.RUNNING, JobState.FAILED) and \
+            isinstance(job.get("time", 0), (int, float)) and \
+            (max_size is None or
+             isinstance(max_size, list) and len(max_size) == 2 and
+             all(isinstance(value, int) for value in max_size))
+
+    def _forget_failed_jobs(self):
+        """Forgets the oldest failed jobs."""
+        min_time = time.time() - JOURNAL_FAILED_JOBS_MAX_AGE
+        failed = [(job.get("time", 0), proxy_uri) for proxy_uri, job in self.jobs.items()
+                  if job["state"] == JobState.FAILED]
+        failed.sort(reverse=True)
+        for index, (failure_time, proxy_uri) in enumerate(failed):
+            if index >= JOURNAL_MAX_FAILED_JOBS or failure_time < min_time:
+                del self.jobs[proxy_uri]
+
+    def _schedule_save(self):
+        """Saves the jobs after a while, with the changes done meanwhile."""
+        if not self.__save_source:
+            self.__save_source = GLib.timeout_add(JOURNAL_SAVE_DELAY_MS, self.__save_cb)
+
+    def __save_cb(self):
+        self.__save_source = 0
+        self.save()
+        return False
+
+    def flush(self):
+        """Saves the jobs now if there are unsaved changes."""
+        if self.__save_source:
+            GLib.source_remove(self.__save_source)
+            self.__save_source = 0
+            self.save()
+
+    def save(self):
+        """Saves the jobs, replacing the journal file atomically."""
+        try:
+            with open(self.path + ProxyManager.part_suffix, "w") as journal_file:
+                json.dump(self.jobs, journal_file)
+            os.replace(self.path + ProxyManager.part_suffix, self.path)
+        except OSError as e:
+            self.warning("Failed saving the proxy jobs journal %s: %s", self.path, e)
+
+    def record(self, proxy_uri, asset_uri, scaled, shadow, max_size, state, force=False):
+        """Records a job and schedules saving the journal.
+
+        The jobs recorded previously for the same asset and kind of proxy
+        are forgotten, since their proxy URI is stale.
+        """
+        stale = [uri for uri, job in self.jobs.items()
+                 if job["asset"] == asset_uri and job["scaled"] == scaled and uri != proxy_uri]
+        for uri in stale:
+            del self.jobs[uri]
+
+        self.jobs[proxy_uri] = {"asset": asset_uri,
+                                "scaled": scaled,
+                                "shadow": shadow,
+                                "force": force,
+                                "max-size": max_size,
+                                "state": state,
+                                "error": None,
+                                "time": time.time()}
+        self._schedule_save()
+
+    def set_state(self, proxy_uri, state, error=None):
+        """Updates the state of a recorded job and schedules saving the journal."""
+        job = self.jobs.get(proxy_uri)
+        if not job:
+            return
+
+        job["state"] = state
+        job["error"] = error
+        job["time"] = time.time()
+        if state == JobState.FAILED:
+            self._forget_failed_jobs()
+        self._schedule_save()
+
+    def remove(self, proxy_uri):
+        """Forgets a job and schedules saving the journal."""
+        if self.jobs.pop(proxy_uri, None):
+            self._schedule_save()
+
+    def resumable_jobs(self):
+        """Gets the queued and running jobs, in the queueing order.
+
+        Returns:
+            List[tuple]: The (proxy URI, job) pairs.
+        """
+        return [(proxy_uri, job) for proxy_uri, job in self.jobs.items()
+                if job["state"] in (JobState.QUEUED, JobState.RUNNING)]
+
+
 def create_encoding_profile_simple(container_caps, audio_caps, video_caps):
     container_profile = GstPbutils.EncodingContainerProfile.new(None, None,
                                                                 Gst.Caps(container_caps),
@@ -117,6 +356,7 @@ class ProxyManager(GObject.Object, Loggable):
 
     __gsignals__ = {
         "progress": (GObject.SignalFlags.RUN_LAST, None, (object, int, int)),
+        "queue-changed": (GObject.SignalFlags.RUN_LAST, None, ()),
         "proxy-ready": (GObject.SignalFlags.RUN_LAST, None, (object, object)),
         "asset-preparing-cancelled": (GObject.SignalFlags.RUN_LAST, None, (object,)),
         "error-preparing-asset": (GObject.SignalFlags.RUN_LAST, None, (object, object, object)),
@@ -163,6 +403,34 @@ class ProxyManager(GObject.Object, Loggable):
         # HQ proxy transcoder to finish.
         self.__waiting_transcoders = []
 
+        # The URIs of the assets selected in the media library.
+        self.__selected_uris = set()
+        self.__playhead_position = 0
+        self.__reprioritize_source = 0
+        # The positions in the queue of the assets with pending transcoders.
+        self.__queue_positions = {}
+
+        # The number of transcoders allowed to run when autoscaling.
+        self.__jobs_limit = self.app.settings.min_transcoding_jobs
+        # The last position of each running transcoder, in nanoseconds.
+        self.__transcoder_positions = {}
+        # The seconds transcoded by all the transcoders since the last measurement.
+        self.__transcoded_seconds = 0
+        self.__autoscale_source = 0
+        self.__autoscale_time = 0
+        self.__load_tracker = SystemLoadTracker()
+        # The throughput measured before the last change of the jobs limit,
+        # if the limit has been increased, otherwise None.
+        self.__previous_throughput = None
+        self.__hold_intervals = 0
+        self.journal = ProxyJobsJournal(os.path.join(xdg_cache_home(), "proxy-jobs.json"))
+        self.journal.load()
+
+        self.app.settings.connect("num_transcoding_jobsChanged", self.__jobs_settings_changed_cb)
+        self.app.settings.connect("min_transcoding_jobsChanged", self.__jobs_settings_changed_cb)
+        self.app.settings.connect("autoscale_transcoding_jobsChanged",
+                                  self.__jobs_settings_changed_cb)
+
         self.__encoding_target_file = None
         self.proxying_unsupported = False
         for encoding_format in [ENCODING_FORMAT_JPEG, ENCODING_FORMAT_PRORES]:
@@ -329,12 +597,18 @@ class ProxyManager(GObject.Object, Loggable):
 
         return uri
 
-    def get_proxy_uri(self, asset, scaled=False):
+    def get_proxy_uri(self, asset, scaled=False, max_size=None):
         """Gets the URI of the corresponding proxy file for the specified asset.
 
         The name looks like:
             <filename>.<file_size>[.<proxy_resolution>].<proxy_extension>
 
+        Args:
+            asset (GES.UriClipAsset): The asset to be proxied.
+            scaled (Optional[bool]): Whether the proxy is a scaled proxy.
+            max_size (Optional[List[int]]): The max width and height of the
+                scaled proxy, by default the ones of the current project.
+
         Returns:
             str: The URI or None if it can't be computed for any reason.
         """
@@ -353,8 +627,7 @@ class ProxyManager(GObject.Object, Loggable):
             if not asset.get_info().get_video_streams():
                 return None
 
-            max_w = self.app.project_manager.current_project.scaled_proxy_width
-            max_h = self.app.project_manager.current_project.scaled_proxy_height
+            max_w, max_h = self._get_scaled_proxy_size(max_size)
             t_width, t_height = self._scale_asset_resolution(asset, max_w, max_h)
             proxy_res = "%sx%s" % (t_width, t_height)
             return "%s.%s.%s.%s" % (asset.get_id(), file_size, proxy_res,
@@ -371,18 +644,35 @@ class ProxyManager(GObject.Object, Loggable):
 
         return False
 
-    def asset_matches_target_res(self, asset):
+    def _get_scaled_proxy_size(self, max_size=None):
+        """Gets the max width and height of the scaled proxies.
+
+        Args:
+            max_size (Optional[List[int]]): The size to use instead of the
+                size set in the project.
+        """
+        if max_size:
+            return max_size
+
+        project = self.app.project_manager.current_project
+        if project:
+            return project.scaled_proxy_width, project.scaled_proxy_height
+
+        # The jobs of the previous session are restored before a project
+        # is loaded.
+        return self.app.settings.default_scaled_proxy_width, \
+            self.app.settings.default_scaled_proxy_height
+
+    def asset_matches_target_res(self, asset, max_size=None):
         """Returns whether the asset's size <= the scaled proxy size."""
         stream = asset.get_info().get_video_streams()[0]
 
         asset_res = (stream.get_width(), stream.get_height())
-        target_res = self._scale_asset_resolution(asset,
-                                                  self.app.project_manager.current_project.scaled_proxy_width,
-                                                  self.app.project_manager.current_project.scaled_proxy_height)
+        target_res = self._scale_asset_resolution(asset, *self._get_scaled_proxy_size(max_size))
 
         return asset_res == target_res
 
-    def __asset_needs_transcoding(self, asset, scaled=False):
+    def __asset_needs_transcoding(self, asset, scaled=False, max_size=None):
         if self.proxying_unsupported:
             self.info("No proxying supported")
             return False
@@ -396,7 +686,7 @@ class ProxyManager(GObject.Object, Loggable):
             return False
 
         if self.app.settings.proxying_strategy == ProxyingStrategy.AUTOMATIC \
-                and scaled and not self.asset_matches_target_res(asset):
+                and scaled and not self.asset_matches_target_res(asset, max_size):
             return True
 
         if self.app.settings.proxying_strategy == ProxyingStrategy.AUTOMATIC \
@@ -430,6 +720,194 @@ class ProxyManager(GObject.Object, Loggable):
             self._start_proxying_time = time.time()
         transcoder.run_async()
         self.__running_transcoders.append(transcoder)
+        self.journal.set_state(self._get_transcoder_proxy_uri(transcoder), JobState.RUNNING)
+        self.__start_autoscaling()
+
+    def __start_pending_transcoders(self):
+        """Starts the pending transcoders with the highest priority, up to the jobs limit."""
+        if not self.__pending_transcoders:
+            return
+
+        self._sort_pending_transcoders()
+        while self.__pending_transcoders and \
+                len(self.__running_transcoders) < self.get_max_running_jobs():
+            self.__start_transcoder(self.__pending_transcoders.pop(0))
+        self.__update_queue_positions()
+
+    def get_max_running_jobs(self):
+        """Gets the number of transcoders allowed to run in parallel."""
+        max_jobs = self.app.settings.num_transcoding_jobs
+        if not self.app.settings.autoscale_transcoding_jobs:
+            return max_jobs
+
+        min_jobs = min(self.app.settings.min_transcoding_jobs, max_jobs)
+        return max(min_jobs, min(self.__jobs_limit, max_jobs))
+
+    def __jobs_settings_changed_cb(self, unused_settings):
+        self.__jobs_limit = self.get_max_running_jobs()
+        self.__start_pending_transcoders()
+
+    def __start_autoscaling(self):
+        if self.__autoscale_source or not self.app.settings.autoscale_transcoding_jobs:
+            return
+
+        self.__transcoded_seconds = 0
+        self.__autoscale_time = time.time()
+        self.__load_tracker.reset()
+        self.__previous_throughput = None
+        self.__hold_intervals = 0
+        self.__autoscale_source = GLib.timeout_add_seconds(AUTOSCALE_INTERVAL,
+                                                           self.__autoscale_timeout_cb)
+
+    def __autoscale_timeout_cb(self):
+        if not self.__running_transcoders or \
+                not self.app.settings.autoscale_transcoding_jobs:
+            self.__autoscale_source = 0
+            return False
+
+        now = time.time()
+        throughput = self.__transcoded_seconds / max(now - self.__autoscale_time, 1e-3)
+        self.__transcoded_seconds = 0
+        self.__autoscale_time = now
+        # Measured over the same interval as the throughput, without the
+        # CPU usage of the transcoders.
+        load = self.__load_tracker.load()
+        self.__load_tracker.reset()
+
+        self._autoscale(throughput, load)
+        self.__start_pending_transcoders()
+        return True
+
+    def _autoscale(self, throughput, load):
+        """Adapts the jobs limit to the measurements done while transcoding.
+
+        An additional job is allowed while the system is not overloaded,
+        and it is taken back when it did not increase the throughput.
+
+        Args:
+            throughput (float): The transcoded seconds per wall-clock second.
+            load (Optional[float]): The CPU usage of the other processes per
+                CPU, or None if it cannot be measured.
+        """
+        limit = self.get_max_running_jobs()
+        max_jobs = self.app.settings.num_transcoding_jobs
+        min_jobs = min(self.app.settings.min_transcoding_jobs, max_jobs)
+
+        previous_throughput = self.__previous_throughput
+        self.__previous_throughput = None
+        self.__hold_intervals = max(0, self.__hold_intervals - 1)
+        if load is not None and load > AUTOSCALE_MAX_LOAD:
+            new_limit = max(min_jobs, limit - 1)
+        elif previous_throughput is not None and \
+                throughput < previous_throughput * (1 + AUTOSCALE_MIN_GAIN):
+            new_limit = max(min_jobs, limit - 1)
+            self.__hold_intervals = AUTOSCALE_HOLD_INTERVALS
+        elif self.__pending_transcoders and limit < max_jobs and \
+                len(self.__running_transcoders) >= limit and not self.__hold_intervals:
+            new_limit = limit + 1
+            self.__previous_throughput = throughput
+        else:
+            new_limit = limit
+
+        self.__jobs_limit = new_limit
+        if new_limit != limit:
+            self.info("Transcoding jobs limit changed from %d to %d,"
+                      " throughput: %.2f, load: %s", limit, new_limit, throughput, load)
+        else:
+            self.debug("Transcoding jobs limit kept at %d,"
+                       " throughput: %.2f, load: %s", limit, throughput, load)
+
+    def set_selected_assets(self, assets):
+        """Sets the assets selected in the media library, to be prioritized."""
+        self.__selected_uris = {self.get_target_uri(asset) for asset in assets}
+        self.reprioritize()
+
+    def set_playhead_position(self, position):
+        """Sets the position of the playhead, to prioritize the clips around it."""
+        self.__playhead_position = position
+        self.reprioritize()
+
+    def reprioritize(self):
+        """Schedules sorting the pending transcoding jobs by priority."""
+        if self.__reprioritize_source or not self.__pending_transcoders:
+            return
+
+        self.__reprioritize_source = GLib.idle_add(self.__reprioritize_idle_cb,
+                                                   priority=GLib.PRIORITY_LOW)
+
+    def __reprioritize_idle_cb(self):
+        self.__reprioritize_source = 0
+        self._sort_pending_transcoders()
+        self.__update_queue_positions()
+        return False
+
+    def __timeline_distances(self):
+        """Gets the distances between the playhead and the assets in the timeline.
+
+        Returns:
+            dict: The distance in nanoseconds between the playhead and the
+            closest clip of each asset, keyed by the URI of the asset.
+        """
+        distances = {}
+        project = self.app.project_manager.current_project
+        if not project or not project.ges_timeline:
+            return distances
+
+        position = self.__playhead_position
+        for clip in project.ges_timeline.iter_clips():
+            if not isinstance(clip, GES.UriClip):
+                continue
+
+            start = clip.props.start
+            end = start + clip.props.duration
+            if start <= position < end:
+                distance = 0
+            else:
+                distance = min(abs(start - position), abs(end - position))
+            uri = self.get_target_uri(clip.props.uri)
+            distances[uri] = min(distance, distances.get(uri, distance))
+        return distances
+
+    def _job_priority(self, transcoder, distances):
+        """Gets the sorting key of the specified transcoder.
+
+        Args:
+            transcoder (GstTranscoder.Transcoder): The pending transcoder.
+            distances (dict): The distances between the playhead and the
+                assets in the timeline, see `__timeline_distances`.
+
+        Returns:
+            tuple: The JobPriority and the distance to the playhead.
+        """
+        uri = transcoder.props.src_uri
+        if uri in distances:
+            return JobPriority.TIMELINE, distances[uri]
+
+        if uri in self.__selected_uris:
+            return JobPriority.SELECTED, 0
+
+        return JobPriority.OTHER, 0
+
+    def _sort_pending_transcoders(self):
+        """Sorts the pending transcoders by priority, keeping the import order otherwise."""
+        distances = self.__timeline_distances()
+        self.__pending_transcoders.sort(
+            key=lambda transcoder: self._job_priority(transcoder, distances))
+
+    def __update_queue_positions(self):
+        """Updates the positions of the assets in the queue, for display."""
+        positions = {}
+        for index, transcoder in enumerate(self.__pending_transcoders):
+            positions.setdefault(transcoder.asset, index + 1)
+        if positions == self.__queue_positions:
+            return
+
+        for asset in self.__queue_positions:
+            asset.proxy_queue_position = 0
+        for asset, position in positions.items():
+            asset.proxy_queue_position = position
+        self.__queue_positions = positions
+        self.emit("queue-changed")
 
     def __assets_match(self, asset, proxy):
         if self.__asset_needs_transcoding(proxy):
@@ -460,14 +938,16 @@ class ProxyManager(GObject.Object, Loggable):
                 self.__create_transcoder(asset)
                 return
         else:
-            if transcoder.props.pipeline.props.video_filter:
-                transcoder.props.pipeline.props.video_filter.finalize()
+            if not isinstance(transcoder, SegmentedTranscoder):
+                if transcoder.props.pipeline.props.video_filter:
+                    transcoder.props.pipeline.props.video_filter.finalize()
 
-            if transcoder.props.pipeline.props.audio_filter:
-                transcoder.props.pipeline.props.audio_filter.finalize()
+                if transcoder.props.pipeline.props.audio_filter:
+                    transcoder.props.pipeline.props.audio_filter.finalize()
 
             del transcoder
 
+        project = self.app.project_manager.current_project
         asset_duration = asset_get_duration(asset)
         proxy_duration = asset_get_duration(proxy)
         if asset_duration != proxy_duration:
@@ -479,7 +959,9 @@ class ProxyManager(GObject.Object, Loggable):
             proxy.set_uint64(ASSET_DURATION_META, duration)
             target_uri = self.get_target_uri(asset)
 
-            for clip in self.app.project_manager.current_project.ges_timeline.iter_clips():
+            # The jobs restored from the journal can finish before a project is loaded.
+            clips = project.ges_timeline.iter_clips() if project else []
+            for clip in clips:
                 if not isinstance(clip, GES.UriClip):
                     continue
                 if self.get_target_uri(clip.props.uri) == target_uri:
@@ -501,12 +983,15 @@ class ProxyManager(GObject.Object, Loggable):
                         clip.set_max_duration(duration)
 
         if shadow:
-            self.app.project_manager.current_project.finalize_proxy(proxy)
+            if project:
+                project.finalize_proxy(proxy)
         else:
             self.emit("proxy-ready", asset, proxy)
             self.__emit_progress(proxy, 100)
 
     def __transcoder_error_cb(self, _, error, unused_details, asset, transcoder):
+        self.journal.set_state(self._get_transcoder_proxy_uri(transcoder), JobState.FAILED,
+                               error.message if isinstance(error, GLib.Error) else str(error))
         self.emit("error-preparing-asset", asset, None, error)
 
     def __transcoder_done_cb(self, emitter, asset, transcoder):
@@ -519,6 +1004,7 @@ class ProxyManager(GObject.Object, Loggable):
         self.__running_transcoders.remove(transcoder)
 
         proxy_uri = transcoder.props.dest_uri.rstrip(ProxyManager.part_suffix)
+        self.journal.remove(self._get_transcoder_proxy_uri(transcoder))
         os.rename(Gst.uri_get_location(transcoder.props.dest_uri),
                   Gst.uri_get_location(proxy_uri))
 
@@ -548,13 +1034,12 @@ class ProxyManager(GObject.Object, Loggable):
                     self.__waiting_transcoders.remove(pair)
                     break
 
-        try:
-            self.__start_transcoder(self.__pending_transcoders.pop())
-        except IndexError:
-            if not self.__running_transcoders:
-                self._transcoded_durations = {}
-                self._total_time_to_transcode = 0
-                self._start_proxying_time = 0
+        self.__transcoder_positions.pop(transcoder, None)
+        self.__start_pending_transcoders()
+        if not self.__running_transcoders:
+            self._transcoded_durations = {}
+            self._total_time_to_transcode = 0
+            self._start_proxying_time = 0
 
     def __emit_progress(self, asset, creation_progress):
         """Handles the transcoding progress of the specified asset."""
@@ -574,6 +1059,10 @@ class ProxyManager(GObject.Object, Loggable):
             self.info("Position changed after job cancelled!")
             return
 
+        previous_position = self.__transcoder_positions.get(transcoder, 0)
+        self.__transcoder_positions[transcoder] = position
+        self.__transcoded_seconds += max(0, position - previous_position) / Gst.SECOND
+
         second_transcoder = self._get_second_transcoder(transcoder)
         if second_transcoder is not None:
             position = (position + second_transcoder.props.position) // 2
@@ -602,6 +1091,13 @@ class ProxyManager(GObject.Object, Loggable):
                 return transcoder2
         return None
 
+    def _get_transcoder_proxy_uri(self, transcoder):
+        """Gets the URI of the proxy created by the specified transcoder."""
+        dest_uri = transcoder.props.dest_uri
+        if dest_uri.endswith(ProxyManager.part_suffix):
+            dest_uri = dest_uri[:-len(ProxyManager.part_suffix)]
+        return dest_uri
+
     def _is_shadow_transcoder(self, transcoder):
         if transcoder.props.position_update_interval == 1001:
             return True
@@ -639,10 +1135,42 @@ class ProxyManager(GObject.Object, Loggable):
 
         return is_queued
 
-    def __create_transcoder(self, asset, scaled=False, shadow=False):
+    def __new_transcoder(self, src_uri, dest_uri, enc_profile):
+        """Creates a transcoder and gets the object emitting its signals.
+
+        Returns:
+            (GstTranscoder.Transcoder, GObject.Object): The transcoder and
+            its signals emitter.
+        """
+        if HAS_GST_1_19:
+            transcoder = GstTranscoder.Transcoder.new_full(src_uri, dest_uri, enc_profile)
+            signals_emitter = transcoder.get_signal_adapter(None)
+        else:
+            dispatcher = GstTranscoder.TranscoderGMainContextSignalDispatcher.new()
+            signals_emitter = transcoder = GstTranscoder.Transcoder.new_full(
+                src_uri, dest_uri, enc_profile, dispatcher)
+        return transcoder, signals_emitter
+
+    def _segment_parallelism(self):
+        """Gets the number of segments of an asset to transcode concurrently."""
+        if self.app.settings.num_segment_jobs > 0:
+            return self.app.settings.num_segment_jobs
+
+        return max(1, (os.cpu_count() or 1) // self.get_max_running_jobs())
+
+    def _is_segmentable(self, asset):
+        """Returns whether the asset is long enough to be transcoded in segments."""
+        segment_duration = self.app.settings.proxy_segment_duration * Gst.SECOND
+        if segment_duration <= 0:
+            return False
+
+        return asset.get_duration() > 2 * segment_duration
+
+    def __create_transcoder(self, asset, scaled=False, shadow=False, max_size=None,
+                            force=False):
         self._total_time_to_transcode += asset.get_duration() / Gst.SECOND
         asset_uri = asset.get_id()
-        proxy_uri = self.get_proxy_uri(asset, scaled=scaled)
+        proxy_uri = self.get_proxy_uri(asset, scaled=scaled, max_size=max_size)
 
         if Gio.File.new_for_uri(proxy_uri).query_exists(None):
             self.debug("Using proxy already generated: %s", proxy_uri)
@@ -654,48 +1182,51 @@ class ProxyManager(GObject.Object, Loggable):
 
         self.debug("Creating a proxy for %s (strategy: %s, force: %s, scaled: %s)",
                    asset.get_id(), self.app.settings.proxying_strategy,
-                   asset.force_proxying, scaled)
+                   force, scaled)
 
         width = None
         height = None
         if scaled:
+            w, h = self._get_scaled_proxy_size(max_size)
             project = self.app.project_manager.current_project
-            w = project.scaled_proxy_width
-            h = project.scaled_proxy_height
-            if not project.has_scaled_proxy_size():
+            if not max_size and project and not project.has_scaled_proxy_size():
                 project.scaled_proxy_width = w
                 project.scaled_proxy_height = h
+            max_size = [w, h]
             width, height = self._scale_asset_resolution(asset, w, h)
         enc_profile = self.__get_encoding_profile(self.__encoding_target_file,
                                                   asset, width, height)
 
-        if HAS_GST_1_19:
-            transcoder = GstTranscoder.Transcoder.new_full(
-                asset_uri, proxy_uri + ProxyManager.part_suffix, enc_profile)
-            signals_emitter = transcoder.get_signal_adapter(None)
+        dest_uri = proxy_uri + ProxyManager.part_suffix
+        if self._is_segmentable(asset):
+            segment_duration = self.app.settings.proxy_segment_duration * Gst.SECOND
+            signals_emitter = transcoder = SegmentedTranscoder(
+                asset, dest_uri, enc_profile, segment_duration, self.__new_transcoder)
+            transcoder.props.parallelism = self._segment_parallelism()
         else:
-            dispatcher = GstTranscoder.TranscoderGMainContextSignalDispatcher.new()
-            signals_emitter = transcoder = GstTranscoder.Transcoder.new_full(
-                asset_uri, proxy_uri + ProxyManager.part_suffix, enc_profile,
-                dispatcher)
+            transcoder, signals_emitter = self.__new_transcoder(asset_uri, dest_uri, enc_profile)
 
         if shadow:
             # Used to identify shadow transcoder
             transcoder.props.position_update_interval = 1001
         else:
             transcoder.props.position_update_interval = 1000
+        transcoder.asset = asset
 
         info = asset.get_info()
-        if info.get_video_streams():
-            thumbnailbin = Gst.ElementFactory.make("teedthumbnailbin")
-            thumbnailbin.props.uri = asset.get_id()
-            transcoder.props.pipeline.props.video_filter = thumbnailbin
+        # The segments cover only parts of the asset, so the thumbnails and
+        # the waveforms of segmented transcodings are left to the previewers.
+        if not isinstance(transcoder, SegmentedTranscoder):
+            if info.get_video_streams():
+                thumbnailbin = Gst.ElementFactory.make("teedthumbnailbin")
+                thumbnailbin.props.uri = asset.get_id()
+                transcoder.props.pipeline.props.video_filter = thumbnailbin
 
-        if info.get_audio_streams():
-            waveformbin = Gst.ElementFactory.make("waveformbin")
-            waveformbin.props.uri = asset.get_id()
-            waveformbin.props.duration = asset.get_duration()
-            transcoder.props.pipeline.props.audio_filter = waveformbin
+            if info.get_audio_streams():
+                waveformbin = Gst.ElementFactory.make("waveformbin")
+                waveformbin.props.uri = asset.get_id()
+                waveformbin.props.duration = asset.get_duration()
+                transcoder.props.pipeline.props.audio_filter = waveformbin
 
         transcoder.set_cpu_usage(self.app.settings.max_cpu_usage)
         signals_emitter.connect("position-updated",
@@ -705,10 +1236,14 @@ class ProxyManager(GObject.Object, Loggable):
         signals_emitter.connect("done", self.__transcoder_done_cb, asset, transcoder)
         signals_emitter.connect("error", self.__transcoder_error_cb, asset, transcoder)
 
-        if len(self.__running_transcoders) < self.app.settings.num_transcoding_jobs:
+        self.journal.record(proxy_uri, asset_uri, scaled, shadow, max_size, JobState.QUEUED,
+                            force=force)
+        if len(self.__running_transcoders) < self.get_max_running_jobs():
             self.__start_transcoder(transcoder)
         else:
             self.__pending_transcoders.append(transcoder)
+            self.__update_queue_positions()
+            self.reprioritize()
 
     def cancel_job(self, asset):
         """Cancels the transcoding job for the specified asset, if any.
@@ -724,7 +1259,12 @@ class ProxyManager(GObject.Object, Loggable):
                 self.info("Cancelling running transcoder %s %s",
                           transcoder.props.src_uri,
                           transcoder.__grefcount__)
+                if isinstance(transcoder, SegmentedTranscoder):
+                    # Keep the completed segments for resuming later.
+                    transcoder.stop()
                 self.__running_transcoders.remove(transcoder)
+                self.__transcoder_positions.pop(transcoder, None)
+                self.journal.remove(self._get_transcoder_proxy_uri(transcoder))
                 self.emit("asset-preparing-cancelled", asset)
 
         for transcoder in self.__pending_transcoders:
@@ -735,9 +1275,11 @@ class ProxyManager(GObject.Object, Loggable):
                 # will lead to its destruction (only reference)
                 # here, which means it will be stopped.
                 self.__pending_transcoders.remove(transcoder)
+                self.journal.remove(self._get_transcoder_proxy_uri(transcoder))
                 self.emit("asset-preparing-cancelled", asset)
+        self.__update_queue_positions()
 
-    def add_job(self, asset, scaled=False, shadow=False):
+    def add_job(self, asset, scaled=False, shadow=False, max_size=None, force=False):
         """Adds a transcoding job for the specified asset if needed.
 
         Args:
@@ -746,13 +1288,19 @@ class ProxyManager(GObject.Object, Loggable):
                 of a high-quality proxy.
             shadow (Optional[bool]): Whether to create a high-quality proxy
                 to shadow a scaled proxy.
+            max_size (Optional[List[int]]): The max width and height of the
+                scaled proxy, by default the size set in the project.
+            force (Optional[bool]): Whether to transcode the asset even if
+                not needed, when it has not been loaded by a project.
         """
-        force_proxying = asset.force_proxying
+        # The assets loaded by the project say whether the user asked for
+        # proxying them.
+        force_proxying = getattr(asset, "force_proxying", force)
         video_streams = asset.get_info().get_video_streams()
         if video_streams:
             # Handle Automatic scaling
             if self.app.settings.auto_scaling_enabled and not force_proxying \
-                    and not shadow and not self.asset_matches_target_res(asset):
+                    and not shadow and not self.asset_matches_target_res(asset, max_size):
                 scaled = True
 
             # Create shadow proxies for unsupported assets
@@ -771,14 +1319,51 @@ class ProxyManager(GObject.Object, Loggable):
             return
 
         if not force_proxying:
-            if not self.__asset_needs_transcoding(asset, scaled):
+            if not self.__asset_needs_transcoding(asset, scaled, max_size):
                 self.debug("Not proxying asset (proxying disabled: %s)",
                            self.proxying_unsupported)
                 # Make sure to notify we do not need a proxy for that asset.
                 self.emit("proxy-ready", asset, None)
                 return
 
-        self.__create_transcoder(asset, scaled=scaled, shadow=shadow)
+        self.__create_transcoder(asset, scaled=scaled, shadow=shadow, max_size=max_size,
+                                 force=force_proxying)
+
+    def restore_jobs(self):
+        """Resumes in the background the jobs of the previous session.
+
+        The jobs which failed are kept in the journal but not retried.
+        """
+        if self.proxying_unsupported:
+            return
+
+        for proxy_uri, job in self.journal.resumable_jobs():
+            if Gio.File.new_for_uri(proxy_uri).query_exists(None) or \
+                    not Gio.File.new_for_uri(job["asset"]).query_exists(None):
+                self.journal.remove(proxy_uri)
+                continue
+
+            self.info("Restoring the proxying of %s", job["asset"])
+            GES.Asset.request_async(GES.UriClip, job["asset"], None,
+                                    self.__restored_asset_loaded_cb, proxy_uri, job)
+
+    def __restored_asset_loaded_cb(self, unused_source, res, proxy_uri, job):
+        try:
+            asset = GES.Asset.request_finish(res)
+        except GLib.Error as e:
+            self.info("Not restoring the proxying of %s: %s", job["asset"], e)
+            self.journal.remove(proxy_uri)
+            return
+
+        scaled = job["scaled"]
+        if self.is_asset_queued(asset, scaling=scaled, optimisation=not scaled):
+            # The project has been loaded meanwhile.
+            return
+
+        # The job is recorded again if it's still needed.
+        self.journal.remove(proxy_uri)
+        self.add_job(asset, scaled=scaled, shadow=job["shadow"],
+                     max_size=job["max-size"], force=job.get("force", False))
 
 
 def get_proxy_target(obj):
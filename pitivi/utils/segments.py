@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Transcoding of the proxies in resumable segments."""
+import json
+import os
+import shutil
+
+from gi.repository import GES
+from gi.repository import GLib
+from gi.repository import GObject
+from gi.repository import Gst
+
+from pitivi.utils.loggable import Loggable
+
+# The suffix of the directory holding the segments of a proxy.
+SEGMENTS_DIR_SUFFIX = ".segments"
+# The name of the manifest of the segments, in the segments directory.
+MANIFEST_FILENAME = "manifest.json"
+PART_SUFFIX = ".part"
+# The max difference between the duration of the joined segments and the
+# duration of the asset, when the framerate is not known.
+MAX_JOIN_DRIFT = Gst.SECOND // 10
+
+
+def get_segments_dir(proxy_uri):
+    """Gets the directory where the segments of the proxy are created."""
+    return Gst.uri_get_location(proxy_uri) + SEGMENTS_DIR_SUFFIX
+
+
+class SegmentsManifest:
+    """The completed segments of a proxy, saved next to the segments.
+
+    When the framerate of the asset is known, the segments are a whole
+    number of frames long and start at frame timestamps, so the timestamps
+    of the frames don't drift once the segments are joined.
+
+    Attributes:
+        path (str): The path of the manifest file.
+        duration (int): The duration of the asset.
+        segment_duration (int): The duration of the segments.
+        framerate (Optional[Tuple[int, int]]): The numerator and the
+            denominator of the video framerate of the asset.
+        segment_frames (int): The number of frames of the segments, or 0
+            if the framerate is not known.
+        done (Set[int]): The indexes of the completed segments.
+    """
+
+    def __init__(self, path, duration, segment_duration, framerate=None):
+        self.path = path
+        self.duration = duration
+        self.framerate = None
+        self.segment_frames = 0
+        if framerate and framerate[0] > 0 and framerate[1] > 0:
+            self.framerate = tuple(framerate)
+            self.segment_frames = max(1, round(
+                segment_duration * framerate[0] / (framerate[1] * Gst.SECOND)))
+            segment_duration = self.frame_timestamp(self.segment_frames)
+        self.segment_duration = segment_duration
+        self.done = set()
+
+    def frame_timestamp(self, frame):
+        """Gets the timestamp of the specified frame.
+
+        Computed like `gst_util_uint64_scale` does, as the decoders do.
+        """
+        num, denom = self.framerate
+        return frame * denom * Gst.SECOND // num
+
+    @property
+    def frame_duration(self):
+        """The duration of a frame, or None if the framerate is not known."""
+        if not self.framerate:
+            return None
+        return self.frame_timestamp(1)
+
+    @property
+    def segments_count(self):
+        """The number of segments covering the asset."""
+        if self.segment_frames:
+            num, denom = self.framerate
+            segment_span = self.segment_frames * denom * Gst.SECOND
+            return max(1, -(-self.duration * num // segment_span))
+
+        return max(1, -(-self.duration // self.segment_duration))
+
+    def segment_range(self, index):
+        """Gets the start and the duration of the specified segment."""
+        if self.segment_frames:
+            start = self.frame_timestamp(index * self.segment_frames)
+            stop = self.frame_timestamp((index + 1) * self.segment_frames)
+        else:
+            start = index * self.segment_duration
+            stop = start + self.segment_duration
+        return start, min(stop, self.duration) - start
+
+    def load(self):
+        """Loads the completed segments, if the manifest is compatible.
+
+        Returns:
+            bool: Whether the manifest has been loaded.
+        """
+        try:
+            with open(self.path) as manifest_file:
+                data = json.load(manifest_file)
+        except (OSError, ValueError):
+            return False
+
+        framerate = data.get("framerate")
+        if data.get("duration") != self.duration or \
+                data.get("segment-duration") != self.segment_duration or \
+                (tuple(framerate) if framerate else None) != self.framerate:
+            return False
+
+        self.done = {index for index in data.get("done", [])
+                     if 0 <= index < self.segments_count}
+        return True
+
+    def save(self):
+        """Saves the completed segments."""
+        data = {"duration": self.duration,
+                "segment-duration": self.segment_duration,
+                "framerate": self.framerate,
+                "done": sorted(self.done)}
+        with open(self.path + PART_SUFFIX, "w") as manifest_file:
+            json.dump(data, manifest_file)
+        os.replace(self.path + PART_SUFFIX, self.path)
+
+
+class SegmentedTranscoder(GObject.Object, Loggable):
+    """Transcodes an asset in segments which are joined at the end.
+
+    The completed segments are recorded in a SegmentsManifest, so a job
+    interrupted by a cancellation or by quitting the app continues from
+    the last completed segment when it is started again.
+
+    Each segment is transcoded by a GstTranscoder.Transcoder from a GES
+    project holding the range of the asset. Up to `parallelism` segments
+    are transcoded concurrently. The proxy formats are intra only, so the
+    segments are joined without re-encoding.
+
+    Provides the subset of the GstTranscoder.Transcoder API used by the
+    ProxyManager, and emits the signals of its signal adapter.
+    """
+
+    __gsignals__ = {
+        "position-updated": (GObject.SignalFlags.RUN_LAST, None, (GObject.TYPE_UINT64,)),
+        "done": (GObject.SignalFlags.RUN_LAST, None, ()),
+        "error": (GObject.SignalFlags.RUN_LAST, None, (object, object)),
+    }
+
+    src_uri = GObject.Property(type=str)
+    dest_uri = GObject.Property(type=str)
+    position_update_interval = GObject.Property(type=int, default=100)
+    duration = GObject.Property(type=GObject.TYPE_UINT64)
+    position = GObject.Property(type=GObject.TYPE_UINT64)
+    parallelism = GObject.Property(type=int, default=1, minimum=1)
+
+    def __init__(self, asset, dest_uri, enc_profile, segment_duration, transcoder_factory):
+        """Initializes the transcoder.
+
+        Args:
+            asset (GES.UriClipAsset): The asset to transcode.
+            dest_uri (str): The URI of the file to create.
+            enc_profile (GstPbutils.EncodingContainerProfile): The profile
+                of the proxy, which must be intra only.
+            segment_duration (int): The duration of the segments.
+            transcoder_factory (function): Creates a GstTranscoder.Transcoder
+                for the specified source URI, destination URI and profile,
+                and returns it with the object emitting its signals.
+        """
+        GObject.Object.__init__(self)
+        Loggable.__init__(self)
+        self.props.src_uri = asset.props.id
+        self.props.dest_uri = dest_uri
+        self.props.duration = asset.get_duration()
+        self.asset = asset
+        self.enc_profile = enc_profile
+        self.transcoder_factory = transcoder_factory
+
+        proxy_uri = dest_uri
+        if proxy_uri.endswith(PART_SUFFIX):
+            proxy_uri = proxy_uri[:-len(PART_SUFFIX)]
+        self.segments_dir = get_segments_dir(proxy_uri)
+        self.manifest = SegmentsManifest(os.path.join(self.segments_dir, MANIFEST_FILENAME),
+                                         self.props.duration, segment_duration,
+                                         self.__get_framerate())
+
+        self._cpu_usage = 100
+        # The running segment transcoders with their signals emitters.
+        self._transcoders = {}
+        # The transcoded duration of the running segments.
+        self._positions = {}
+        self._join_pipeline = None
+        self._stopped = False
+
+    def __get_framerate(self):
+        """Gets the video framerate of the asset, if it's constant."""
+        info = self.asset.get_info()
+        if not info:
+            return None
+
+        streams = info.get_video_streams()
+        if not streams:
+            return None
+
+        stream = streams[0]
+        return stream.get_framerate_num(), stream.get_framerate_denom()
+
+    def set_cpu_usage(self, cpu_usage):
+        """Sets the CPU usage allowed to the segment transcoders."""
+        self._cpu_usage = cpu_usage
+        for transcoder, unused_emitter in self._transcoders.values():
+            transcoder.set_cpu_usage(cpu_usage)
+
+    def segment_location(self, index):
+        """Gets the path of the file of the specified segment."""
+        return os.path.join(self.segments_dir, "%05d.mov" % index)
+
+    def run_async(self):
+        """Starts transcoding the segments not completed yet."""
+        os.makedirs(self.segments_dir, exist_ok=True)
+        if self.manifest.load():
+            missing = {index for index in self.manifest.done
+                       if not os.path.exists(self.segment_location(index))}
+            self.manifest.done -= missing
+            self.info("Resuming %s with %d segments out of %d done",
+                      self.props.src_uri, len(self.manifest.done),
+                      self.manifest.segments_count)
+        else:
+            for name in os.listdir(self.segments_dir):
+                os.remove(os.path.join(self.segments_dir, name))
+            self.manifest.save()
+
+        self.__start_next_segments()
+
+    def stop(self):
+        """Stops transcoding, keeping the completed segments."""
+        self._stopped = True
+        for index in list(self._transcoders):
+            self.__release_segment_transcoder(index)
+        if self._join_pipeline:
+            self._join_pipeline.get_bus().remove_signal_watch()
+            self._join_pipeline.set_state(Gst.State.NULL)
+            self._join_pipeline = None
+
+    def __pending_segments(self):
+        return [index for index in range(self.manifest.segments_count)
+                if index not in self.manifest.done and index not in self._transcoders]
+
+    def __start_next_segments(self):
+        pending = self.__pending_segments()
+        if not pending:
+            if not self._transcoders:
+                self.__join()
+            return
+
+        for index in pending[:self.props.parallelism - len(self._transcoders)]:
+            self.__start_segment(index)
+
+    def __write_segment_project(self, index):
+        """Saves a GES project holding the range of the asset covered by the segment.
+
+        Returns:
+            str: The URI of the project.
+        """
+        start, duration = self.manifest.segment_range(index)
+        ges_timeline = GES.Timeline.new_audio_video()
+        info = self.asset.get_info()
+        for track in ges_timeline.get_tracks():
+            if track.props.track_type == GES.TrackType.VIDEO:
+                streams = info.get_video_streams()
+                if streams:
+                    stream = streams[0]
+                    track.set_restriction_caps(Gst.Caps.from_string(
+                        "video/x-raw,width=%d,height=%d,framerate=%d/%d" % (
+                            stream.get_width(), stream.get_height(),
+                            stream.get_framerate_num(), stream.get_framerate_denom())))
+                else:
+                    ges_timeline.remove_track(track)
+            elif track.props.track_type == GES.TrackType.AUDIO:
+                streams = info.get_audio_streams()
+                if streams:
+                    stream = streams[0]
+                    track.set_restriction_caps(Gst.Caps.from_string(
+                        "audio/x-raw,rate=%d,channels=%d" % (
+                            stream.get_sample_rate(), stream.get_channels())))
+                else:
+                    ges_timeline.remove_track(track)
+
+        ges_layer = ges_timeline.append_layer()
+        ges_layer.add_asset(self.asset, 0, start, duration, GES.TrackType.UNKNOWN)
+
+        project_uri = Gst.filename_to_uri(
+            os.path.join(self.segments_dir, "%05d.xges" % index))
+        ges_timeline.save_to_uri(project_uri, None, True)
+        return project_uri
+
+    def __start_segment(self, index):
+        self.debug("Transcoding segment %d of %s", index, self.props.src_uri)
+        try:
+            project_uri = self.__write_segment_project(index)
+        except GLib.Error as e:
+            self.emit("error", e, None)
+            return
+
+        dest_uri = Gst.filename_to_uri(self.segment_location(index) + PART_SUFFIX)
+        transcoder, emitter = self.transcoder_factory(project_uri, dest_uri,
+                                                      self.enc_profile.copy())
+        transcoder.props.position_update_interval = self.props.position_update_interval
+        transcoder.set_cpu_usage(self._cpu_usage)
+        emitter.connect("position-updated", self.__segment_position_updated_cb, index)
+        emitter.connect("done", self.__segment_done_cb, index)
+        emitter.connect("error", self.__segment_error_cb, index)
+        self._transcoders[index] = (transcoder, emitter)
+        self._positions[index] = 0
+        transcoder.run_async()
+
+    def __release_segment_transcoder(self, index):
+        unused_transcoder, emitter = self._transcoders.pop(index)
+        self._positions.pop(index, None)
+        emitter.disconnect_by_func(self.__segment_position_updated_cb)
+        emitter.disconnect_by_func(self.__segment_done_cb)
+        emitter.disconnect_by_func(self.__segment_error_cb)
+
+    def __emit_position(self):
+        position = sum(self.manifest.segment_range(index)[1] for index in self.manifest.done)
+        position += sum(self._positions.values())
+        self.props.position = min(position, self.props.duration)
+        self.emit("position-updated", self.props.position)
+
+    def __segment_position_updated_cb(self, unused_emitter, position, index):
+        self._positions[index] = position
+        self.__emit_position()
+
+    def __segment_done_cb(self, unused_emitter, index):
+        self.__release_segment_transcoder(index)
+        location = self.segment_location(index)
+        try:
+            os.replace(location + PART_SUFFIX, location)
+            self.manifest.done.add(index)
+            self.manifest.save()
+        except OSError as e:
+            self.emit("error", GLib.Error(str(e)), None)
+            return
+
+        self.debug("Segment %d of %s done", index, self.props.src_uri)
+        self.__emit_position()
+        if not self._stopped:
+            self.__start_next_segments()
+
+    def __segment_error_cb(self, unused_emitter, error, details, index):
+        self.__release_segment_transcoder(index)
+        self.stop()
+        self.emit("error", error, details)
+
+    def __join(self):
+        """Joins the segments into the destination file."""
+        self.debug("Joining the %d segments of %s", self.manifest.segments_count,
+                   self.props.src_uri)
+        pipeline = Gst.parse_launch(
+            "splitmuxsrc name=src qtmux name=mux ! filesink name=sink")
+        src = pipeline.get_by_name("src")
+        src.props.location = os.path.join(self.segments_dir, "*.mov")
+        src.connect("pad-added", self.__join_pad_added_cb, pipeline)
+        pipeline.get_by_name("sink").props.location = Gst.uri_get_location(self.props.dest_uri)
+
+        bus = pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message", self.__join_bus_message_cb)
+        self._join_pipeline = pipeline
+        pipeline.set_state(Gst.State.PLAYING)
+
+    def __join_pad_added_cb(self, unused_src, pad, pipeline):
+        queue = Gst.ElementFactory.make("queue", None)
+        pipeline.add(queue)
+        queue.sync_state_with_parent()
+        pad.link(queue.get_static_pad("sink"))
+        queue.link(pipeline.get_by_name("mux"))
+
+    def __join_bus_message_cb(self, bus, message):
+        if message.type == Gst.MessageType.EOS:
+            bus.remove_signal_watch()
+            res, joined_duration = self._join_pipeline.get_by_name("src").query_duration(
+                Gst.Format.TIME)
+            self._join_pipeline.set_state(Gst.State.NULL)
+            self._join_pipeline = None
+            # The segments are transcoded again if anything went wrong.
+            shutil.rmtree(self.segments_dir, ignore_errors=True)
+
+            if not res:
+                joined_duration = Gst.CLOCK_TIME_NONE
+            max_drift = self.manifest.frame_duration or MAX_JOIN_DRIFT
+            if not res or abs(joined_duration - self.props.duration) > max_drift:
+                self.warning("The joined segments of %s last %s instead of %s",
+                             self.props.src_uri, Gst.TIME_ARGS(joined_duration),
+                             Gst.TIME_ARGS(self.props.duration))
+                self.emit("error", GLib.Error("The joined segments have the wrong duration"), None)
+                return
+
+            self.emit("done")
+        elif message.type == Gst.MessageType.ERROR:
+            error, details = message.parse_error()
+            self.stop()
+            self.emit("error", error, details)
@@ -152,3 +152,63 @@ class CPUUsageTracker:
     def reset(self):
         self.last_moment = datetime.datetime.now()
         self.last_usage = resource.getrusage(resource.RUSAGE_SELF)
+
+
+class SystemLoadTracker:
+    """Measures the CPU usage of the other processes since the last reset.
+
+    The busy time of the CPUs is read from /proc/stat and the CPU time of
+    this process is subtracted, so the work done by the app itself, for
+    example by the transcoders, does not count.
+    """
+
+    STAT_PATH = "/proc/stat"
+
+    def __init__(self):
+        self.reset()
+
+    def _busy_time(self):
+        """Gets the time spent by the CPUs doing work, in seconds.
+
+        Returns:
+            Optional[float]: The busy time, or None if it cannot be read.
+        """
+        try:
+            with open(self.STAT_PATH) as stat_file:
+                fields = stat_file.readline().split()
+        except OSError:
+            return None
+
+        if not fields or fields[0] != "cpu":
+            return None
+
+        # user nice system idle iowait irq softirq steal
+        ticks = [int(field) for field in fields[1:9]]
+        busy = sum(ticks) - ticks[3] - ticks[4]
+        return busy / os.sysconf("SC_CLK_TCK")
+
+    def load(self):
+        """Gets the CPU usage of the other processes since the last reset.
+
+        Returns:
+            Optional[float]: The usage per CPU, between 0 and 1, or None if
+                it cannot be measured.
+        """
+        busy_time = self._busy_time()
+        if busy_time is None or self.last_busy_time is None:
+            return None
+
+        delta_time = (datetime.datetime.now() - self.last_moment).total_seconds()
+        if delta_time <= 0:
+            return None
+
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        delta_own = usage.ru_utime + usage.ru_stime - \
+            self.last_usage.ru_utime - self.last_usage.ru_stime
+        delta_others = busy_time - self.last_busy_time - delta_own
+        return max(0.0, delta_others / delta_time / multiprocessing.cpu_count())
+
+    def reset(self):
+        self.last_moment = datetime.datetime.now()
+        self.last_usage = resource.getrusage(resource.RUSAGE_SELF)
+        self.last_busy_time = self._busy_time()
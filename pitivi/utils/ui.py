@@ -516,6 +516,10 @@ def beautify_asset(asset):
         res.append(_("<b>Proxy creation progress:</b> %d%%") %
                    asset.creation_progress)
 
+    queue_position = getattr(asset, "proxy_queue_position", 0)
+    if queue_position:
+        res.append(_("<b>Proxy queue position:</b> %d") % queue_position)
+
     return "\n".join(res)
 
 
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Tests for the pitivi.utils.caches module."""
+# pylint: disable=protected-access
+import os
+import tempfile
+import time
+from unittest import mock
+
+from gi.repository import GdkPixbuf
+
+from pitivi.settings import GlobalSettings
+from pitivi.timeline.previewers import ThumbnailCache
+from pitivi.timeline.previewers import ThumbnailStore
+from pitivi.utils.caches import CacheCollector
+from pitivi.utils.caches import ThumbsCache
+from pitivi.utils.caches import WavesCache
+from tests import common
+
+
+class TestCaches(common.TestCase):
+    """Tests for the Cache classes."""
+
+    def test_waves_lru(self):
+        """Checks the least recently used files are evicted first."""
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            for i, name in enumerate(["old", "protected", "recent", "newest"]):
+                path = os.path.join(tmpdirname, name)
+                with open(path, "wb") as wavefile:
+                    wavefile.write(b"x" * 100)
+                os.utime(path, (i, i))
+
+            cache = WavesCache(tmpdirname)
+            reclaimed = cache.collect(quota=150, protected={"protected"}, since=3)
+            self.assertEqual(reclaimed, 200)
+            self.assertEqual(sorted(os.listdir(tmpdirname)), ["newest", "protected"])
+
+    def test_thumbs_since(self):
+        """Checks the thumbnails used since the session started are kept."""
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_cache_home:
+                xdg_cache_home.return_value = tmpdirname
+                sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+                thumb_cache = ThumbnailCache(sample_uri)
+                pixbuf = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB,
+                                              False, 8, 20, 10)
+                thumb_cache[0] = pixbuf
+                thumb_cache.commit()
+
+                cache = ThumbsCache(ThumbnailStore.get().dbfile)
+                self.assertEqual(cache.collect(quota=0, protected=set(), since=0), 0)
+                cache.close()
+
+                cache = ThumbsCache(ThumbnailStore.get().dbfile)
+                self.assertGreater(cache.collect(quota=0, protected=set(), since=time.time()), 0)
+                cache.close()
+                self.assertEqual(ThumbnailStore.get().positions(thumb_cache.key), set())
+
+    def test_collector_reports(self):
+        """Checks the collector always reports, even when a cache fails."""
+        cache = mock.Mock()
+        cache.name = "broken"
+        cache.collect.side_effect = ValueError("Unexpected")
+        callback = mock.Mock()
+        collector = CacheCollector([(cache, 100, set())], 0, callback)
+        with mock.patch("pitivi.utils.caches.GLib.idle_add") as idle_add:
+            with self.assertRaises(ValueError):
+                collector.process()
+        idle_add.assert_called_once_with(callback, {})
+        cache.close.assert_called_once_with()
+
+    def test_settings(self):
+        """Checks the cache options are saved in the cache section."""
+        settings = GlobalSettings()
+        self.assertFalse(settings.cache_keys_by_content)
+        self.assertEqual(sorted(GlobalSettings.options["cache"]),
+                         ["cache_keys_by_content", "cache_proxies_quota",
+                          "cache_thumbs_quota", "cache_waves_quota"])
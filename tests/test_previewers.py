@@ -16,21 +16,48 @@
 # License along with this program; if not, see <http://www.gnu.org/licenses/>.
 """Tests for the timeline.previewers module."""
 # pylint: disable=protected-access
+import heapq
 import os
+import shutil
+import sqlite3
 import tempfile
 from unittest import mock
 
+import cairo
 import numpy
 from gi.repository import GdkPixbuf
 from gi.repository import GES
+from gi.repository import GLib
 from gi.repository import Gst
 
+from pitivi.timeline.previewers import AssetPreviewer
+from pitivi.timeline.previewers import AudioPreviewer
+from pitivi.timeline.previewers import DecodedThumbnailsCache
 from pitivi.timeline.previewers import delete_all_files_in_dir
+from pitivi.timeline.previewers import get_loudness_location
 from pitivi.timeline.previewers import get_wavefile_location_for_uri
+from pitivi.timeline.previewers import LINEAR_SWEEP_MIN_QUEUED_THUMBS
+from pitivi.timeline.previewers import PEAK_MAX
+from pitivi.timeline.previewers import PEAK_MIN
+from pitivi.timeline.previewers import PEAK_RMS
+from pitivi.timeline.previewers import PEAKS_DECIMATION
+from pitivi.timeline.previewers import PreviewGeneratorManager
 from pitivi.timeline.previewers import Previewer
+from pitivi.timeline.previewers import renderer
+from pitivi.timeline.previewers import SAMPLE_DURATION
+from pitivi.timeline.previewers import SilenceIndex
 from pitivi.timeline.previewers import THUMB_HEIGHT
 from pitivi.timeline.previewers import THUMB_PERIOD
 from pitivi.timeline.previewers import ThumbnailCache
+from pitivi.timeline.previewers import ThumbnailWriter
+from pitivi.timeline.previewers import TILES_MIN_INTERVAL
+from pitivi.timeline.previewers import VideoPreviewer
+from pitivi.timeline.previewers import WAVEFORM_ALL_CHANNELS
+from pitivi.timeline.previewers import WAVEFORM_ENVELOPE_ALPHA
+from pitivi.timeline.previewers import WAVEFORM_MIX
+from pitivi.timeline.previewers import WaveformPeaks
+from pitivi.timeline.previewers import WaveformTilesCache
+from pitivi.utils.misc import CacheKeys
 from tests import common
 from tests.test_medialibrary import BaseTestMediaLibrary
 
@@ -91,10 +118,278 @@ class TestAudioPreviewer(BaseTestMediaLibrary):
 
         self.assertTrue(os.path.exists(wavefile), wavefile)
 
-        with open(wavefile, "rb") as fsamples:
-            samples = list(numpy.load(fsamples))
+        peaks = WaveformPeaks.load(wavefile)
+        samples = peaks.levels[0][:, 0, PEAK_RMS]
 
-        self.assertEqual(samples, SIMPSON_WAVFORM_VALUES)
+        self.assertEqual(samples.dtype, numpy.float32)
+        # The samples are computed in single precision.
+        numpy.testing.assert_allclose(samples, SIMPSON_WAVFORM_VALUES, rtol=1e-5)
+        self.assertAlmostEqual(peaks.max_rms, max(SIMPSON_WAVFORM_VALUES), places=3)
+
+    def test_waveform_24_bits_channels(self):
+        """Checks the waveforms of 24-bit multichannel audio are extracted."""
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            location = os.path.join(tmpdirname, "24bits.wav")
+            pipeline = Gst.parse_launch(
+                "audiotestsrc num-buffers=50 ! audioconvert ! "
+                "audio/x-raw,format=S24LE,channels=4,channel-mask=(bitmask)0x33 ! "
+                "wavenc ! filesink name=sink")
+            pipeline.get_by_name("sink").props.location = location
+            self._run_to_eos(pipeline)
+
+            uri = Gst.filename_to_uri(location)
+            pipeline = Gst.parse_launch("uridecodebin name=decode uri=" + uri +
+                                        " ! waveformbin name=wave ! fakesink qos=false sync=false")
+            wavebin = pipeline.get_by_name("wave")
+            wavebin.props.uri = uri
+            wavebin.props.duration = Gst.SECOND
+            self._run_to_eos(pipeline)
+            wavebin.finalize()
+
+            wavefile = get_wavefile_location_for_uri(uri)
+            try:
+                peaks = WaveformPeaks.load(wavefile)
+                self.assertEqual(peaks.channels, 4)
+                self.assertEqual(peaks.levels[0].shape[1], 5)
+            finally:
+                os.remove(wavefile)
+                os.remove(get_loudness_location(wavefile))
+
+    def _run_to_eos(self, pipeline):
+        pipeline.set_state(Gst.State.PLAYING)
+        message = pipeline.get_bus().timed_pop_filtered(
+            10 * Gst.SECOND, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+        pipeline.set_state(Gst.State.NULL)
+        self.assertIsNotNone(message)
+        self.assertEqual(message.type, Gst.MessageType.EOS, message)
+
+    def test_set_throttled(self):
+        """Checks the offline extraction is paused and resumed."""
+        previewer = mock.Mock(_throttled=False)
+        set_throttled = AudioPreviewer.set_throttled
+
+        set_throttled(previewer, True)
+        self.assertTrue(previewer._throttled)
+        previewer.pipeline.set_state.assert_called_once_with(Gst.State.PAUSED)
+
+        previewer.pipeline.reset_mock()
+        set_throttled(previewer, True)
+        previewer.pipeline.set_state.assert_not_called()
+
+        set_throttled(previewer, False)
+        self.assertFalse(previewer._throttled)
+        previewer.pipeline.set_state.assert_called_once_with(Gst.State.PLAYING)
+
+
+    def test_peak_envelope(self):
+        """Checks the peak envelope is drawn lighter around the RMS waveform."""
+        samples = WaveformPeaks.build(-numpy.ones(8), numpy.ones(8), numpy.full(8, 0.5))[1:9, 0]
+        width, height = 8, 10
+        rms_lane = renderer.fill_surface(numpy.ascontiguousarray(samples[:, PEAK_RMS]),
+                                         width, height, 0, -1, height)
+        lane = AudioPreviewer._add_peak_envelope(rms_lane, samples, width, height, height)
+
+        lane.flush()
+        pixels = numpy.frombuffer(lane.get_data(), dtype=numpy.uint32)
+        pixels = pixels.reshape(height, lane.get_stride() // 4)
+        alpha = pixels[:, 4] >> 24
+        # Above the RMS waveform, only the envelope is drawn.
+        self.assertAlmostEqual(alpha[2], 255 * WAVEFORM_ENVELOPE_ALPHA, delta=2)
+        # The RMS waveform is opaque.
+        self.assertEqual(alpha[8], 255)
+
+
+class TestWaveformPeaks(common.TestCase):
+    """Tests for the `WaveformPeaks` class."""
+
+    def test_levels(self):
+        """Checks the levels are decimated from the finest level."""
+        n_samples = PEAKS_DECIMATION ** 2 + 1
+        rms = numpy.arange(n_samples, dtype=numpy.float32)
+        data = WaveformPeaks.build(-rms, rms, rms)
+        peaks = WaveformPeaks(data)
+
+        self.assertEqual([len(level) for level in peaks.levels],
+                         [n_samples, PEAKS_DECIMATION + 1, 2, 1])
+        self.assertEqual(peaks.max_rms, n_samples - 1)
+        self.assertEqual(peaks.channels, 1)
+        coarsest = peaks.levels[-1][0, 0]
+        self.assertEqual(coarsest[PEAK_MIN], -(n_samples - 1))
+        self.assertEqual(coarsest[PEAK_MAX], n_samples - 1)
+        self.assertAlmostEqual(peaks.levels[1][0, 0, PEAK_RMS],
+                               numpy.sqrt((0 + 1 + 4 + 9) / 4), places=5)
+
+        self.assertEqual(peaks.level_for(0)[0], 0)
+        self.assertEqual(peaks.level_for(SAMPLE_DURATION * PEAKS_DECIMATION)[0], 1)
+        self.assertEqual(peaks.level_for(Gst.CLOCK_TIME_NONE)[0], len(peaks.levels) - 1)
+
+
+    def test_channels(self):
+        """Checks the channels are stored after the mix."""
+        left = numpy.arange(10, dtype=numpy.float32)
+        right = left * 2
+        rms = numpy.column_stack([(left + right) / 2, left, right])
+        peaks = WaveformPeaks(WaveformPeaks.build(-rms, rms, rms))
+
+        self.assertEqual(peaks.channels, 2)
+        self.assertEqual(peaks.max_rms, 18)
+        self.assertEqual(peaks.levels[0].shape, (10, 3, 3))
+        numpy.testing.assert_array_equal(peaks.levels[0][:, 2, PEAK_RMS], right)
+        self.assertEqual(peaks.levels[-1][0, 1, PEAK_MAX], 9)
+
+        self.assertEqual(peaks.columns(WAVEFORM_MIX), [0])
+        self.assertEqual(peaks.columns(WAVEFORM_ALL_CHANNELS), [1, 2])
+        self.assertEqual(peaks.columns(1), [2])
+        # A missing channel falls back to the mix.
+        self.assertEqual(peaks.columns(5), [0])
+
+        mono = WaveformPeaks(WaveformPeaks.build(-left, left, left))
+        self.assertEqual(mono.columns(WAVEFORM_ALL_CHANNELS), [0])
+        self.assertEqual(mono.columns(0), [0])
+
+    def test_shared(self):
+        """Checks the peaks of an asset are loaded once."""
+        rms = numpy.arange(10, dtype=numpy.float32)
+        with tempfile.NamedTemporaryFile(suffix=".npy") as wavefile:
+            numpy.save(wavefile.name, WaveformPeaks.build(-rms, rms, rms))
+
+            peaks = WaveformPeaks.get(wavefile.name)
+            self.assertIs(WaveformPeaks.get(wavefile.name), peaks)
+            self.assertFalse(peaks.levels[0].flags.writeable)
+
+            WaveformPeaks.forget(wavefile.name)
+            self.assertIsNot(WaveformPeaks.get(wavefile.name), peaks)
+            WaveformPeaks.forget(wavefile.name)
+
+
+class TestSilenceIndex(common.TestCase):
+    """Tests for the `SilenceIndex` class."""
+
+    def test_detect(self):
+        """Checks the silences are detected out of the waveform peaks."""
+        # 1 s of sound, 0.2 s of silence, 1 s of sound, 1 s of silence.
+        loud = numpy.full(100, 50, dtype=numpy.float32)
+        quiet = numpy.full(100, 0.1, dtype=numpy.float32)
+        peak = numpy.concatenate([loud, quiet[:20], loud, quiet])
+        peaks = WaveformPeaks(WaveformPeaks.build(-peak, peak, peak))
+
+        index = peaks.silence_index()
+        self.assertIs(peaks.silence_index(), index)
+        # The short silence is ignored.
+        self.assertEqual(index.silences(0, index.duration), [(Gst.SECOND * 22 // 10, index.duration)])
+        self.assertEqual(len(peaks.silence_index(min_duration=Gst.SECOND // 10).starts), 2)
+
+        self.assertFalse(index.is_silent(0))
+        self.assertTrue(index.is_silent(Gst.SECOND * 3))
+        self.assertIsNone(index.next_activity(0))
+
+        index = SilenceIndex.detect(numpy.array([True, True, False, False, True, False]),
+                                    Gst.SECOND, Gst.SECOND)
+        self.assertEqual(index.next_activity(0), 2 * Gst.SECOND)
+        self.assertEqual(index.next_activity(2 * Gst.SECOND), 5 * Gst.SECOND)
+        self.assertIsNone(index.next_activity(5 * Gst.SECOND))
+        self.assertEqual(index.silences(Gst.SECOND, 5 * Gst.SECOND),
+                         [(Gst.SECOND, 2 * Gst.SECOND), (4 * Gst.SECOND, 5 * Gst.SECOND)])
+
+
+class TestPreviewGeneratorManager(common.TestCase):
+    """Tests for the `PreviewGeneratorManager` class."""
+
+    def test_max_workers(self):
+        """Checks the previewers run concurrently up to the limit."""
+        manager = PreviewGeneratorManager()
+        manager.set_max_workers(2)
+        previewers = [mock.Mock(track_type=GES.TrackType.VIDEO, _max_cpu_usage=None)
+                      for unused_i in range(3)]
+        for previewer in previewers:
+            manager.add_previewer(previewer)
+        previewers[0].start_generation.assert_called_once_with()
+        previewers[1].start_generation.assert_called_once_with()
+        previewers[2].start_generation.assert_not_called()
+
+        audio_previewer = mock.Mock(track_type=GES.TrackType.AUDIO, _max_cpu_usage=None)
+        manager.add_previewer(audio_previewer)
+        audio_previewer.start_generation.assert_called_once_with()
+
+        # When a previewer is done, the next one is started.
+        manager._PreviewGeneratorManager__previewer_done_cb(previewers[0])
+        previewers[2].start_generation.assert_called_once_with()
+
+        with manager.paused(interrupt=True):
+            previewers[1].stop_generation.assert_called_once_with()
+            previewers[2].stop_generation.assert_called_once_with()
+            audio_previewer.stop_generation.assert_called_once_with()
+            previewers[0].stop_generation.assert_not_called()
+
+    def test_retry_start(self):
+        """Checks starting more previewers is retried when the CPU usage is high."""
+        manager = PreviewGeneratorManager()
+        manager.set_max_workers(2)
+        previewers = [mock.Mock(track_type=GES.TrackType.VIDEO, _max_cpu_usage=50)
+                      for unused_i in range(3)]
+        with mock.patch("pitivi.timeline.previewers.GLib") as glib, \
+                mock.patch.object(manager, "_cpu_usage_tracker") as tracker:
+            glib.timeout_add.return_value = 1
+            tracker.usage.return_value = 100
+            for previewer in previewers:
+                manager.add_previewer(previewer)
+            previewers[0].start_generation.assert_called_once_with()
+            previewers[1].start_generation.assert_not_called()
+            glib.timeout_add.assert_called_once()
+            retry_cb = glib.timeout_add.call_args[0][1]
+
+            # The CPU usage dropped.
+            tracker.usage.return_value = 10
+            self.assertFalse(retry_cb(GES.TrackType.VIDEO))
+            previewers[1].start_generation.assert_called_once_with()
+            self.assertEqual(manager._retry_sources, {})
+
+            # The retry is canceled when the queue empties.
+            tracker.usage.return_value = 100
+            manager._PreviewGeneratorManager__previewer_done_cb(previewers[0])
+            self.assertEqual(glib.timeout_add.call_count, 2)
+            manager._PreviewGeneratorManager__previewer_done_cb(previewers[1])
+            previewers[2].start_generation.assert_called_once_with()
+            glib.source_remove.assert_called_once_with(1)
+            self.assertEqual(manager._retry_sources, {})
+
+    def test_offline_throttling(self):
+        """Checks the offline extractions are paused when the CPU usage is high."""
+        manager = PreviewGeneratorManager()
+        previewers = [mock.Mock(_max_cpu_usage=50) for unused_i in range(2)]
+        with mock.patch.object(manager, "_offline_cpu_usage_tracker") as tracker:
+            for previewer in previewers:
+                manager.add_offline_previewer(previewer)
+                previewer.set_throttled.assert_called_once_with(False)
+            # A single timer checks the CPU usage for all of them.
+            throttle_source = manager._throttle_source
+            self.assertTrue(throttle_source)
+
+            tracker.usage.return_value = 80
+            self.assertTrue(manager._PreviewGeneratorManager__throttle_cb())
+            for previewer in previewers:
+                previewer.set_throttled.assert_called_with(True)
+
+            tracker.usage.return_value = 20
+            self.assertTrue(manager._PreviewGeneratorManager__throttle_cb())
+            for previewer in previewers:
+                previewer.set_throttled.assert_called_with(False)
+
+            # The running extractions are paused during the playback.
+            manager.set_idle(False)
+            for previewer in previewers:
+                previewer.set_throttled.assert_called_with(True)
+            self.assertTrue(manager._PreviewGeneratorManager__throttle_cb())
+            for previewer in previewers:
+                previewer.set_throttled.assert_called_with(True)
+
+            manager.set_idle(True)
+            for previewer in previewers:
+                previewer.set_throttled.assert_called_with(False)
+
+            for previewer in previewers:
+                manager.remove_offline_previewer(previewer)
+            self.assertFalse(manager._throttle_source)
 
 
 class TestPreviewer(common.TestCase):
@@ -117,6 +412,201 @@ class TestPreviewer(common.TestCase):
         self.assertEqual(run_thumb_interval(2 * THUMB_PERIOD), 2 * THUMB_PERIOD)
 
 
+class TestAssetPreviewer(common.TestCase):
+    """Tests for the `AssetPreviewer` class."""
+
+    def test_should_sweep(self):
+        """Checks when the queued thumbs are created in a single pass."""
+        previewer = mock.Mock()
+        previewer._sweep_range = lambda: AssetPreviewer._sweep_range(previewer)
+        previewer._AssetPreviewer__swept_ranges = []
+        # A short clip trimmed from a long asset.
+        previewer.asset.get_duration.return_value = 3 * 3600 * Gst.SECOND
+        start = 100 * Gst.SECOND
+        positions = [start + i * THUMB_PERIOD for i in range(LINEAR_SWEEP_MIN_QUEUED_THUMBS)]
+        previewer.queue = [(0, position) for position in positions]
+        self.assertEqual(previewer._sweep_range(), (start, positions[-1] + THUMB_PERIOD))
+        self.assertTrue(AssetPreviewer._should_sweep(previewer))
+
+        # Only a few thumbs are needed in the spanned range, seeking is faster.
+        previewer.queue.append((0, 3600 * Gst.SECOND))
+        self.assertFalse(AssetPreviewer._should_sweep(previewer))
+
+        # Only a few thumbs are needed.
+        previewer.queue = previewer.queue[:LINEAR_SWEEP_MIN_QUEUED_THUMBS - 1]
+        self.assertFalse(AssetPreviewer._should_sweep(previewer))
+
+        # The range has been swept already.
+        previewer.queue = [(0, position) for position in positions]
+        previewer._AssetPreviewer__swept_ranges = [(0, 200 * Gst.SECOND)]
+        self.assertFalse(AssetPreviewer._should_sweep(previewer))
+
+    def test_start_sweep(self):
+        """Checks the sweep plays only the range spanned by the queue."""
+        previewer = mock.Mock()
+        previewer._sweep_range = lambda: AssetPreviewer._sweep_range(previewer)
+        previewer._seek_sweep = lambda: AssetPreviewer._seek_sweep(previewer)
+        previewer.uri = "file:///asset.mov"
+        start = 100 * Gst.SECOND
+        positions = [start + i * THUMB_PERIOD for i in range(LINEAR_SWEEP_MIN_QUEUED_THUMBS)]
+        previewer.queue = [(0, position) for position in positions]
+
+        AssetPreviewer._start_sweep(previewer)
+        previewer.pipeline.seek.assert_called_once_with(
+            1.0, Gst.Format.TIME, Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE,
+            Gst.SeekType.SET, start,
+            Gst.SeekType.SET, positions[-1] + THUMB_PERIOD)
+
+    def test_sweep_unaligned(self):
+        """Checks the sweep fills the queued positions of a trimmed clip."""
+        previewer = mock.Mock()
+        previewer._sweep_range = lambda: AssetPreviewer._sweep_range(previewer)
+        previewer._fill_swept_position = \
+            lambda position, pixbuf: AssetPreviewer._fill_swept_position(previewer, position, pixbuf)
+        previewer.uri = "file:///asset.mov"
+        previewer.thumb_cache = {}
+        previewer._AssetPreviewer__swept_ranges = []
+        # The clip has an in_point of 0.3s.
+        in_point = int(0.3 * Gst.SECOND)
+        positions = [in_point + i * THUMB_PERIOD for i in range(LINEAR_SWEEP_MIN_QUEUED_THUMBS)]
+        previewer.queue = [(0, position) for position in positions]
+
+        AssetPreviewer._start_sweep(previewer)
+        # Frames at 25 fps, the last one before the last queued position.
+        frame_duration = Gst.SECOND // 25
+        timestamps = list(range(in_point - 2 * frame_duration,
+                                positions[-1] - frame_duration, frame_duration))
+        for timestamp in timestamps:
+            AssetPreviewer._sweep_frame(previewer, "frame %d" % timestamp, timestamp)
+        AssetPreviewer._sweep_done(previewer)
+
+        self.assertEqual(sorted(previewer.thumb_cache), positions)
+        for position in positions:
+            frame_timestamp = max(timestamp for timestamp in timestamps if timestamp <= position)
+            self.assertEqual(previewer.thumb_cache[position], "frame %d" % frame_timestamp)
+        self.assertEqual(previewer._AssetPreviewer__swept_ranges,
+                         [(positions[0], positions[-1] + THUMB_PERIOD)])
+
+    def test_start_generation_pending(self):
+        """Checks the start is scheduled once when resuming."""
+        previewer = mock.Mock()
+        previewer.uri = "file:///asset.mov"
+        previewer.pipeline = None
+        previewer._AssetPreviewer__start_id = None
+        previewer._AssetPreviewer__sweeping = False
+
+        with mock.patch("pitivi.timeline.previewers.GLib") as glib:
+            glib.idle_add.return_value = 1
+            AssetPreviewer.start_generation(previewer)
+            AssetPreviewer.start_generation(previewer)
+            glib.idle_add.assert_called_once()
+
+            # Pausing cancels the pending start.
+            AssetPreviewer.pause_generation(previewer)
+            glib.source_remove.assert_called_once_with(1)
+            self.assertIsNone(previewer._AssetPreviewer__start_id)
+
+            AssetPreviewer.start_generation(previewer)
+            self.assertEqual(glib.idle_add.call_count, 2)
+
+
+class TestVideoPreviewer(common.TestCase):
+    """Tests for the `VideoPreviewer` class."""
+
+    def test_queue_priorities(self):
+        """Checks the visible thumbs and those around the playhead come first."""
+        previewer = mock.Mock()
+        previewer._interval = THUMB_PERIOD
+        # The clip starts at 100s in the timeline.
+        previewer._timeline_positions = {position: position + 100 * Gst.SECOND
+                                         for position in range(0, 10 * Gst.SECOND, THUMB_PERIOD)}
+        previewer._thumb_priority = lambda position: VideoPreviewer._thumb_priority(previewer, position)
+        previewer._set_queue = lambda positions: AssetPreviewer._set_queue(previewer, positions)
+
+        def pop_all():
+            positions = []
+            while previewer.queue:
+                positions.append(heapq.heappop(previewer.queue)[1])
+            return positions
+
+        manager = Previewer.manager
+        with mock.patch.object(manager, "playhead_position", 102 * Gst.SECOND):
+            with mock.patch.object(manager, "viewport", (104 * Gst.SECOND, 105 * Gst.SECOND)):
+                previewer._set_queue(list(previewer._timeline_positions))
+            self.assertEqual(previewer.queue[0][1], 4 * Gst.SECOND)
+
+            # Scrolling promotes the thumbs which came into view.
+            with mock.patch.object(manager, "viewport", (108 * Gst.SECOND, 109 * Gst.SECOND)):
+                AssetPreviewer.reprioritize(previewer)
+            positions = pop_all()
+
+        self.assertEqual(positions[:2], [8 * Gst.SECOND, int(8.5 * Gst.SECOND)])
+        self.assertEqual(positions[2:5], [2 * Gst.SECOND, int(1.5 * Gst.SECOND), int(2.5 * Gst.SECOND)])
+        self.assertEqual(len(positions), 20)
+
+
+    def _clip(self, start, duration, inpoint):
+        clip = mock.Mock()
+        clip.props.start = start
+        clip.props.duration = duration
+        clip.get_internal_time_from_timeline_time = \
+            lambda unused_elem, timeline_position: timeline_position - start + inpoint
+        return clip
+
+    def test_update_thumbnails_range(self):
+        """Checks only the thumbs around the viewport are queued."""
+        previewer = mock.Mock()
+        previewer.thumb_interval.return_value = Gst.SECOND
+        previewer.thumb_cache = set()
+        previewer.failures = set()
+        previewer.position = -1
+        previewer._drawn_range = None
+        previewer._visible_thumbs_range = \
+            lambda clip, interval: VideoPreviewer._visible_thumbs_range(previewer, clip, interval)
+        previewer._set_queue = lambda positions: AssetPreviewer._set_queue(previewer, positions)
+        previewer._thumb_priority = lambda position: 0
+        previewer.ges_elem.get_parent.return_value = self._clip(100 * Gst.SECOND,
+                                                                100 * Gst.SECOND,
+                                                                10 * Gst.SECOND)
+
+        with mock.patch.object(Previewer.manager, "viewport", (150 * Gst.SECOND, 160 * Gst.SECOND)):
+            VideoPreviewer._update_thumbnails(previewer)
+
+        # The viewport and a viewport width on each side.
+        self.assertEqual(previewer._thumbs_range, (140 * Gst.SECOND, 170 * Gst.SECOND))
+        expected = list(range(50 * Gst.SECOND, 80 * Gst.SECOND, Gst.SECOND))
+        self.assertListEqual(sorted(previewer._timeline_positions), expected)
+        self.assertListEqual(sorted(position for unused_priority, position in previewer.queue),
+                             expected)
+
+    def test_draw(self):
+        """Checks the thumbs are drawn at the intervals from the clip start."""
+        previewer = mock.Mock()
+        previewer.thumb_width = 20
+        previewer.thumb_height = 10
+        previewer.props.height_request = 30
+        previewer._selected = False
+        previewer._interval = Gst.SECOND
+        previewer._thumbs_range = (0, 1000 * Gst.SECOND)
+        # 10 pixels per second.
+        previewer.pixel_to_ns = lambda pixel: pixel * Gst.SECOND // 10
+        previewer.ns_to_pixel = lambda position: position * 10 // Gst.SECOND
+        clip_start = int(100.25 * Gst.SECOND)
+        previewer.ges_elem.get_parent.return_value = self._clip(clip_start,
+                                                                100 * Gst.SECOND,
+                                                                Gst.SECOND // 2)
+        previewer.thumb_cache = set(range(0, 10 * Gst.SECOND, Gst.SECOND // 2))
+
+        with mock.patch("pitivi.timeline.previewers.Gdk") as gdk:
+            gdk.cairo_get_clip_rectangle.return_value = (True, mock.Mock(x=0, width=50))
+            VideoPreviewer.do_draw(previewer, mock.Mock())
+
+        positions = [call[0][0] for call in previewer._get_thumb.call_args_list]
+        self.assertListEqual(positions, [Gst.SECOND // 2 + i * Gst.SECOND for i in range(6)])
+        xs = [call[0][2] for call in gdk.cairo_set_source_pixbuf.call_args_list]
+        self.assertListEqual(xs, [0, 10, 20, 30, 40, 50])
+
+
 class TestThumbnailCache(BaseTestMediaLibrary):
     """Tests for the ThumbnailCache class."""
 
@@ -172,6 +662,152 @@ class TestThumbnailCache(BaseTestMediaLibrary):
                 self.assertTrue(Gst.SECOND in thumb_cache)
                 self.assertIsNotNone(thumb_cache[Gst.SECOND])
 
+    def test_pending_thumbs(self):
+        """Checks the thumbs are available until they are saved in the background."""
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_cache_home:
+                xdg_cache_home.return_value = tmpdirname
+                sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+                thumb_cache = ThumbnailCache(sample_uri)
+                store = thumb_cache._store
+
+                pixbuf = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB,
+                                              False, 8, 20, 10)
+                with mock.patch.object(store._writer, "put"):
+                    thumb_cache[Gst.SECOND] = pixbuf
+                    ThumbnailCache.decoded_thumbs.remove_uri(sample_uri)
+                    self.assertIs(thumb_cache[Gst.SECOND], pixbuf)
+                    self.assertIsNone(store.get_jpeg(thumb_cache.key, Gst.SECOND))
+
+                thumb_cache[Gst.SECOND] = pixbuf
+                thumb_cache.commit()
+                self.assertIsNone(store.get_pending_pixbuf(thumb_cache.key, Gst.SECOND))
+                self.assertIsNotNone(store.get_jpeg(thumb_cache.key, Gst.SECOND))
+
+    def test_writer_errors(self):
+        """Checks a failing thumb does not stop the saving of the others."""
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_cache_home:
+                xdg_cache_home.return_value = tmpdirname
+                sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+                thumb_cache = ThumbnailCache(sample_uri)
+                store = thumb_cache._store
+
+                broken_pixbuf = mock.Mock()
+                broken_pixbuf.save_to_bufferv.side_effect = GLib.Error("Broken")
+                store.add(thumb_cache.key, 0, broken_pixbuf)
+                thumb_cache[Gst.SECOND] = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB,
+                                                                False, 8, 20, 10)
+                self.assertTrue(store._writer.flush())
+                self.assertIsNone(store.get_pending_pixbuf(thumb_cache.key, 0))
+                self.assertIsNone(store.get_jpeg(thumb_cache.key, 0))
+                self.assertIsNotNone(store.get_jpeg(thumb_cache.key, Gst.SECOND))
+
+                # The writer survives unexpected errors.
+                with mock.patch.object(store, "saved", side_effect=ValueError("Unexpected")):
+                    store.add(thumb_cache.key, Gst.SECOND, broken_pixbuf)
+                    self.assertTrue(store._writer.flush())
+                self.assertTrue(store._writer.is_alive())
+
+    def test_writer_flush_timeout(self):
+        """Checks flushing does not wait forever for a stuck writer."""
+        writer = ThumbnailWriter(mock.Mock())
+        with mock.patch("pitivi.timeline.previewers.THUMBS_WRITER_FLUSH_TIMEOUT", 0.01):
+            self.assertFalse(writer.flush())
+
+    def test_keys_by_content(self):
+        """Checks the thumbs are reused for copies of a file when keyed by content."""
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+            copy_path = os.path.join(tmpdirname, "renamed.mp4")
+            shutil.copyfile(Gst.uri_get_location(sample_uri), copy_path)
+            copy_uri = Gst.filename_to_uri(copy_path)
+
+            self.assertNotEqual(ThumbnailCache.cache_key(sample_uri),
+                                ThumbnailCache.cache_key(copy_uri))
+            with mock.patch.object(CacheKeys, "by_content", True):
+                self.assertEqual(ThumbnailCache.cache_key(sample_uri),
+                                 ThumbnailCache.cache_key(copy_uri))
+                self.assertEqual(os.path.basename(get_wavefile_location_for_uri(sample_uri)),
+                                 os.path.basename(get_wavefile_location_for_uri(copy_uri)))
+
+    def test_tiles(self):
+        """Checks the filmstrip tiles are created out of the thumbnails."""
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_cache_home:
+                xdg_cache_home.return_value = tmpdirname
+                sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+                thumb_cache = ThumbnailCache(sample_uri)
+
+                interval = TILES_MIN_INTERVAL
+                duration = 3 * interval
+                self.assertIsNone(thumb_cache.get_tile_thumb(interval, interval, duration))
+
+                pixbuf = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB,
+                                              False, 8, 20, 10)
+                for position in range(0, duration, interval):
+                    thumb_cache[position] = pixbuf
+                thumb = thumb_cache.get_tile_thumb(interval, interval, duration)
+                self.assertEqual((thumb.props.width, thumb.props.height), (20, 10))
+
+                thumb_cache.commit()
+                jpeg = thumb_cache._store.get_tile_jpeg(thumb_cache.key, interval, 0, 0)
+                self.assertIsNotNone(jpeg)
+
+    def test_legacy_db_migration(self):
+        """Checks the thumbs are imported from the per-asset database files."""
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_cache_home:
+                xdg_cache_home.return_value = tmpdirname
+                sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+
+                pixbuf = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB,
+                                              False, 8, 20, 10)
+                unused_success, jpeg = pixbuf.save_to_bufferv("jpeg", [], [])
+                legacy_dbfile = ThumbnailCache.legacy_dbfile_name(sample_uri)
+                os.makedirs(os.path.dirname(legacy_dbfile))
+                legacy_db = sqlite3.connect(legacy_dbfile)
+                legacy_db.execute("CREATE TABLE Thumbs "
+                                  "(Time INTEGER NOT NULL PRIMARY KEY, "
+                                  " Jpeg BLOB NOT NULL)")
+                legacy_db.execute("INSERT INTO Thumbs VALUES (?,?)",
+                                  (Gst.SECOND, sqlite3.Binary(jpeg)))
+                legacy_db.commit()
+                legacy_db.close()
+
+                thumb_cache = ThumbnailCache(sample_uri)
+                self.assertFalse(os.path.exists(legacy_dbfile))
+                self.assertTrue(Gst.SECOND in thumb_cache)
+                self.assertEqual(thumb_cache.image_size, (20, 10))
+
+
+class TestDecodedThumbnailsCache(common.TestCase):
+    """Tests for the DecodedThumbnailsCache class."""
+
+    def test_eviction(self):
+        """Checks the least recently used pixbufs are evicted."""
+        pixbufs = [GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8, 20, 10)
+                   for unused_i in range(3)]
+        pixbuf_size = DecodedThumbnailsCache.item_size(pixbufs[0])
+        cache = DecodedThumbnailsCache(2 * pixbuf_size)
+
+        self.assertIsNone(cache.get("uri", 0))
+        cache.add("uri", 0, pixbufs[0])
+        cache.add("uri", 1, pixbufs[1])
+        self.assertIs(cache.get("uri", 0), pixbufs[0])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        cache.add("uri", 2, pixbufs[2])
+        self.assertEqual(cache.size, 2 * pixbuf_size)
+        self.assertIsNone(cache.get("uri", 1))
+        self.assertIs(cache.get("uri", 0), pixbufs[0])
+        self.assertIs(cache.get("uri", 2), pixbufs[2])
+
+        cache.add("uri2", 0, pixbufs[1])
+        cache.remove_uri("uri")
+        self.assertEqual(cache.size, pixbuf_size)
+        self.assertIs(cache.get("uri2", 0), pixbufs[1])
+
 
 class TestFunctions(BaseTestMediaLibrary):
     """Tests for the standalone functions."""
@@ -187,3 +823,22 @@ class TestFunctions(BaseTestMediaLibrary):
             delete_all_files_in_dir(dir_a)
             self.assertEqual(os.listdir(dir_a), [os.path.basename(dir_a_b)])
             self.assertEqual(os.listdir(dir_a_b), [os.path.basename(file_a_b1.name)])
+
+
+class TestWaveformTilesCache(common.TestCase):
+    """Tests for the WaveformTilesCache class."""
+
+    def test_eviction(self):
+        """Checks the tiles are evicted based on the size of their pixels."""
+        tiles = [cairo.ImageSurface(cairo.FORMAT_ARGB32, 16, 10) for unused_i in range(3)]
+        cache = WaveformTilesCache(max_size=2 * 16 * 4 * 10)
+        for index, tile in enumerate(tiles):
+            cache.add("wavefile", (0, index, 1.0, 10), tile)
+
+        self.assertEqual(cache.size, 2 * 16 * 4 * 10)
+        self.assertIsNone(cache.get("wavefile", (0, 0, 1.0, 10)))
+        self.assertIs(cache.get("wavefile", (0, 2, 1.0, 10)), tiles[2])
+
+        with mock.patch.object(cache, "debug") as debug:
+            cache.log_stats()
+        self.assertEqual(debug.call_args[0][1], "Waveform tiles")
@@ -16,10 +16,16 @@
 # License along with this program; if not, see <http://www.gnu.org/licenses/>.
 """Tests for the utils.proxy module."""
 # pylint: disable=protected-access
+import os
+import tempfile
+import time
 from unittest import mock
 
 from gi.repository import GES
+from gi.repository import Gst
 
+from pitivi.utils.proxy import JobState
+from pitivi.utils.proxy import ProxyJobsJournal
 from tests import common
 
 
@@ -144,3 +150,187 @@ class TestProxyManager(common.TestCase):
                 matches.return_value = True
                 self.assertTrue(manager.asset_can_be_proxied(video, scaled=True))
                 self.assertTrue(manager.asset_can_be_proxied(video))
+
+    def test_job_priorities(self):
+        """Checks the pending jobs are sorted by priority."""
+        app = common.create_pitivi_mock()
+        manager = app.proxy_manager
+
+        assets = [GES.UriClipAsset.request_sync(common.get_sample_uri(name))
+                  for name in ("1sec_simpsons_trailer.mp4",
+                               "30fps_numeroted_frames_blue.webm",
+                               "mp3_sample.mp3",
+                               "tears_of_steel.webm")]
+        transcoders = []
+        for asset in assets:
+            transcoder = mock.Mock()
+            transcoder.props.src_uri = asset.props.id
+            transcoder.asset = asset
+            transcoders.append(transcoder)
+        manager._ProxyManager__pending_transcoders = list(transcoders)
+
+        clips = [assets[3].extract(), assets[2].extract()]
+        clips[0].props.start = 10 * Gst.SECOND
+        clips[1].props.start = 20 * Gst.SECOND
+        app.project_manager.current_project.ges_timeline.iter_clips.return_value = clips
+        manager.set_selected_assets([assets[1]])
+
+        manager.set_playhead_position(0)
+        manager._ProxyManager__reprioritize_idle_cb()
+        self.assertListEqual(manager._ProxyManager__pending_transcoders,
+                             [transcoders[3], transcoders[2], transcoders[1], transcoders[0]])
+        self.assertListEqual([asset.proxy_queue_position for asset in assets], [4, 3, 2, 1])
+
+        # The clip closest to the playhead comes first.
+        manager.set_playhead_position(21 * Gst.SECOND)
+        manager._ProxyManager__reprioritize_idle_cb()
+        self.assertListEqual([asset.proxy_queue_position for asset in assets], [4, 3, 1, 2])
+
+    def test_autoscale(self):
+        """Checks the jobs limit follows the throughput and the load."""
+        app = common.create_pitivi_mock(num_transcoding_jobs=3,
+                                        min_transcoding_jobs=1,
+                                        autoscale_transcoding_jobs=True)
+        manager = app.proxy_manager
+        self.assertEqual(manager.get_max_running_jobs(), 1)
+
+        manager._ProxyManager__running_transcoders = [mock.Mock()]
+        manager._ProxyManager__pending_transcoders = [mock.Mock(), mock.Mock()]
+        manager._autoscale(throughput=2.0, load=0.2)
+        self.assertEqual(manager.get_max_running_jobs(), 2)
+
+        # The additional job increased the throughput enough.
+        manager._ProxyManager__running_transcoders.append(mock.Mock())
+        manager._autoscale(throughput=3.0, load=0.2)
+        self.assertEqual(manager.get_max_running_jobs(), 3)
+
+        # The additional job did not increase the throughput enough.
+        manager._ProxyManager__running_transcoders.append(mock.Mock())
+        manager._autoscale(throughput=3.05, load=0.2)
+        self.assertEqual(manager.get_max_running_jobs(), 2)
+        manager._autoscale(throughput=3.0, load=0.2)
+        self.assertEqual(manager.get_max_running_jobs(), 2)
+
+        # The system is overloaded.
+        manager._autoscale(throughput=3.0, load=0.8)
+        self.assertEqual(manager.get_max_running_jobs(), 1)
+        manager._autoscale(throughput=3.0, load=0.8)
+        self.assertEqual(manager.get_max_running_jobs(), 1)
+
+        # The load cannot be measured.
+        manager._ProxyManager__hold_intervals = 0
+        manager._autoscale(throughput=3.0, load=None)
+        self.assertEqual(manager.get_max_running_jobs(), 2)
+
+        app.settings.autoscale_transcoding_jobs = False
+        self.assertEqual(manager.get_max_running_jobs(), 3)
+
+    def test_jobs_journal(self):
+        """Checks the queued and running jobs are restored from the journal."""
+        app = common.create_pitivi_mock()
+        manager = app.proxy_manager
+
+        asset_uri = common.get_sample_uri("tears_of_steel.webm")
+        failed_asset_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            journal = ProxyJobsJournal(os.path.join(tmpdirname, "proxy-jobs.json"))
+            journal.record(asset_uri + ".1.proxy.mov", asset_uri, False, True, None,
+                           JobState.QUEUED)
+            journal.record(asset_uri + ".1.1280x720.scaledproxy.mov", asset_uri, True, False,
+                           [1280, 720], JobState.QUEUED)
+            journal.set_state(asset_uri + ".1.1280x720.scaledproxy.mov", JobState.RUNNING)
+            journal.record(failed_asset_uri + ".2.proxy.mov", failed_asset_uri, False, False, None,
+                           JobState.QUEUED)
+            journal.set_state(failed_asset_uri + ".2.proxy.mov", JobState.FAILED, "Boom")
+            journal.record("file:///missing.mov.1.proxy.mov", "file:///missing.mov",
+                           False, False, None, JobState.QUEUED)
+            # The changes are saved in a single write.
+            self.assertFalse(os.path.exists(journal.path))
+            journal.flush()
+
+            manager.journal = ProxyJobsJournal(journal.path)
+            manager.journal.load()
+            self.assertEqual(manager.journal.jobs, journal.jobs)
+
+            with mock.patch.object(GES.Asset, "request_async") as request_async:
+                manager.restore_jobs()
+            restored = [call[0][4] for call in request_async.call_args_list]
+            self.assertListEqual(restored, [asset_uri + ".1.proxy.mov",
+                                            asset_uri + ".1.1280x720.scaledproxy.mov"])
+            self.assertEqual(manager.journal.jobs[failed_asset_uri + ".2.proxy.mov"]["error"],
+                             "Boom")
+            self.assertNotIn("file:///missing.mov.1.proxy.mov", manager.journal.jobs)
+
+    def test_jobs_journal_malformed(self):
+        """Checks the malformed jobs in the journal file are ignored."""
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            journal = ProxyJobsJournal(os.path.join(tmpdirname, "proxy-jobs.json"))
+            journal.record("file:///a.mov.1.proxy.mov", "file:///a.mov", False, False, None,
+                           JobState.QUEUED)
+            journal.record("file:///b.mov.1.640x360.scaledproxy.mov", "file:///b.mov", True, False,
+                           [640, 360], JobState.RUNNING)
+            jobs = dict(journal.jobs)
+            journal.jobs["file:///c.mov.1.proxy.mov"] = {"asset": "file:///c.mov"}
+            journal.jobs["file:///d.mov.1.proxy.mov"] = {"state": JobState.QUEUED}
+            journal.jobs["file:///e.mov.1.proxy.mov"] = dict(jobs["file:///a.mov.1.proxy.mov"],
+                                                            **{"max-size": "big"})
+            journal.jobs["file:///f.mov.1.proxy.mov"] = None
+            journal.flush()
+
+            journal = ProxyJobsJournal(journal.path)
+            journal.load()
+            self.assertDictEqual(journal.jobs, jobs)
+
+            with open(journal.path, "w") as journal_file:
+                journal_file.write("[]")
+            journal.load()
+            self.assertDictEqual(journal.jobs, {})
+
+    def test_restored_job_added(self):
+        """Checks the restored jobs are added like the jobs of a project."""
+        app = common.create_pitivi_mock()
+        manager = app.proxy_manager
+        manager.journal = ProxyJobsJournal("/nonexistent/proxy-jobs.json")
+        proxy_uri = "file:///a.mov.1.640x360.scaledproxy.mov"
+        manager.journal.record(proxy_uri, "file:///a.mov", True, False, [640, 360],
+                               JobState.QUEUED, force=True)
+        job = manager.journal.jobs[proxy_uri]
+        asset = mock.Mock()
+        asset.props.id = "file:///a.mov"
+
+        with mock.patch.object(GES.Asset, "request_finish", return_value=asset), \
+                mock.patch.object(manager, "add_job") as add_job:
+            manager._ProxyManager__restored_asset_loaded_cb(None, None, proxy_uri, job)
+        add_job.assert_called_once_with(asset, scaled=True, shadow=False,
+                                        max_size=[640, 360], force=True)
+        self.assertNotIn(proxy_uri, manager.journal.jobs)
+        manager.journal.flush()
+
+    def test_jobs_journal_stale_jobs(self):
+        """Checks the stale and the old failed jobs are forgotten."""
+        journal = ProxyJobsJournal("/nonexistent/proxy-jobs.json")
+        journal.record("file:///a.mov.1.proxy.mov", "file:///a.mov", False, False, None,
+                       JobState.QUEUED)
+        journal.record("file:///a.mov.1.640x360.scaledproxy.mov", "file:///a.mov", True, False,
+                       [640, 360], JobState.QUEUED)
+        # The asset changed, so its proxy URI changed.
+        journal.record("file:///a.mov.2.proxy.mov", "file:///a.mov", False, False, None,
+                       JobState.QUEUED)
+        self.assertListEqual(list(journal.jobs), ["file:///a.mov.1.640x360.scaledproxy.mov",
+                                                  "file:///a.mov.2.proxy.mov"])
+
+        now = time.time()
+        with mock.patch("pitivi.utils.proxy.JOURNAL_MAX_FAILED_JOBS", 2):
+            for i in range(3):
+                asset_uri = "file:///failed%d.mov" % i
+                journal.record(asset_uri + ".1.proxy.mov", asset_uri, False, False, None,
+                               JobState.QUEUED)
+                journal.set_state(asset_uri + ".1.proxy.mov", JobState.FAILED, "Boom")
+                journal.jobs[asset_uri + ".1.proxy.mov"]["time"] = now + i
+        self.assertNotIn("file:///failed0.mov.1.proxy.mov", journal.jobs)
+
+        journal.jobs["file:///failed1.mov.1.proxy.mov"]["time"] = 0
+        journal._forget_failed_jobs()
+        self.assertNotIn("file:///failed1.mov.1.proxy.mov", journal.jobs)
+        self.assertIn("file:///failed2.mov.1.proxy.mov", journal.jobs)
+        journal.flush()
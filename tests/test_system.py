@@ -15,9 +15,14 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with this program; if not, see <http://www.gnu.org/licenses/>.
 """Tests for the utils.system module."""
+import datetime
+import os
+import tempfile
+from unittest import mock
 from unittest import TestCase
 
 from pitivi.utils.system import System
+from pitivi.utils.system import SystemLoadTracker
 
 
 class TestSystem(TestCase):
@@ -31,3 +36,32 @@ class TestSystem(TestCase):
         self.assertNotEqual(system.get_unique_filename("a%/b"),
                             system.get_unique_filename("a%37%3747b"))
         self.assertEqual("a b", system.get_unique_filename("a b"))
+
+
+class TestSystemLoadTracker(TestCase):
+
+    def test_load(self):
+        """Checks the CPU usage of the app is excluded from the load."""
+        clk_tck = os.sysconf("SC_CLK_TCK")
+        with tempfile.NamedTemporaryFile("w") as stat_file:
+            def write_stat(busy_seconds):
+                stat_file.seek(0)
+                stat_file.truncate()
+                stat_file.write("cpu  %d 0 0 100000 500 0 0 0 0 0\n" % (busy_seconds * clk_tck))
+                stat_file.flush()
+
+            with mock.patch.object(SystemLoadTracker, "STAT_PATH", stat_file.name), \
+                    mock.patch("pitivi.utils.system.multiprocessing.cpu_count", return_value=2), \
+                    mock.patch("pitivi.utils.system.resource.getrusage") as getrusage:
+                write_stat(100)
+                getrusage.return_value = mock.Mock(ru_utime=10, ru_stime=0)
+                tracker = SystemLoadTracker()
+
+                # 10 busy seconds in 10 seconds, 4 of them by the app.
+                write_stat(110)
+                getrusage.return_value = mock.Mock(ru_utime=13, ru_stime=1)
+                tracker.last_moment -= datetime.timedelta(seconds=10)
+                self.assertAlmostEqual(tracker.load(), 0.3)
+
+        with mock.patch.object(SystemLoadTracker, "STAT_PATH", "/nonexistent/stat"):
+            self.assertIsNone(SystemLoadTracker().load())
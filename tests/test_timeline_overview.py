@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Tests for the timeline.overview module."""
+# pylint: disable=protected-access
+import os
+import tempfile
+from unittest import mock
+
+import cairo
+import numpy
+from gi.repository import GdkPixbuf
+from gi.repository import Gst
+
+from pitivi.timeline.overview import OVERVIEW_DURATION_HEADROOM
+from pitivi.timeline.previewers import SAMPLE_DURATION
+from pitivi.timeline.previewers import WaveformPeaks
+from tests import common
+
+
+class TestTimelineOverview(common.TestCase):
+    """Tests for the TimelineOverview class."""
+
+    @common.setup_timeline
+    def test_invalidation(self):
+        """Checks only the areas of the changed clips are rendered again."""
+        overview = self.timeline_container.overview
+        overview._dirty_ranges = []
+
+        clip = self.add_clip(self.layer, start=10, duration=20)
+        self.assertIn((10, 30), overview._dirty_ranges)
+
+        overview._dirty_ranges = []
+        clip.props.start = 50
+        self.assertIn((10, 30), overview._dirty_ranges)
+        self.assertIn((50, 70), overview._dirty_ranges)
+
+        overview._dirty_ranges = []
+        self.layer.remove_clip(clip)
+        self.assertEqual(overview._dirty_ranges, [(50, 70)])
+
+    @common.setup_timeline
+    def test_seek(self):
+        """Checks clicking the overview seeks."""
+        overview = self.timeline_container.overview
+        self.add_clip(self.layer, start=0, duration=1000)
+        overview._duration = 1000
+        with mock.patch.object(overview, "get_allocated_width", return_value=100):
+            with mock.patch.object(self.project.pipeline, "simple_seek") as simple_seek:
+                overview.do_button_press_event(mock.Mock(button=1, x=50))
+                simple_seek.assert_called_once_with(500)
+
+    @common.setup_timeline
+    def test_duration_headroom(self):
+        """Checks the clips are rendered again only when the scale changes."""
+        overview = self.timeline_container.overview
+        surface = mock.Mock()
+        overview._surface = surface
+        overview._duration = 100
+
+        # The duration grows within the headroom.
+        clip = self.add_clip(self.layer, start=0, duration=90)
+        self.assertIs(overview._surface, surface)
+
+        clip.props.duration = 120
+        self.assertIsNone(overview._surface)
+
+        with mock.patch.object(overview, "_render"):
+            overview.do_draw(cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 10, 10)))
+        self.assertEqual(overview._duration, int(120 * (1 + OVERVIEW_DURATION_HEADROOM)))
+
+        # The duration shrinks a lot.
+        overview._surface = surface
+        clip.props.duration = 50
+        self.assertIsNone(overview._surface)
+
+    def _clip(self, duration, inpoint=0):
+        ges_clip = mock.Mock()
+        ges_clip.props.start = 0
+        ges_clip.props.duration = duration
+        ges_clip.get_internal_time_from_timeline_time = \
+            lambda unused_source, position: position + inpoint
+        return ges_clip
+
+    @common.setup_timeline
+    def test_render_thumbnails(self):
+        """Checks the closest cached thumbnails are drawn side by side."""
+        overview = self.timeline_container.overview
+        overview._duration = 1000
+        pixbuf = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8, 10, 5)
+        thumb_cache = mock.MagicMock()
+        thumb_cache.image_size = (10, 5)
+        thumb_cache.positions = {0, 250, 500, 750, 1000}
+        thumb_cache.__getitem__.return_value = pixbuf
+        asset = mock.Mock()
+        asset.is_image.return_value = False
+
+        context = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 100, 10))
+        with mock.patch.object(overview, "get_allocated_width", return_value=100), \
+                mock.patch("pitivi.timeline.overview.get_proxy_target", return_value=asset), \
+                mock.patch("pitivi.timeline.overview.ThumbnailCache.get",
+                           return_value=thumb_cache):
+            # The thumbs are 20 pixels wide, so 200 ns apart.
+            overview._render_thumbnails(context, self._clip(1000), mock.Mock(), 0, 10)
+            drawn = [call[0][0] for call in thumb_cache.__getitem__.call_args_list]
+            self.assertListEqual(drawn, [0, 250, 500, 500, 750])
+
+            # The in-point of the clip is taken into account.
+            thumb_cache.__getitem__.reset_mock()
+            overview._render_thumbnails(context, self._clip(400, inpoint=500), mock.Mock(), 0, 10)
+            drawn = [call[0][0] for call in thumb_cache.__getitem__.call_args_list]
+            self.assertListEqual(drawn, [500, 750])
+
+    @common.setup_timeline
+    def test_render_waveform(self):
+        """Checks the cached RMS envelope of the mix is drawn."""
+        overview = self.timeline_container.overview
+        overview._duration = Gst.SECOND
+        # Silence during the first half, then the max RMS.
+        rms = numpy.concatenate([numpy.zeros(50), numpy.ones(50)])
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 100, 10)
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            wavefile = os.path.join(tmpdirname, "asset.wave.npy")
+            with open(wavefile, "wb") as file:
+                numpy.save(file, WaveformPeaks.build(-rms, rms, rms))
+
+            with mock.patch.object(overview, "get_allocated_width", return_value=100), \
+                    mock.patch("pitivi.timeline.overview.get_proxy_target"), \
+                    mock.patch("pitivi.timeline.overview.get_wavefile_location_for_uri",
+                               return_value=wavefile):
+                overview._render_waveform(cairo.Context(surface), self._clip(int(100 * SAMPLE_DURATION)),
+                                          mock.Mock(), 0, 10)
+            WaveformPeaks.forget(wavefile)
+
+        surface.flush()
+        pixels = numpy.frombuffer(surface.get_data(), dtype=numpy.uint32)
+        alpha = pixels.reshape(10, surface.get_stride() // 4)[5] >> 24
+        self.assertEqual(alpha[25], 0)
+        self.assertEqual(alpha[75], 255)
@@ -18,13 +18,16 @@
 # pylint: disable=protected-access
 from unittest import mock
 
+import numpy
 from gi.repository import Gdk
 from gi.repository import GES
 from gi.repository import Gst
 from gi.repository import Gtk
 
+from pitivi.timeline.previewers import SilenceIndex
 from pitivi.undo.timeline import TimelineObserver
 from pitivi.undo.undo import UndoableActionLog
+from pitivi.utils.timeline import SELECT
 from pitivi.utils.timeline import UNSELECT
 from pitivi.utils.ui import LAYER_HEIGHT
 from pitivi.utils.ui import SEPARATOR_HEIGHT
@@ -781,6 +784,33 @@ class TestTimelineContainer(common.TestCase):
         # Check the title clips are ignored.
         timeline_container.update_clips_asset(mock.Mock())
 
+    def test_silences(self):
+        """Checks the silences of the selected clips are selected or deleted."""
+        index = SilenceIndex(numpy.array([2, 6]), numpy.array([3, 8]), 10)
+        with mock.patch("pitivi.timeline.timeline.get_silence_index", return_value=index):
+            timeline_container = common.create_timeline_container()
+            timeline = timeline_container.timeline
+            clip, unused_clip = self.add_clips_simple(timeline, 2)
+            layer = clip.get_layer()
+            self.assertListEqual(timeline_container.clip_silences(clip), [(2, 3), (6, 8)])
+
+            timeline.selection.set_selection([clip], SELECT)
+            timeline_container.select_silences_action.emit("activate", None)
+            self.assertListEqual([(clip.start, clip.duration) for clip in layer.get_clips()],
+                                 [(0, 2), (2, 1), (3, 3), (6, 2), (8, 2), (10, 10)])
+            self.assertListEqual(sorted(clip.start for clip in timeline.selection), [2, 6])
+
+            timeline_container = common.create_timeline_container()
+            timeline = timeline_container.timeline
+            clip, unused_clip = self.add_clips_simple(timeline, 2)
+            layer = clip.get_layer()
+
+            timeline.selection.set_selection([clip], SELECT)
+            timeline_container.delete_silences_and_shift_action.emit("activate", None)
+            self.assertListEqual([(clip.start, clip.duration) for clip in layer.get_clips()],
+                                 [(0, 2), (2, 3), (5, 2), (7, 10)])
+            self.assertListEqual(list(timeline.selection), [])
+
 
 class TestClipsEdges(common.TestCase):
 
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Tests for the pitivi.utils.loudness module."""
+import math
+import os
+import tempfile
+
+from pitivi.utils.loudness import load_loudness
+from pitivi.utils.loudness import LoudnessMeter
+from pitivi.utils.loudness import save_loudness
+from tests import common
+
+
+def stereo_rms(lufs):
+    """Gets the RMS of each channel of a stereo signal of the specified loudness, in dB."""
+    return 10 * math.log10(10 ** ((lufs + 0.691) / 10) / 2)
+
+
+class TestLoudnessMeter(common.TestCase):
+    """Tests for the LoudnessMeter class."""
+
+    def test_steady(self):
+        """Checks the measurements of a steady signal."""
+        meter = LoudnessMeter()
+        rms = stereo_rms(-23)
+        for unused_i in range(100):
+            meter.add_rms([rms, rms])
+        meter.add_peaks([-3.0, -1.0])
+
+        self.assertAlmostEqual(meter.integrated(), -23, places=5)
+        self.assertAlmostEqual(meter.loudness_range(), 0, places=5)
+        self.assertAlmostEqual(meter.true_peak(), -1, places=5)
+
+    def test_gating(self):
+        """Checks the quiet parts are gated out of the integrated loudness."""
+        meter = LoudnessMeter()
+        for lufs in (-20, -40, -80):
+            rms = stereo_rms(lufs)
+            for unused_i in range(100):
+                meter.add_rms([rms, rms])
+
+        self.assertAlmostEqual(meter.integrated(), -20, delta=0.1)
+        self.assertAlmostEqual(meter.loudness_range(), 20, delta=1)
+
+    def test_silence(self):
+        """Checks the silence has no loudness."""
+        meter = LoudnessMeter()
+        for unused_i in range(100):
+            meter.add_rms([-math.inf, -math.inf])
+
+        results = meter.results()
+        self.assertEqual(results, {"integrated": None, "range": None, "true-peak": None})
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            filename = os.path.join(tmpdirname, "loudness.json")
+            self.assertIsNone(load_loudness(filename))
+            save_loudness(filename, results)
+            self.assertEqual(load_loudness(filename), results)
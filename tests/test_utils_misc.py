@@ -14,6 +14,10 @@
 #
 # You should have received a copy of the GNU Lesser General Public
 # License along with this program; if not, see <http://www.gnu.org/licenses/>.
+import os
+import tempfile
+
+from pitivi.utils.misc import fingerprint_file
 from pitivi.utils.misc import round05
 from tests import common
 
@@ -29,3 +33,32 @@ class TestMisc(common.TestCase):
 
         self.assertEqual(round05(2), 2.5)
         self.assertEqual(round05(2.999), 2.5)
+
+    def test_fingerprint_file(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            path1 = os.path.join(tmpdirname, "file1")
+            path2 = os.path.join(tmpdirname, "file2")
+            for path in (path1, path2):
+                with open(path, "wb") as file:
+                    file.write(b"a" * 10 + b"b" * 10 + b"c" * 10)
+            self.assertEqual(fingerprint_file(path1, chunk_size=10),
+                             fingerprint_file(path2, chunk_size=10))
+
+            # The middle of the file is not hashed.
+            with open(path2, "r+b") as file:
+                file.seek(15)
+                file.write(b"x")
+            os.utime(path2, ns=(0, 0))
+            self.assertEqual(fingerprint_file(path1, chunk_size=10),
+                             fingerprint_file(path2, chunk_size=10))
+
+            with open(path2, "r+b") as file:
+                file.seek(25)
+                file.write(b"x")
+            os.utime(path2, ns=(1, 1))
+            self.assertNotEqual(fingerprint_file(path1, chunk_size=10),
+                                fingerprint_file(path2, chunk_size=10))
+
+            # The memoized fingerprint depends on the chunk size.
+            self.assertNotEqual(fingerprint_file(path2, chunk_size=10),
+                                fingerprint_file(path2, chunk_size=20))
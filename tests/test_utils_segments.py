@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Tests for the pitivi.utils.segments module."""
+import os
+import tempfile
+from unittest import mock
+from xml.etree import ElementTree
+
+from gi.repository import GES
+from gi.repository import Gst
+
+from pitivi.utils.segments import SegmentedTranscoder
+from pitivi.utils.segments import SegmentsManifest
+from tests import common
+
+
+class TestSegmentsManifest(common.TestCase):
+    """Tests for the SegmentsManifest class."""
+
+    def test_segments(self):
+        """Checks the segments cover the asset."""
+        manifest = SegmentsManifest("manifest.json", 25 * Gst.SECOND, 10 * Gst.SECOND)
+        self.assertEqual(manifest.segments_count, 3)
+        self.assertEqual(manifest.segment_range(0), (0, 10 * Gst.SECOND))
+        self.assertEqual(manifest.segment_range(2), (20 * Gst.SECOND, 5 * Gst.SECOND))
+
+        manifest = SegmentsManifest("manifest.json", 20 * Gst.SECOND, 10 * Gst.SECOND)
+        self.assertEqual(manifest.segments_count, 2)
+
+    def test_segments_frame_aligned(self):
+        """Checks the segments start at frame timestamps."""
+        manifest = SegmentsManifest("manifest.json", 25 * Gst.SECOND, 10 * Gst.SECOND,
+                                    (30000, 1001))
+        self.assertEqual(manifest.segment_frames, 300)
+        self.assertEqual(manifest.segment_duration, 10010000000)
+        self.assertEqual(manifest.segments_count, 3)
+        self.assertEqual(manifest.segment_range(1), (10010000000, 10010000000))
+        self.assertEqual(manifest.segment_range(2), (20020000000, 4980000000))
+
+        # A variable framerate.
+        manifest = SegmentsManifest("manifest.json", 25 * Gst.SECOND, 10 * Gst.SECOND, (0, 1))
+        self.assertEqual(manifest.segment_frames, 0)
+        self.assertEqual(manifest.segment_range(2), (20 * Gst.SECOND, 5 * Gst.SECOND))
+
+    def test_save_load(self):
+        """Checks the completed segments are restored only by compatible manifests."""
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            path = os.path.join(tmpdirname, "manifest.json")
+            manifest = SegmentsManifest(path, 25 * Gst.SECOND, 10 * Gst.SECOND)
+            self.assertFalse(manifest.load())
+            manifest.done = {0, 2}
+            manifest.save()
+
+            manifest = SegmentsManifest(path, 25 * Gst.SECOND, 10 * Gst.SECOND)
+            self.assertTrue(manifest.load())
+            self.assertEqual(manifest.done, {0, 2})
+
+            manifest = SegmentsManifest(path, 25 * Gst.SECOND, 5 * Gst.SECOND)
+            self.assertFalse(manifest.load())
+            self.assertEqual(manifest.done, set())
+
+            manifest = SegmentsManifest(path, 25 * Gst.SECOND, 10 * Gst.SECOND, (25, 1))
+            self.assertFalse(manifest.load())
+
+
+class TestSegmentedTranscoder(common.TestCase):
+    """Tests for the SegmentedTranscoder class."""
+
+    def test_parallel_segments(self):
+        """Checks the segments are transcoded concurrently and resumed."""
+        asset = mock.Mock()
+        asset.props.id = "file:///asset.mov"
+        asset.get_duration.return_value = 25 * Gst.SECOND
+        factory = mock.Mock()
+        factory.side_effect = lambda *unused_args: (mock.Mock(), mock.Mock())
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            dest_uri = Gst.filename_to_uri(os.path.join(tmpdirname, "asset.proxy.mov.part"))
+            transcoder = SegmentedTranscoder(asset, dest_uri, mock.Mock(),
+                                             10 * Gst.SECOND, factory)
+            transcoder.props.parallelism = 2
+            with mock.patch.object(transcoder, "_SegmentedTranscoder__write_segment_project"):
+                transcoder.run_async()
+                self.assertEqual(sorted(transcoder._transcoders), [0, 1])
+
+                with open(transcoder.segment_location(1) + ".part", "w"):
+                    pass
+                transcoder._SegmentedTranscoder__segment_done_cb(None, 1)
+                self.assertEqual(sorted(transcoder._transcoders), [0, 2])
+                self.assertEqual(transcoder.manifest.done, {1})
+
+                # A new transcoder continues with the missing segments.
+                transcoder.stop()
+                transcoder = SegmentedTranscoder(asset, dest_uri, mock.Mock(),
+                                                 10 * Gst.SECOND, factory)
+                transcoder.props.parallelism = 3
+                with mock.patch.object(transcoder, "_SegmentedTranscoder__write_segment_project"):
+                    transcoder.run_async()
+                self.assertEqual(sorted(transcoder._transcoders), [0, 2])
+
+    def test_segment_project(self):
+        """Checks the project of a segment holds its range of the asset."""
+        asset = GES.UriClipAsset.request_sync(common.get_sample_uri("30fps_numeroted_frames_red.mkv"))
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            dest_uri = Gst.filename_to_uri(os.path.join(tmpdirname, "asset.proxy.mov.part"))
+            transcoder = SegmentedTranscoder(asset, dest_uri, mock.Mock(), Gst.SECOND, mock.Mock())
+            self.assertEqual(transcoder.manifest.framerate, (30, 1))
+            os.makedirs(transcoder.segments_dir)
+
+            project_uri = transcoder._SegmentedTranscoder__write_segment_project(1)
+            root = ElementTree.parse(Gst.uri_get_location(project_uri)).getroot()
+
+        clips = root.findall(".//clip")
+        self.assertEqual(len(clips), 1)
+        self.assertEqual(int(clips[0].get("inpoint")), Gst.SECOND)
+        self.assertEqual(int(clips[0].get("duration")),
+                         min(Gst.SECOND, asset.get_duration() - Gst.SECOND))
+        video_tracks = [track for track in root.findall(".//track")
+                        if int(track.get("track-type")) == GES.TrackType.VIDEO]
+        self.assertEqual(len(video_tracks), 1)
+        self.assertIn("framerate=(fraction)30/1", video_tracks[0].get("properties"))
+
+    def _create_segments(self, transcoder, durations):
+        """Creates segments lasting the specified number of seconds."""
+        os.makedirs(transcoder.segments_dir, exist_ok=True)
+        for index, seconds in enumerate(durations):
+            pipeline = Gst.parse_launch(
+                "videotestsrc num-buffers=%d ! video/x-raw,framerate=25/1 ! "
+                "jpegenc ! qtmux ! filesink location=%s" % (
+                    seconds * 25, transcoder.segment_location(index)))
+            pipeline.set_state(Gst.State.PLAYING)
+            message = pipeline.get_bus().timed_pop_filtered(
+                Gst.CLOCK_TIME_NONE, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+            pipeline.set_state(Gst.State.NULL)
+            self.assertEqual(message.type, Gst.MessageType.EOS)
+        transcoder.manifest.done = set(range(len(durations)))
+        transcoder.manifest.save()
+
+    def _join(self, asset_duration, segments_durations):
+        """Joins the segments and returns the emitted signal."""
+        asset = mock.Mock()
+        asset.props.id = "file:///asset.mov"
+        asset.get_duration.return_value = asset_duration
+        asset.get_info.return_value = None
+        mainloop = common.create_main_loop()
+        signals = []
+
+        def signal_cb(unused_transcoder, *args):
+            signals.append(args)
+            mainloop.quit()
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            dest_path = os.path.join(tmpdirname, "asset.proxy.mov.part")
+            transcoder = SegmentedTranscoder(asset, Gst.filename_to_uri(dest_path),
+                                             mock.Mock(), Gst.SECOND, mock.Mock())
+            self._create_segments(transcoder, segments_durations)
+            transcoder.connect("done", signal_cb)
+            transcoder.connect("error", signal_cb)
+
+            transcoder.run_async()
+            mainloop.run()
+
+            self.assertTrue(os.path.exists(dest_path))
+            self.assertFalse(os.path.exists(transcoder.segments_dir))
+        self.assertEqual(len(signals), 1)
+        return signals[0]
+
+    def test_join(self):
+        """Checks the segments are joined."""
+        self.assertEqual(self._join(2 * Gst.SECOND, [1, 1]), ())
+
+    def test_join_wrong_duration(self):
+        """Checks the join fails when the segments don't cover the asset."""
+        error, unused_details = self._join(3 * Gst.SECOND, [1, 1, 0.2])
+        self.assertIsNotNone(error)